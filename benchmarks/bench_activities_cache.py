@@ -0,0 +1,95 @@
+"""
+GET /activities throughput with and without the snapshot cache
+
+Loads 500 activities x 1000 participants into the store and compares:
+
+- uncached: returning the dict and letting FastAPI encode it every time
+- cached:   the pre-serialized snapshot served by src.app
+- 304:      revalidation with a matching If-None-Match
+
+Usage: python -m benchmarks.bench_activities_cache [--activities 500] [--participants 1000]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from src.app import app, store
+
+
+def make_dataset(activity_count, participant_count):
+    return {
+        f"Activity {a}": {
+            "description": f"Benchmark activity number {a}",
+            "schedule": "Mondays and Wednesdays, 3:30 PM - 5:00 PM",
+            "max_participants": participant_count * 2,
+            "participants": [f"student{a}-{p}@mergington.edu" for p in range(participant_count)],
+        }
+        for a in range(activity_count)
+    }
+
+
+def make_uncached_app():
+    uncached = FastAPI()
+
+    @uncached.get("/activities")
+    def get_activities():
+        return store.get_all()
+
+    return uncached
+
+
+async def measure(target_app, requests, headers=None):
+    transport = httpx.ASGITransport(app=target_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.get("/activities", headers=headers)  # warm up
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(requests):
+            begin = time.perf_counter()
+            response = await client.get("/activities", headers=headers)
+            latencies.append(time.perf_counter() - begin)
+            assert response.status_code in (200, 304)
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "req/s": requests / elapsed,
+        "p50 ms": statistics.median(latencies) * 1000,
+        "p99 ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+async def measure_etag():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        return (await client.get("/activities")).headers["etag"]
+
+
+async def run(args):
+    store.load(make_dataset(args.activities, args.participants))
+    etag = await measure_etag()
+    scenarios = [
+        ("uncached", make_uncached_app(), args.requests // 10 or 1, None),
+        ("cached", app, args.requests, None),
+        ("304", app, args.requests, {"If-None-Match": etag}),
+    ]
+    print(f"{'scenario':>10} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for name, target_app, requests, headers in scenarios:
+        result = await measure(target_app, requests, headers)
+        print(f"{name:>10} {result['req/s']:>10.1f} {result['p50 ms']:>10.2f} "
+              f"{result['p99 ms']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--activities", type=int, default=500)
+    parser.add_argument("--participants", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
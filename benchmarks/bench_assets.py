@@ -0,0 +1,123 @@
+"""
+Bytes transferred and time to first render of the web page
+
+Loads the page like a browser would, against the previous setup (a redirect
+from / plus plain StaticFiles) and against the asset pipeline: the HTML,
+then the stylesheet and script it references in parallel. A repeat visit
+revalidates what the cache headers say must be revalidated. Time to first
+render is modelled from the round trips and bytes on the critical path for
+a few network profiles, and also measured in-process.
+
+Usage: python -m benchmarks.bench_assets [--repeat 200]
+"""
+import argparse
+import asyncio
+import os
+import re
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import RedirectResponse
+from fastapi.staticfiles import StaticFiles
+
+from src.app import app as pipeline_app
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "..", "src", "static")
+BROWSER_HEADERS = {"Accept-Encoding": "gzip, deflate, br"}
+# name: (round trip seconds, bytes per second)
+NETWORKS = {"slow 3G": (0.4, 50_000), "fast 3G": (0.15, 200_000), "4G": (0.07, 1_125_000)}
+
+
+def build_previous_app():
+    previous = FastAPI()
+    previous.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+
+    @previous.get("/")
+    async def root():
+        return RedirectResponse(url="/static/index.html")
+
+    return previous
+
+
+async def load_page(client, cache):
+    """Fetch the page like a browser; return the critical path as [[bytes, ...], ...]
+
+    Each stage is one round trip, with the responses fetched in parallel.
+    ``cache`` maps URLs to the validators and freshness of earlier responses.
+    """
+    stages = []
+
+    async def fetch(url):
+        cached = cache.get(url)
+        if cached is not None and cached["immutable"]:
+            return None, cached["body"]
+        headers = dict(BROWSER_HEADERS)
+        if cached is not None and cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        response = await client.get(url, headers=headers)
+        if response.status_code == 304:
+            body = cached["body"]
+        else:
+            body = response.content
+            cache[url] = {"etag": response.headers.get("etag"), "body": body,
+                          "immutable": "immutable" in response.headers.get("cache-control", "")}
+        return response, body
+
+    url = "/"
+    while True:
+        response, body = await fetch(url)
+        stages.append([response.num_bytes_downloaded])
+        if response.status_code in (301, 302, 303, 307, 308):
+            url = response.headers["location"]
+            continue
+        break
+
+    html = body.decode("utf-8")
+    base = url.rsplit("/", 1)[0] + "/"
+    assets = [ref if ref.startswith("/") else base + ref
+              for ref in re.findall(r'(?:src|href)="([^"]+)"', html)]
+    results = await asyncio.gather(*(fetch(asset) for asset in assets))
+    sizes = [response.num_bytes_downloaded for response, _ in results if response is not None]
+    if sizes:
+        stages.append(sizes)
+    return stages
+
+
+def modelled_time(stages, round_trip, bandwidth):
+    return sum(round_trip + sum(sizes) / bandwidth for sizes in stages)
+
+
+async def measure(app, repeat):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        cache = {}
+        first = await load_page(client, cache)
+        again = await load_page(client, cache)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            await load_page(client, {})
+        cold = (time.perf_counter() - started) / repeat
+    return first, again, cold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'setup':>10} {'visit':>7} {'requests':>9} {'bytes':>7} {'trips':>6} "
+          + " ".join(f"{name + ' ms':>11}" for name in NETWORKS))
+    for label, app in (("before", build_previous_app()), ("pipeline", pipeline_app)):
+        first, again, cold = asyncio.run(measure(app, args.repeat))
+        for visit, stages in (("first", first), ("repeat", again)):
+            requests = sum(len(sizes) for sizes in stages)
+            transferred = sum(sum(sizes) for sizes in stages)
+            modelled = " ".join(f"{modelled_time(stages, *network) * 1000:>11.0f}"
+                                for network in NETWORKS.values())
+            print(f"{label:>10} {visit:>7} {requests:>9} {transferred:>7} {len(stages):>6} {modelled}")
+        print(f"{label:>10} in-process page load: {cold * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Sync versus async endpoints under many concurrent clients
+
+Runs the same workload against two uvicorn servers: ``sync_app`` below,
+whose plain ``def`` endpoints are dispatched to the threadpool, and the
+real ``src.app`` whose ``async def`` endpoints keep in-memory operations on
+the event loop. --clients concurrent clients alternate signups and
+GET /activities?prefix=...&fields=counts listings.
+
+Usage: python -m benchmarks.bench_async [--clients 1000] [--requests 20000]
+"""
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI, HTTPException
+
+from src.app import activity_index, store
+from src.listing import list_activities
+from src.store import ActivityStoreError
+
+sync_app = FastAPI()
+
+
+@sync_app.get("/activities")
+def sync_get_activities(prefix: str, fields: str):
+    return list_activities(store, activity_index, prefix=prefix, fields=fields)
+
+
+@sync_app.post("/activities/{activity_name}/signup")
+def sync_signup(activity_name: str, email: str):
+    try:
+        total = store.signup(activity_name, email)
+    except ActivityStoreError as error:
+        raise HTTPException(status_code=error.status_code, detail=error.detail)
+    return {"activity": activity_name, "email": email, "total_participants": total}
+
+
+async def wait_until_up(url):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(f"{url}/activities?prefix=Chess&fields=counts")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+
+
+async def load(url, clients, requests):
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    latencies = []
+    counter = iter(range(requests))
+
+    async def client_loop(client):
+        for i in counter:
+            begin = time.perf_counter()
+            if i % 2:
+                await client.post(f"{url}/activities/Gym%20Class/signup",
+                                  params={"email": f"load{i}@mergington.edu"})
+            else:
+                await client.get(f"{url}/activities", params={"prefix": "Chess", "fields": "counts"})
+            latencies.append(time.perf_counter() - begin)
+
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return (requests / elapsed, statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+    url = f"http://127.0.0.1:{args.port}"
+
+    print(f"{'server':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for name, target in (("sync", "benchmarks.bench_async:sync_app"), ("async", "src.app:app")):
+        # Gym Class gets a huge capacity so signups keep succeeding
+        server = subprocess.Popen(
+            [sys.executable, "-c",
+             "import sys, uvicorn; from src.app import store; "
+             "store.activities['Gym Class'].max_participants = 10 ** 9; "
+             f"uvicorn.run(sys.argv[1], port={args.port}, log_level='warning', backlog=4096, timeout_keep_alive=120)",
+             target])
+        try:
+            asyncio.run(wait_until_up(url))
+            throughput, p50, p99 = asyncio.run(load(url, args.clients, args.requests))
+            print(f"{name:>8} {throughput:>10.0f} {p50:>10.2f} {p99:>10.2f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Batch signup versus one request per student
+
+Signs up --count students to a single activity, first with one
+POST /activities/{name}/signup per student, then with one
+POST /activities/{name}/signups:batch request.
+
+Usage: python -m benchmarks.bench_batch [--count 10000]
+"""
+import argparse
+import time
+
+from fastapi.testclient import TestClient
+
+from src.app import app, store
+
+
+def reset(count):
+    store.load({
+        "Enrollment Day": {
+            "description": "Benchmark activity",
+            "schedule": "Mondays, 3:00 PM - 4:00 PM",
+            "max_participants": count,
+            "participants": [],
+        }
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=10000)
+    args = parser.parse_args()
+    emails = [f"student{i}@mergington.edu" for i in range(args.count)]
+    client = TestClient(app)
+
+    reset(args.count)
+    started = time.perf_counter()
+    for email in emails:
+        client.post(f"/activities/Enrollment%20Day/signup?email={email}")
+    loop = time.perf_counter() - started
+
+    reset(args.count)
+    started = time.perf_counter()
+    response = client.post("/activities/Enrollment%20Day/signups:batch", json={"emails": emails})
+    batch = time.perf_counter() - started
+    assert response.json()["applied"] == args.count
+
+    print(f"{'method':>10} {'seconds':>10} {'signups/s':>12}")
+    print(f"{'loop':>10} {loop:>10.3f} {args.count / loop:>12.0f}")
+    print(f"{'batch':>10} {batch:>10.3f} {args.count / batch:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
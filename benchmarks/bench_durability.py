@@ -0,0 +1,96 @@
+"""
+Write-ahead log throughput and recovery time
+
+1. Durable signups per second with fsync per record versus group commit,
+   with --threads threads each waiting for its own signup to be on disk.
+2. Time to recover a store from a snapshot plus a log of --entries records.
+
+Usage: python -m benchmarks.bench_durability [--threads 16] [--signups 2000] [--entries 10000000]
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+from src.durability import MutationLog
+from src.store import InMemoryActivityStore
+
+ACTIVITY_COUNT = 100
+
+
+def make_activities(capacity):
+    return {
+        f"Activity {a}": {
+            "description": "Benchmark activity",
+            "schedule": "Mondays, 3:00 PM - 4:00 PM",
+            "max_participants": capacity,
+            "participants": [],
+        }
+        for a in range(ACTIVITY_COUNT)
+    }
+
+
+def write_throughput(group_commit, threads, signups):
+    with tempfile.TemporaryDirectory() as directory:
+        store = InMemoryActivityStore(make_activities(threads * signups))
+        log = MutationLog(directory, group_commit=group_commit, snapshot_every=10 ** 9)
+        log.start(store)
+
+        def worker(worker_id):
+            for i in range(signups):
+                store.signup(f"Activity {i % ACTIVITY_COUNT}", f"w{worker_id}-{i}@mergington.edu")
+                log.wait_durable(store.version())
+
+        workers = [threading.Thread(target=worker, args=(w,)) for w in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        log.close()
+    return threads * signups / elapsed
+
+
+def recovery_time(entries):
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "snapshot.json"), "w") as snapshot:
+            json.dump({"version": 0, "activities": make_activities(entries)}, snapshot)
+        with open(os.path.join(directory, "log-1.ndjson"), "w") as segment:
+            for version in range(1, entries + 1):
+                # Every fourth record removes the signup made just before it
+                if version % 4 == 0:
+                    record = [version, "r", f"Activity {(version - 1) % ACTIVITY_COUNT}",
+                              f"s{version - 1}@mergington.edu"]
+                else:
+                    record = [version, "s", f"Activity {version % ACTIVITY_COUNT}",
+                              f"s{version}@mergington.edu"]
+                segment.write(json.dumps(record) + "\n")
+        store = InMemoryActivityStore()
+        started = time.perf_counter()
+        replayed = MutationLog(directory).recover(store)
+        elapsed = time.perf_counter() - started
+    return replayed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--signups", type=int, default=2000, help="signups per thread")
+    parser.add_argument("--entries", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    print(f"{'mode':>14} {'durable signups/s':>18}")
+    for name, group_commit in (("fsync per op", False), ("group commit", True)):
+        rate = write_throughput(group_commit, args.threads, args.signups)
+        print(f"{name:>14} {rate:>18.0f}")
+
+    replayed, elapsed = recovery_time(args.entries)
+    print(f"recovery: {replayed} log entries in {elapsed:.2f}s "
+          f"({replayed / elapsed:.0f} entries/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Cost of the audit log: recording events and reading past rosters
+
+Signs students up for and out of one activity 100k times (by default) with
+an AuditLog listening, then times rebuilding the roster as of random
+versions: with checkpoints (every CHECKPOINT_EVERY events, built by a first
+pass over the history), and replaying from the seed as without them.
+Also reports the memory of the event columns.
+
+Usage: python -m benchmarks.bench_history [--events 100000] [--number 200]
+"""
+import argparse
+import random
+import time
+
+from benchmarks.suite import percentile
+from src.history import CHECKPOINT_EVERY, AuditLog
+from src.store import InMemoryActivityStore
+
+NAME = "Chess Club"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    seed = {NAME: {"description": "", "schedule": "Fridays, 3:30 PM - 5:00 PM",
+                   "max_participants": 100, "participants": []}}
+    store = InMemoryActivityStore(seed)
+    log = AuditLog(store)
+    # The same events, never checkpointed
+    unchecked = AuditLog(store, checkpoint_every=args.events + 1)
+    rng = random.Random(1)
+    signed_up = []
+    started = time.perf_counter()
+    for number in range(args.events):
+        if len(signed_up) < 50 or (len(signed_up) < 100 and rng.random() < 0.5):
+            email = f"student{number}@mergington.edu"
+            store.signup(NAME, email)
+            signed_up.append(email)
+        else:
+            store.remove(NAME, signed_up.pop(rng.randrange(len(signed_up))))
+    recording = time.perf_counter() - started
+    columns = sum(column.itemsize * len(column) for column in (
+        log.versions, log.times, log.kinds, log.activities, log.emails, log.clients))
+    rows = sum(len(rows) * rows.itemsize for rows in log._rows.values())
+    print(f"{args.events} events recorded by two logs in {recording:.2f} s "
+          f"({(columns + rows) / args.events:.0f} bytes an event, without the emails)")
+
+    first, last = log.epochs[0].version + 1, store.version()
+    versions = [rng.randint(first, last) for _ in range(args.number)]
+    started = time.perf_counter()
+    for version in range(first + CHECKPOINT_EVERY - 1, last + 1, CHECKPOINT_EVERY):
+        log.roster(NAME, version)
+    print(f"checkpoints built in {time.perf_counter() - started:.2f} s")
+
+    print(f"{'roster as_of':>20} {'mean ms':>9} {'p99 ms':>9}")
+    for label, audit in (("checkpoints", log), ("full replay", unchecked)):
+        latencies = []
+        for version in versions[:args.number if audit is log else 20]:
+            started = time.perf_counter()
+            audit.roster(NAME, version)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        print(f"{label:>20} {sum(latencies) / len(latencies) * 1e3:>9.3f} "
+              f"{percentile(latencies, 0.99) * 1e3:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
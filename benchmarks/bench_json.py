@@ -0,0 +1,64 @@
+"""
+Encode time and payload size of GET /activities
+
+Builds a dataset of 1k activities with 1k participants each (by default)
+and times the JSON encoders (standard library and orjson, when installed)
+and each compression encoding and level, reporting the payload sizes.
+
+Usage: python -m benchmarks.bench_json [--activities 1000] [--participants 1000]
+"""
+import argparse
+import gzip
+import json
+import time
+
+from benchmarks.suite import make_dataset
+from src.responses import compress, orjson, zstandard
+
+LEVELS = {"gzip": (1, 4, 6, 9), "zstd": (1, 3, 6, 10, 19)}
+
+
+def best_time(func, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--activities", type=int, default=1000)
+    parser.add_argument("--participants", type=int, default=1000)
+    args = parser.parse_args()
+
+    data = make_dataset(args.activities, args.participants)
+    print(f"{args.activities} activities x {args.participants} participants")
+    print(f"{'step':>16} {'ms':>9} {'bytes':>12} {'ratio':>7}")
+
+    seconds, body = best_time(lambda: json.dumps(
+        data, ensure_ascii=False, allow_nan=False, indent=None,
+        separators=(",", ":")).encode("utf-8"))
+    print(f"{'json (stdlib)':>16} {seconds * 1000:>9.1f} {len(body):>12}")
+    if orjson is not None:
+        seconds, fast_body = best_time(lambda: orjson.dumps(data))
+        assert fast_body == body
+        print(f"{'orjson':>16} {seconds * 1000:>9.1f} {len(fast_body):>12}")
+    else:
+        print("orjson is not installed")
+
+    encodings = ["gzip"] + (["zstd"] if zstandard is not None else [])
+    for encoding in encodings:
+        for level in LEVELS[encoding]:
+            seconds, compressed = best_time(lambda: compress(body, encoding, level))
+            print(f"{encoding + ' ' + str(level):>16} {seconds * 1000:>9.1f} "
+                  f"{len(compressed):>12} {len(body) / len(compressed):>7.1f}")
+    if zstandard is None:
+        print("zstandard is not installed")
+    seconds, _ = best_time(lambda: gzip.decompress(compress(body, "gzip", 6)))
+    print(f"{'gzip 6 round trip':>16} {seconds * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
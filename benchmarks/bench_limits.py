@@ -0,0 +1,119 @@
+"""
+Latency of well-behaved clients while the API is overloaded
+
+Starts a uvicorn server and has well-behaved clients fetch a page of
+activities every 10 ms while abusive clients poll as fast as they can,
+either from one address (which the per-client rate limit stops) or from many
+addresses at once (which admission control sheds). Clients connect from
+distinct loopback addresses (127.0.x.y). Reports p50/p99 latency and the
+share of rejected requests for the well-behaved clients, and what the
+abusers got.
+
+Usage: python -m benchmarks.bench_limits [--seconds 5] [--abusers 64] [--port 8766]
+"""
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.suite import percentile
+
+GOOD_CLIENTS = 8
+GOOD_PAUSE = 0.1
+PATH = "/activities?limit=50"
+SETUPS = (
+    ("no abuse", {}, None),
+    ("one address, unprotected", {}, "one"),
+    ("one address, rate limit", {"ACTIVITY_RATE_LIMIT_READ": "50:100"}, "one"),
+    ("many addresses, unprotected", {}, "many"),
+    ("many addresses, admission", {"ACTIVITY_MAX_LOOP_LAG": "0.02"}, "many"),
+)
+
+
+async def client_loop(port, address, connections, deadline, pause, latencies, outcomes):
+    """Send requests over ``connections`` keep-alive connections from ``address``
+
+    A minimal HTTP/1.1 client keeps the load generator cheap next to the
+    server, which shares the machine.
+    """
+    request = (f"GET {PATH} HTTP/1.1\r\nHost: bench\r\n\r\n").encode("ascii")
+
+    async def loop():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port,
+                                                       local_addr=(address, 0))
+        try:
+            while time.perf_counter() < deadline:
+                begin = time.perf_counter()
+                writer.write(request)
+                head = await reader.readuntil(b"\r\n\r\n")
+                status = int(head.split(b" ", 2)[1])
+                length = int(re.search(rb"content-length: *(\d+)", head, re.I).group(1))
+                await reader.readexactly(length)
+                if status == 200:
+                    latencies.append(time.perf_counter() - begin)
+                outcomes[status] = outcomes.get(status, 0) + 1
+                await asyncio.sleep(pause)
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(loop() for _ in range(connections)))
+
+
+async def measure(port, abusers, count, seconds):
+    deadline = time.perf_counter() + seconds
+    good_latencies, good_outcomes, abuser_outcomes = [], {}, {}
+    tasks = [client_loop(port, f"127.0.1.{number + 1}", 1, deadline, GOOD_PAUSE,
+                         good_latencies, good_outcomes) for number in range(GOOD_CLIENTS)]
+    if abusers == "one":
+        tasks.append(client_loop(port, "127.0.2.1", count, deadline, 0, [], abuser_outcomes))
+    elif abusers == "many":
+        tasks += [client_loop(port, f"127.0.3.{number + 1}", 1, deadline, 0, [], abuser_outcomes)
+                  for number in range(count)]
+    await asyncio.gather(*tasks)
+    good_latencies.sort()
+    return good_latencies, good_outcomes, abuser_outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--abusers", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+    url = f"http://127.0.0.1:{args.port}"
+
+    print(f"{'setup':>28} {'good p50 ms':>12} {'good p99 ms':>12} {'good rejected':>14} "
+          f"{'abuse served/s':>15} {'abuse rejected/s':>17}")
+    for label, environment, abusers in SETUPS:
+        server = subprocess.Popen([
+            sys.executable, "-c",
+            "import sys; from benchmarks.suite import seed_and_serve; "
+            "seed_and_serve(*map(int, sys.argv[1:]))",
+            str(args.port), "200", "20"], env=dict(os.environ, **environment))
+        try:
+            for _ in range(600):
+                try:
+                    urllib.request.urlopen(f"{url}/activities?limit=1")
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            latencies, outcomes, abuse = asyncio.run(
+                measure(args.port, abusers, args.abusers, args.seconds))
+        finally:
+            server.terminate()
+            server.wait()
+        total = sum(outcomes.values())
+        rejected = total - outcomes.get(200, 0)
+        served = abuse.get(200, 0) / args.seconds
+        turned_away = (sum(abuse.values()) - abuse.get(200, 0)) / args.seconds
+        print(f"{label:>28} {percentile(latencies, 0.5) * 1000:>12.2f} "
+              f"{percentile(latencies, 0.99) * 1000:>12.2f} {rejected / total:>14.1%} "
+              f"{served:>15.0f} {turned_away:>17.0f}")
+
+
+if __name__ == "__main__":
+    main()
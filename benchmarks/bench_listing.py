@@ -0,0 +1,57 @@
+"""
+Latency of paginated and filtered GET /activities at growing catalog sizes
+
+Each query asks for one page of 50 activities; latency should depend on
+the page size, not on the number of activities in the catalog.
+
+Usage: python -m benchmarks.bench_listing [--sizes 1000 10000 100000]
+"""
+import argparse
+import time
+
+from fastapi.testclient import TestClient
+
+from src.app import app, store
+
+DAYS = ("Mondays", "Tuesdays", "Wednesdays", "Thursdays", "Fridays")
+
+QUERIES = (
+    "/activities?limit=50&fields=counts",
+    "/activities?limit=50&prefix=Activity%2005",
+    "/activities?limit=50&day=friday&has_free_seats=true&fields=schedule,counts",
+)
+
+
+def make_dataset(size):
+    return {
+        f"Activity {a:06d}": {
+            "description": "Benchmark activity",
+            "schedule": f"{DAYS[a % len(DAYS)]}, 3:30 PM - 5:00 PM",
+            "max_participants": 20,
+            "participants": [f"student{a}-{p}@mergington.edu" for p in range(a % 21)],
+        }
+        for a in range(size)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    client = TestClient(app)
+    print(f"{'activities':>10} {'bytes':>8} {'ms/req':>8}  query")
+    for size in args.sizes:
+        store.load(make_dataset(size))
+        for query in QUERIES:
+            response = client.get(query)  # also warms up the indexes
+            started = time.perf_counter()
+            for _ in range(args.requests):
+                client.get(query)
+            elapsed = (time.perf_counter() - started) / args.requests * 1000
+            print(f"{size:>10} {len(response.content):>8} {elapsed:>8.3f}  {query}")
+
+
+if __name__ == "__main__":
+    main()
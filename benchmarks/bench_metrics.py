@@ -0,0 +1,70 @@
+"""
+Per-request overhead of the metrics middleware
+
+Drives a minimal ASGI app directly, without a server, with and without
+MetricsMiddleware around it, and reports the extra time per request. Also
+times a scrape once many series have been recorded.
+
+Usage: python -m benchmarks.bench_metrics [--requests 200000] [--routes 20]
+"""
+import argparse
+import asyncio
+import time
+
+from src.metrics import Metrics, MetricsMiddleware
+from src.store import InMemoryActivityStore
+
+
+class Route:
+    def __init__(self, path):
+        self.path = path
+
+
+async def endpoint(scope, receive, send):
+    scope["route"] = scope["bench_route"]
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def drive(app, scopes, requests):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for i in range(requests):
+        await app(dict(scopes[i % len(scopes)]), receive, send)
+    return (time.perf_counter() - started) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--routes", type=int, default=20)
+    args = parser.parse_args()
+
+    scopes = [{"type": "http", "method": "GET", "path": f"/route/{n}",
+               "bench_route": Route(f"/route/{n}")} for n in range(args.routes)]
+    metrics = Metrics(InMemoryActivityStore({}))
+    wrapped = MetricsMiddleware(endpoint, metrics)
+
+    # Best of three runs each, interleaved so both see the same machine state
+    plain, instrumented = [], []
+    for _ in range(3):
+        plain.append(asyncio.run(drive(endpoint, scopes, args.requests)))
+        instrumented.append(asyncio.run(drive(wrapped, scopes, args.requests)))
+    plain, instrumented = min(plain), min(instrumented)
+    print(f"{'without middleware':>20} {plain * 1e6:8.2f} us/request")
+    print(f"{'with middleware':>20} {instrumented * 1e6:8.2f} us/request")
+    print(f"{'overhead':>20} {(instrumented - plain) * 1e6:8.2f} us/request")
+
+    started = time.perf_counter()
+    text = metrics.render()
+    print(f"{'scrape':>20} {(time.perf_counter() - started) * 1e3:8.2f} ms "
+          f"for {text.count(chr(10))} lines")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Membership, add and remove latency for participant collections
+
+Compares the plain list previously used for participants with
+ParticipantSet at 10^2..10^6 participants. ParticipantSet latency should
+stay flat while the list grows linearly.
+
+Usage: python -m benchmarks.bench_participants [--max-exponent 6]
+"""
+import argparse
+import timeit
+
+from src.models import ParticipantSet
+
+
+def measure(collection_factory, size, number):
+    emails = [f"student{i}@mergington.edu" for i in range(size)]
+    participants = collection_factory(emails)
+    # Worst case for a list: the email is at the end
+    last = emails[-1]
+    newcomer = "newcomer@mergington.edu"
+
+    def contains():
+        return last in participants
+
+    def add_remove():
+        if isinstance(participants, list):
+            participants.append(newcomer)
+            participants.remove(newcomer)
+        else:
+            participants.add(newcomer)
+            participants.remove(newcomer)
+
+    def remove_first():
+        first = emails[0]
+        participants.remove(first)
+        if isinstance(participants, list):
+            participants.append(first)
+        else:
+            participants.add(first)
+
+    results = {}
+    for name, func in (("contains", contains), ("add+remove", add_remove),
+                       ("remove first", remove_first)):
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        results[name] = seconds / number * 1e9
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-exponent", type=int, default=6)
+    args = parser.parse_args()
+
+    print(f"{'size':>9} {'collection':>14} {'contains ns':>12} "
+          f"{'add+remove ns':>14} {'remove first ns':>16}")
+    for exponent in range(2, args.max_exponent + 1):
+        size = 10 ** exponent
+        number = max(10, 10 ** 6 // size)
+        for name, factory in (("list", list), ("ParticipantSet", ParticipantSet)):
+            r = measure(factory, size, number)
+            print(f"{size:>9} {name:>14} {r['contains']:>12.0f} "
+                  f"{r['add+remove']:>14.0f} {r['remove first']:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
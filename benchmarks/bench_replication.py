@@ -0,0 +1,101 @@
+"""
+Replication delay and forwarded writes between a primary and a replica
+
+Starts a primary and a replica (ACTIVITY_PRIMARY_URL pointing at the
+primary) as two uvicorn processes, then signs students up one at a time:
+on the primary, timing how long until the replica serves the signup; and
+on the replica, which forwards the write and answers once it applied it.
+Reports p50 and p99 of each, and the replica's /replication/status.
+
+Usage: python -m benchmarks.bench_replication [--signups 200] [--port 8770]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.suite import percentile
+
+ACTIVITY = "Chess Club"
+
+
+def start(port, **environment):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.app:app", "--port", str(port),
+         "--log-level", "warning"], env=dict(os.environ, **environment))
+
+
+def request(url, method="GET"):
+    with urllib.request.urlopen(urllib.request.Request(url, method=method)) as response:
+        return json.loads(response.read())
+
+
+def wait_ready(url):
+    for _ in range(600):
+        try:
+            urllib.request.urlopen(f"{url}/activities?limit=1")
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not start")
+
+
+def activity_url(url, action, email):
+    return f"{url}/activities/{ACTIVITY.replace(' ', '%20')}/{action}?email={email}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--signups", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8770)
+    args = parser.parse_args()
+
+    primary_url = f"http://127.0.0.1:{args.port}"
+    replica_url = f"http://127.0.0.1:{args.port + 1}"
+    primary = start(args.port)
+    try:
+        wait_ready(primary_url)
+        replica = start(args.port + 1, ACTIVITY_PRIMARY_URL=primary_url)
+        try:
+            wait_ready(replica_url)
+            delays, forwarded, direct = [], [], []
+            for number in range(args.signups):
+                # Each student leaves again, so the activity never fills up
+                email = f"student{number}@mergington.edu"
+                started = time.perf_counter()
+                request(activity_url(primary_url, "signup", email), "POST")
+                direct.append(time.perf_counter() - started)
+                while not request(f"{replica_url}/students/{email}/activities")["activities"]:
+                    pass
+                delays.append(time.perf_counter() - started - direct[-1])
+                request(activity_url(primary_url, "remove", email), "DELETE")
+
+                email = f"forwarded{number}@mergington.edu"
+                started = time.perf_counter()
+                request(activity_url(replica_url, "signup", email), "POST")
+                forwarded.append(time.perf_counter() - started)
+                assert request(f"{replica_url}/students/{email}/activities")["activities"]
+                request(activity_url(replica_url, "remove", email), "DELETE")
+            status = request(f"{replica_url}/replication/status")
+        finally:
+            replica.terminate()
+            replica.wait()
+    finally:
+        primary.terminate()
+        primary.wait()
+
+    print(f"{'':>34} {'p50 ms':>8} {'p99 ms':>8}")
+    for label, latencies in (("signup on the primary", direct),
+                             ("until the replica serves it", delays),
+                             ("signup forwarded by the replica", forwarded)):
+        latencies.sort()
+        print(f"{label:>34} {percentile(latencies, 0.5) * 1e3:>8.2f} "
+              f"{percentile(latencies, 0.99) * 1e3:>8.2f}")
+    print(f"replica status: {status}")
+
+
+if __name__ == "__main__":
+    main()
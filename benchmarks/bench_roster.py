@@ -0,0 +1,82 @@
+"""
+Memory use of streaming roster export and import
+
+Imports a generated roster of --rows rows through RosterImporter, fed in
+64 KiB chunks like an HTTP upload, then streams it back out with
+export_roster. Peak RSS growth during each phase should stay roughly
+constant instead of growing with the number of rows (the store itself of
+course holds every participant).
+
+Usage: python -m benchmarks.bench_roster [--rows 1000000]
+"""
+import argparse
+import resource
+import time
+
+from src.app import store
+from src.roster import RosterImporter, export_roster
+
+ACTIVITY_COUNT = 100
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def generate_roster(rows, chunk_size=64 * 1024):
+    chunk = []
+    size = 0
+    for i in range(rows):
+        line = f'{{"activity": "Activity {i % ACTIVITY_COUNT}", "email": "student{i}@mergington.edu"}}\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield "".join(chunk).encode()
+            chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    store.load({
+        f"Activity {a}": {
+            "description": "Benchmark activity",
+            "schedule": "Mondays, 3:00 PM - 4:00 PM",
+            "max_participants": args.rows,
+            "participants": [],
+        }
+        for a in range(ACTIVITY_COUNT)
+    })
+
+    before = peak_rss_mb()
+    started = time.perf_counter()
+    importer = RosterImporter(store, "ndjson")
+    for chunk in generate_roster(args.rows):
+        for batch in importer.feed(chunk):
+            importer.apply(batch)
+    for batch in importer.close():
+        importer.apply(batch)
+    import_seconds = time.perf_counter() - started
+    after_import = peak_rss_mb()
+    assert importer.applied == args.rows
+
+    started = time.perf_counter()
+    exported = 0
+    for chunk in export_roster(store, "csv"):
+        exported += len(chunk)
+    export_seconds = time.perf_counter() - started
+    after_export = peak_rss_mb()
+
+    print(f"rows: {args.rows}")
+    print(f"import: {import_seconds:.2f}s, peak RSS {before:.0f} -> {after_import:.0f} MB "
+          f"(includes the imported participants)")
+    print(f"export: {export_seconds:.2f}s, {exported / 2 ** 20:.0f} MB streamed, "
+          f"peak RSS {after_import:.0f} -> {after_export:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Cost of schedule conflict checks and free_at lookups
+
+Builds 10k activities (by default) meeting one to three afternoons or
+evenings a week, signs a student up for 50 of them that do not overlap,
+and times checking every activity for a conflict with the student's
+schedule: with the ScheduleIndex, and by comparing every meeting of the
+candidate with every meeting of the student (already parsed). Also times
+free_at moments and windows.
+
+Usage: python -m benchmarks.bench_schedule [--activities 10000] [--taken 50]
+"""
+import argparse
+import random
+import time
+
+from src.indexes import ScheduleIndex
+from src.schedule import DAYS, MINUTES_PER_DAY, parse_meetings
+from src.store import InMemoryActivityStore
+
+EMAIL = "student@mergington.edu"
+
+
+def clock(minutes):
+    hour, minute = divmod(minutes, 60)
+    return f"{(hour - 1) % 12 + 1}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+
+def make_catalog(count, seed=1):
+    rng = random.Random(seed)
+    activities = {}
+    for number in range(count):
+        days = sorted(rng.sample(range(7), rng.randint(1, 3)))
+        start = rng.randrange(7 * 60, 21 * 60, 15)
+        end = min(start + rng.choice((30, 45, 60, 90, 120)), 23 * 60 + 45)
+        schedule = (" and ".join(DAYS[day].title() + "s" for day in days)
+                    + f", {clock(start)} - {clock(end)}")
+        activities[f"Activity {number:05d}"] = {
+            "description": "", "schedule": schedule, "max_participants": 100,
+            "participants": []}
+    return activities
+
+
+def pairwise(meetings, taken, name):
+    return sorted({other for other in taken for start, end in meetings[name]
+                   for other_start, other_end in meetings[other]
+                   if other != name and start < other_end and other_start < end})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--activities", type=int, default=10_000)
+    parser.add_argument("--taken", type=int, default=50)
+    args = parser.parse_args()
+
+    activities = make_catalog(args.activities)
+    meetings = {name: parse_meetings(details["schedule"]) for name, details in activities.items()}
+    # The student takes the first activities that fit their schedule so far
+    taken = []
+    for name in activities:
+        if len(taken) < args.taken and not pairwise(meetings, taken, name):
+            taken.append(name)
+            activities[name]["participants"].append(EMAIL)
+    index = ScheduleIndex(InMemoryActivityStore(activities))
+    index.ensure_current()
+    print(f"{args.activities} activities, student in {len(taken)} "
+          f"({len(index.busy[EMAIL])} meetings a week)")
+
+    started = time.perf_counter()
+    found = [index.conflicts(name, EMAIL) for name in activities]
+    indexed = (time.perf_counter() - started) / len(activities)
+    started = time.perf_counter()
+    expected = [pairwise(meetings, taken, name) for name in activities]
+    compared = (time.perf_counter() - started) / len(activities)
+    assert found == expected
+    print(f"{sum(map(bool, found))} activities conflict")
+    print(f"{'conflict check':>26} {'µs':>8}")
+    print(f"{'index':>26} {indexed * 1e6:>8.2f}")
+    print(f"{'pairwise':>26} {compared * 1e6:>8.2f}")
+
+    thursday = 3 * MINUTES_PER_DAY
+    for label, slot in (("free_at Thursday 4:00 PM", (thursday + 960, thursday + 960)),
+                        ("free_at Thursday 3-5 PM", (thursday + 900, thursday + 1020))):
+        started = time.perf_counter()
+        for _ in range(100):
+            names = index.available(*slot)
+        print(f"{label:>26} {(time.perf_counter() - started) / 100 * 1e6:>8.1f} "
+              f"({len(names)} activities)")
+
+
+if __name__ == "__main__":
+    main()
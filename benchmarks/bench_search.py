@@ -0,0 +1,88 @@
+"""
+Latency of activity and student search
+
+Builds a catalog of 100k activities (by default) named and described from a
+small vocabulary, so that every word is shared by thousands of activities,
+and times SearchIndex queries (exact words, several words, prefixes, typos
+and email prefixes) against scanning every name and description. Reports
+the index build time and the mean and p99 latency of each query.
+
+Usage: python -m benchmarks.bench_search [--activities 100000] [--number 200]
+"""
+import argparse
+import random
+import time
+
+from benchmarks.suite import percentile
+from src.search import SearchIndex
+from src.store import InMemoryActivityStore
+
+SUBJECTS = ("chess robotics chemistry physics biology painting drawing sculpture soccer "
+            "basketball volleyball tennis swimming debate drama theatre choir orchestra band "
+            "jazz photography film coding programming math astronomy gardening cooking baking "
+            "knitting yoga dance ballet poetry writing journalism history geography economics "
+            "philosophy psychology spanish french german latin chinese japanese").split()
+KINDS = "club team class workshop society league ensemble lab circle academy".split()
+LEVELS = "beginner advanced junior senior competitive casual weekend evening morning".split()
+WORDS = ("learn practice compete explore build create perform study discuss improve together "
+         "friends skills fun school students teachers project tournament season").split()
+QUERIES = ("chess", "chess club", "advanced robotics team", "senior jazz ensemble practice",
+           "photo", "chemsitry", "xylophone")
+
+
+def make_catalog(count, seed=1):
+    rng = random.Random(seed)
+    return {
+        f"{rng.choice(LEVELS).title()} {rng.choice(SUBJECTS).title()} "
+        f"{rng.choice(KINDS).title()} {number}": {
+            "description": " ".join(rng.choice(WORDS + SUBJECTS) for _ in range(10)),
+            "schedule": "Mondays, 3:30 PM - 5:00 PM",
+            "max_participants": 30,
+            "participants": [f"student{number}-{p}@mergington.edu" for p in range(3)],
+        }
+        for number in range(count)
+    }
+
+
+def timings(func, number):
+    result = []
+    for _ in range(number):
+        started = time.perf_counter()
+        func()
+        result.append(time.perf_counter() - started)
+    result.sort()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--activities", type=int, default=100_000)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    store = InMemoryActivityStore(make_catalog(args.activities))
+    index = SearchIndex(store)
+    started = time.perf_counter()
+    index.ensure_current()
+    print(f"{args.activities} activities, index built in {time.perf_counter() - started:.1f} s")
+
+    catalog = store.get_all()
+    print(f"{'query':>32} {'hits':>5} {'mean µs':>9} {'p99 µs':>9} {'scan ms':>9}")
+    for query in QUERIES:
+        hits = len(index.search(query))
+        latencies = timings(lambda: index.search(query), args.number)
+        words = query.split()
+        scan = timings(lambda: [name for name, details in catalog.items()
+                                if all(word in f"{name} {details['description']}".lower()
+                                       for word in words)], 3)
+        print(f"{query:>32} {hits:>5} {sum(latencies) / len(latencies) * 1e6:>9.1f} "
+              f"{percentile(latencies, 0.99) * 1e6:>9.1f} {scan[0] * 1e3:>9.1f}")
+    email = f"student{args.activities // 2}-"
+    latencies = timings(lambda: index.search_emails(email), args.number)
+    print(f"{'email ' + email:>32} {len(index.search_emails(email)):>5} "
+          f"{sum(latencies) / len(latencies) * 1e6:>9.1f} "
+          f"{percentile(latencies, 0.99) * 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Signup throughput of the SQLite store with several worker processes
+
+Every worker opens its own SQLiteActivityStore on the same database file,
+like uvicorn workers started with --workers would, and signs up distinct
+students as fast as it can.
+
+Usage: python -m benchmarks.bench_sqlite_store [--signups N] [--workers 1 2 4 8]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from src.store import SQLiteActivityStore
+
+ACTIVITY_COUNT = 16
+
+
+def seed(path):
+    store = SQLiteActivityStore(path)
+    store.load({
+        f"Activity {i}": {
+            "description": "Benchmark activity",
+            "schedule": "Mondays, 3:00 PM - 4:00 PM",
+            "max_participants": 10 ** 9,
+            "participants": [],
+        }
+        for i in range(ACTIVITY_COUNT)
+    })
+    store.close()
+
+
+def worker(path, worker_id, signups, start_event):
+    store = SQLiteActivityStore(path, pool_size=1)
+    start_event.wait()
+    for i in range(signups):
+        store.signup(f"Activity {i % ACTIVITY_COUNT}", f"w{worker_id}-s{i}@mergington.edu")
+    store.close()
+
+
+def run(workers, signups):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        seed(path)
+        start_event = multiprocessing.Event()
+        processes = [
+            multiprocessing.Process(target=worker, args=(path, w, signups, start_event))
+            for w in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        started = time.perf_counter()
+        start_event.set()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+    return workers * signups / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--signups", type=int, default=2000, help="signups per worker")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'signups/s':>12}")
+    for workers in args.workers:
+        print(f"{workers:>8} {run(workers, args.signups):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
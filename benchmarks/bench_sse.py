@@ -0,0 +1,84 @@
+"""
+Idle Server-Sent Events connections on a single uvicorn worker
+
+Starts uvicorn, opens --clients connections to /activities/events, then
+signs a student up and measures how long it takes until every client has
+received the event. Also reports the server's resident memory.
+Raise the open file limit (ulimit -n) above the number of clients first.
+
+Usage: python -m benchmarks.bench_sse [--clients 5000] [--port 8765]
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+def server_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+async def open_client(port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /activities/events HTTP/1.1\r\nHost: bench\r\n\r\n")
+    await writer.drain()
+    await reader.readuntil(b"retry: 3000\n\n")
+    return reader, writer
+
+
+async def wait_for_signup(reader):
+    await reader.readuntil(b"event: signup\n")
+
+
+async def run(args):
+    url = f"http://127.0.0.1:{args.port}"
+    clients = []
+    for start in range(0, args.clients, 500):
+        batch = range(start, min(start + 500, args.clients))
+        clients.extend(await asyncio.gather(*(open_client(args.port) for _ in batch)))
+    print(f"connected clients: {len(clients)}")
+
+    waiters = [asyncio.ensure_future(wait_for_signup(reader)) for reader, _ in clients]
+    started = time.perf_counter()
+    request = urllib.request.Request(
+        f"{url}/activities/Gym%20Class/signup?email=bench@mergington.edu", method="POST")
+    await asyncio.to_thread(urllib.request.urlopen, request)
+    await asyncio.gather(*waiters)
+    print(f"fan-out to all clients: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    for _, writer in clients:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "src.app:app",
+                               "--port", str(args.port), "--log-level", "warning",
+                               "--backlog", "8192"])
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{args.port}/activities")
+                break
+            except OSError:
+                time.sleep(0.1)
+        print(f"server RSS before: {server_rss_mb(server.pid):.0f} MB")
+        asyncio.run(run(args))
+        print(f"server RSS with clients: {server_rss_mb(server.pid):.0f} MB")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
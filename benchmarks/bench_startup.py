@@ -0,0 +1,84 @@
+"""
+Cold start: from importing the app to its first served requests
+
+Writes a catalog of 100k activities (by default) as JSON and as a packed
+.catalog, then starts a fresh interpreter per seed (the default one, the
+JSON file, the packed file) and reports how long importing the framework,
+importing src.app (seeding the store) and serving a first request take. The
+first request reads one activity's waitlist; the signup and the page of
+GET /activities after it build indexes over every activity (the schedule
+and student indexes, the listing index) and are reported apart.
+
+Usage: python -m benchmarks.bench_startup [--activities 100000] [--participants 10]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.suite import make_dataset
+from src.catalog import write_catalog
+from src.responses import encode_json
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import fastapi
+from fastapi.testclient import TestClient
+framework = time.perf_counter()
+import src.app
+imported = time.perf_counter()
+client = TestClient(src.app.app)
+assert client.get(f"/activities/{sys.argv[1]}/waitlist").status_code == 200
+first = time.perf_counter()
+assert client.post(f"/activities/{sys.argv[1]}/signup?email=new@mergington.edu").status_code == 200
+signup = time.perf_counter()
+assert client.get("/activities?limit=50").status_code == 200
+listing = time.perf_counter()
+print(json.dumps([framework - started, imported - framework, first - imported,
+                  signup - first, listing - signup]))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--activities", type=int, default=100_000)
+    parser.add_argument("--participants", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        data = make_dataset(args.activities, args.participants)
+        json_path = os.path.join(directory, "activities.json")
+        with open(json_path, "wb") as file:
+            file.write(encode_json(data))
+        packed_path = os.path.join(directory, "activities.catalog")
+        write_catalog(data, packed_path)
+        del data
+        middle = f"Activity {args.activities // 2:05d}"
+
+        print(f"{'seed':>20} {'framework ms':>13} {'src.app ms':>11} {'first ms':>9} "
+              f"{'signup ms':>10} {'listing ms':>11} {'process ms':>11}")
+        for label, seed, activity in (
+                ("default (9)", None, "Chess Club"),
+                (f"json ({args.activities})", json_path, middle),
+                (f"catalog ({args.activities})", packed_path, middle)):
+            environment = dict(os.environ)
+            environment.pop("ACTIVITY_SEED", None)
+            if seed is not None:
+                environment["ACTIVITY_SEED"] = seed
+            started = time.perf_counter()
+            output = subprocess.run([sys.executable, "-W", "ignore", "-c", PROBE, activity],
+                                    env=environment, check=True, capture_output=True,
+                                    text=True).stdout
+            process = time.perf_counter() - started
+            framework, imported, first, signup, listing = json.loads(output)
+            print(f"{label:>20} {framework * 1000:>13.0f} {imported * 1000:>11.0f} "
+                  f"{first * 1000:>9.1f} {signup * 1000:>10.0f} {listing * 1000:>11.0f} "
+                  f"{process * 1000:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Cost of finding the activities of one student
+
+Compares scanning every participant list of GET /activities (what the
+portal did client-side) with a StudentIndex lookup, at 10^2..10^4
+activities of 50 participants each. The index lookup should stay flat.
+
+Usage: python -m benchmarks.bench_students [--max-exponent 4] [--number 200]
+"""
+import argparse
+import timeit
+
+from benchmarks.suite import make_dataset
+from src.indexes import StudentIndex
+from src.store import InMemoryActivityStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-exponent", type=int, default=4)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'activities':>10} {'scan µs':>12} {'index µs':>10}")
+    for exponent in range(2, args.max_exponent + 1):
+        count = 10 ** exponent
+        store = InMemoryActivityStore(make_dataset(count, 50))
+        index = StudentIndex(store)
+        # The student takes part in a single activity, in the middle
+        email = f"student{count // 2}-25@mergington.edu"
+        assert index.lookup(email)[0] == [f"Activity {count // 2:05d}"]
+
+        def scan():
+            return sorted(name for name, details in store.get_all().items()
+                          if email in details["participants"])
+
+        # Fewer scans of the larger datasets
+        scans = max(1, args.number * 100 // count)
+        scan_time = timeit.timeit(scan, number=scans) / scans
+        index_time = timeit.timeit(lambda: index.lookup(email), number=args.number) / args.number
+        print(f"{count:>10} {scan_time * 1e6:>12.1f} {index_time * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
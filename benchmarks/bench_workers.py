@@ -0,0 +1,143 @@
+"""
+Throughput of the API with several uvicorn workers sharing a SQLite database
+
+Starts ``uvicorn src.app:app --workers N`` with ACTIVITY_STORE pointing at a
+fresh SQLite file for each N, drives the mixed scenario of the benchmark
+suite from several client processes for a fixed time, and reports requests
+per second. Every client also races for the seats of one small activity;
+afterwards the benchmark checks that it was filled exactly to capacity, as
+the capacity check is atomic across processes.
+
+Throughput can only scale up to the number of cores left once the client
+processes have theirs.
+
+Usage: python -m benchmarks.bench_workers [--workers 1 2 4 8] [--clients 4]
+                                          [--concurrency 16] [--duration 10]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import httpx
+
+from benchmarks.suite import make_dataset, scenario_requests
+from src.store import SQLiteActivityStore
+
+ACTIVITY_COUNT = 100
+LIMITED = "Limited Seats"
+LIMITED_SEATS = 100
+
+
+def seed(path):
+    dataset = make_dataset(ACTIVITY_COUNT, 20)
+    dataset[LIMITED] = {
+        "description": "Races for a few seats",
+        "schedule": "Fridays, 3:30 PM - 5:00 PM",
+        "max_participants": LIMITED_SEATS,
+        "participants": [],
+    }
+    store = SQLiteActivityStore(path)
+    store.load(dataset)
+    store.close()
+
+
+async def drive(url, client_id, concurrency, duration):
+    generator = scenario_requests("mixed", ACTIVITY_COUNT, start=client_id * 10 ** 9)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    completed = 0
+    deadline = time.perf_counter() + duration
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        async def worker(worker_id):
+            nonlocal completed
+            seat = 0
+            while time.perf_counter() < deadline:
+                for method, path, params in next(generator):
+                    await client.request(method, path, params=params)
+                    completed += 1
+                if seat < 10:
+                    seat += 1
+                    await client.post(f"/activities/{LIMITED}/signup", params={
+                        "email": f"seat-{client_id}-{worker_id}-{seat}@mergington.edu"})
+                    completed += 1
+
+        await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    return completed
+
+
+def client_process(url, client_id, concurrency, duration, start_event, results):
+    start_event.wait()
+    results.put(asyncio.run(drive(url, client_id, concurrency, duration)))
+
+
+def run(workers, clients, concurrency, duration, port):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        seed(path)
+        env = dict(os.environ, ACTIVITY_STORE=f"sqlite:///{path}", WEB_CONCURRENCY=str(workers))
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "src.app:app", "--port", str(port),
+             "--log-level", "warning", "--backlog", "4096", "--timeout-keep-alive", "120"],
+            env=env)
+        url = f"http://127.0.0.1:{port}"
+        try:
+            for _ in range(600):
+                try:
+                    urllib.request.urlopen(f"{url}/activities?limit=1")
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            start_event = multiprocessing.Event()
+            results = multiprocessing.Queue()
+            processes = [
+                multiprocessing.Process(target=client_process, args=(
+                    url, c, concurrency, duration, start_event, results))
+                for c in range(clients)
+            ]
+            for process in processes:
+                process.start()
+            started = time.perf_counter()
+            start_event.set()
+            completed = sum(results.get() for _ in processes)
+            elapsed = time.perf_counter() - started
+            for process in processes:
+                process.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+        store = SQLiteActivityStore(path)
+        taken = len(store.get_many([LIMITED])[LIMITED]["participants"])
+        store.close()
+    return completed / elapsed, taken
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8768)
+    args = parser.parse_args()
+
+    print(f"cores: {os.cpu_count()}")
+    print(f"{'workers':>8} {'req/s':>9} {'seats taken':>12}")
+    for workers in args.workers:
+        throughput, taken = run(workers, args.clients, args.concurrency, args.duration, args.port)
+        wanted = args.clients * args.concurrency * 10
+        if taken > LIMITED_SEATS:
+            status = "OVERBOOKED"
+        else:
+            status = "ok" if taken == min(LIMITED_SEATS, wanted) else "seats left"
+        print(f"{workers:>8} {throughput:>9.0f} {taken:>8}/{LIMITED_SEATS} {status}")
+
+
+if __name__ == "__main__":
+    main()
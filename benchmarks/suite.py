@@ -0,0 +1,283 @@
+"""
+Load-testing suite for the API
+
+Runs a set of scenarios against the app, either in-process through
+httpx's ASGI transport (``asgi``) or over the wire against a uvicorn server
+on localhost (``http``), and reports throughput and p50/p95/p99 latency.
+Results are written as JSON; with a baseline file the run fails when a
+scenario regresses beyond --threshold percent. With --require-baseline a
+missing baseline fails the run too, instead of skipping the comparison.
+
+Scenarios:
+
+- ``read_listing``:  full and paginated GET /activities
+- ``signup_storm``:  signups of new students spread over every activity
+- ``removal_churn``: a signup immediately followed by its removal
+- ``mixed``:         80% reads, 15% signups, 5% removals
+
+Usage: python -m benchmarks.suite [--transport asgi http] [--scenarios ...]
+                                  [--activities 100] [--participants 200]
+                                  [--requests 2000] [--concurrency 32]
+                                  [--output benchmarks/results/latest.json]
+                                  [--baseline benchmarks/baseline.json] [--threshold 20]
+                                  [--save-baseline] [--require-baseline]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+import httpx
+
+SCENARIOS = ("read_listing", "signup_storm", "removal_churn", "mixed")
+TRANSPORTS = ("asgi", "http")
+
+
+def make_dataset(activity_count, participant_count):
+    """Activities with room for every signup a run can make"""
+    return {
+        f"Activity {a:05d}": {
+            "description": f"Benchmark activity number {a}",
+            "schedule": "Mondays and Wednesdays, 3:30 PM - 5:00 PM",
+            "max_participants": 10 ** 9,
+            "participants": [f"student{a}-{p}@mergington.edu" for p in range(participant_count)],
+        }
+        for a in range(activity_count)
+    }
+
+
+def seed_and_serve(port, activity_count, participant_count):
+    """Entry point of the server process used by the http transport"""
+    import uvicorn
+    from src.app import app, store
+
+    store.load(make_dataset(activity_count, participant_count))
+    uvicorn.run(app, port=port, log_level="warning", backlog=4096, timeout_keep_alive=120)
+
+
+def scenario_requests(scenario, activity_count, start=0):
+    """Yield the steps of a scenario, forever
+
+    A step is a list of ``(method, path, params)`` sent one after the other
+    by the same client: a removal is in the step of the signup it undoes,
+    so it never reaches the server first. Students are numbered from
+    ``start``, so generators with distant starts never sign up the same
+    student.
+    """
+    names = [f"Activity {a:05d}" for a in range(activity_count)]
+    counter = itertools.count(start)
+
+    def read(i):
+        if i % 2:
+            return "GET", "/activities", None
+        return "GET", "/activities", {"limit": "50", "fields": "counts"}
+
+    def signup(i):
+        return ("POST", f"/activities/{names[i % activity_count]}/signup",
+                {"email": f"bench{i}@mergington.edu"})
+
+    def remove(i):
+        return ("DELETE", f"/activities/{names[i % activity_count]}/remove",
+                {"email": f"bench{i}@mergington.edu"})
+
+    for i in counter:
+        if scenario == "read_listing":
+            yield [read(i)]
+        elif scenario == "signup_storm":
+            yield [signup(i)]
+        elif scenario == "removal_churn":
+            yield [signup(i), remove(i)]
+        else:
+            roll = i % 20
+            if roll < 16:
+                yield [read(i)]
+            elif roll < 18:
+                yield [signup(i)]
+            elif roll == 18:
+                # Counts for the request of roll 19 as well
+                yield [signup(i), remove(i)]
+
+
+async def run_scenario(client, scenario, activity_count, requests, concurrency):
+    generator = scenario_requests(scenario, activity_count)
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while len(latencies) + errors < requests:
+            for method, path, params in next(generator):
+                begin = time.perf_counter()
+                response = await client.request(method, path, params=params)
+                elapsed = time.perf_counter() - begin
+                # Every request of the scenarios succeeds on a healthy server:
+                # a 4xx (rate limited, already signed up...) is an error too
+                if response.status_code != 200:
+                    errors += 1
+                else:
+                    latencies.append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, errors, elapsed)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies.sort()
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput": (len(latencies) + errors) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else float("nan"),
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def run_asgi(args):
+    from src.app import app, store
+
+    results = {}
+    for scenario in args.scenarios:
+        store.load(make_dataset(args.activities, args.participants))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            results[scenario] = await run_scenario(
+                client, scenario, args.activities, args.requests, args.concurrency)
+    return results
+
+
+def wait_until_ready(server, url, timeout=60.0):
+    """Wait for the server process to answer, raising if it exits or never does"""
+    deadline = time.monotonic() + timeout
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with status {server.returncode} before answering")
+        try:
+            urllib.request.urlopen(f"{url}/activities?limit=1")
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"server not answering at {url} after {timeout:.0f} s")
+            time.sleep(0.1)
+
+
+async def run_http(args):
+    url = f"http://127.0.0.1:{args.port}"
+    limits = httpx.Limits(max_connections=args.concurrency,
+                          max_keepalive_connections=args.concurrency)
+    results = {}
+    for scenario in args.scenarios:
+        # A fresh server per scenario so each starts from the same dataset
+        server = subprocess.Popen([
+            sys.executable, "-c",
+            "import sys; from benchmarks.suite import seed_and_serve; "
+            "seed_and_serve(*map(int, sys.argv[1:]))",
+            str(args.port), str(args.activities), str(args.participants)])
+        try:
+            wait_until_ready(server, url)
+            async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+                results[scenario] = await run_scenario(
+                    client, scenario, args.activities, args.requests, args.concurrency)
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return a description of every scenario that regressed beyond ``threshold`` percent"""
+    regressions = []
+    limit = threshold / 100
+    for key, base in baseline.get("scenarios", {}).items():
+        current = results.get(key)
+        if current is None:
+            continue
+        if current["throughput"] < base["throughput"] * (1 - limit):
+            regressions.append(f"{key}: throughput {current['throughput']:.0f} req/s "
+                               f"vs baseline {base['throughput']:.0f} req/s")
+        if current["p99_ms"] > base["p99_ms"] * (1 + limit):
+            regressions.append(f"{key}: p99 {current['p99_ms']:.2f} ms "
+                               f"vs baseline {base['p99_ms']:.2f} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--transport", nargs="+", choices=TRANSPORTS, default=["asgi"])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--activities", type=int, default=100)
+    parser.add_argument("--participants", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--output", default="benchmarks/results/latest.json")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json")
+    parser.add_argument("--threshold", type=float, default=20.0,
+                        help="allowed regression in percent")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="write the results as the new baseline")
+    parser.add_argument("--require-baseline", action="store_true",
+                        help="fail when there is no baseline to compare with")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for transport in args.transport:
+        runner = run_asgi if transport == "asgi" else run_http
+        for scenario, result in asyncio.run(runner(args)).items():
+            results[f"{transport}/{scenario}"] = result
+
+    print(f"{'scenario':>24} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for key, result in results.items():
+        print(f"{key:>24} {result['throughput']:>9.0f} {result['p50_ms']:>8.2f} "
+              f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['errors']:>7}")
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "activities": args.activities,
+            "participants": args.participants,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "scenarios": results,
+    }
+    path = args.baseline if args.save_baseline else args.output
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"results written to {path}")
+
+    if args.save_baseline:
+        return 0
+    if not os.path.exists(args.baseline):
+        if args.require_baseline:
+            print(f"ERROR no baseline at {args.baseline}: record one on this machine "
+                  f"with --save-baseline (make bench-baseline)", file=sys.stderr)
+            return 2
+        return 0
+    with open(args.baseline) as baseline_file:
+        regressions = compare(results, json.load(baseline_file), args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,138 +5,656 @@ A super simple FastAPI application that allows students to view and sign up
 for extracurricular activities at Mergington High School.
 """
 
-from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import atexit
 import os
+from contextlib import AsyncExitStack
 from pathlib import Path
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel
+
+from .assets import AssetPipeline
+from .catalog import load_catalog
+from .durability import MutationLog, MutationLogError
+from .events import EventBroker
+from .history import AuditLog, ClientMiddleware, activity_history
+from .idempotency import IdempotencyCache
+from .indexes import ActivityIndex, ScheduleIndex, StudentIndex
+from .limits import AdmissionMiddleware, RateLimitMiddleware, parse_limit
+from .listing import list_activities
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Metrics, MetricsMiddleware
+from .profiling import Profiler, ProfilingMiddleware
+from .replication import (
+    MAX_LIMIT as MAX_CHANGES,
+    MAX_WAIT,
+    ChangeFeed,
+    Replica,
+    ReplicaMiddleware,
+    VersionHeaderMiddleware,
+)
+from .responses import (
+    CompressionMiddleware,
+    FastJSONResponse,
+    available_encodings,
+    choose_encoding,
+    encode_json,
+    variant_etag,
+)
+from .roster import FORMATS as ROSTER_FORMATS, RosterImporter, export_roster
+from .search import SearchIndex, search_activities
+from .snapshot import SnapshotCache, etag_matches
+from .store import (
+    ActivityStoreError,
+    AsyncActivityStore,
+    BatchItemResult,
+    BatchRejectedError,
+    ScheduleConflictError,
+    create_store,
+)
 
 app = FastAPI(title="Mergington High School API",
-              description="API for viewing and signing up for extracurricular activities")
+              description="API for viewing and signing up for extracurricular activities",
+              default_response_class=FastJSONResponse)
 
-# Mount the static files directory
+# Minified, fingerprinted and precompressed static files, built once at startup
 current_dir = Path(__file__).parent
-app.mount("/static", StaticFiles(directory=os.path.join(Path(__file__).parent,
-          "static")), name="static")
-
-# In-memory activity database
-activities = {
-    "Chess Club": {
-        "description": "Learn strategies and compete in chess tournaments",
-        "schedule": "Fridays, 3:30 PM - 5:00 PM",
-        "max_participants": 12,
-        "participants": ["michael@mergington.edu", "daniel@mergington.edu"]
-    },
-    "Programming Class": {
-        "description": "Learn programming fundamentals and build software projects",
-        "schedule": "Tuesdays and Thursdays, 3:30 PM - 4:30 PM",
-        "max_participants": 20,
-        "participants": ["emma@mergington.edu", "sophia@mergington.edu"]
-    },
-    "Gym Class": {
-        "description": "Physical education and sports activities",
-        "schedule": "Mondays, Wednesdays, Fridays, 2:00 PM - 3:00 PM",
-        "max_participants": 30,
-        "participants": ["john@mergington.edu", "olivia@mergington.edu"]
-    },
-    "Basketball Team": {
-        "description": "Competitive basketball with practices and inter-school games",
-        "schedule": "Mondays and Wednesdays, 4:00 PM - 6:00 PM",
-        "max_participants": 15,
-        "participants": ["alex@mergington.edu", "sarah@mergington.edu"]
-    },
-    "Soccer Club": {
-        "description": "Soccer training and friendly matches with other schools",
-        "schedule": "Tuesdays and Thursdays, 4:00 PM - 5:30 PM",
-        "max_participants": 25,
-        "participants": ["carlos@mergington.edu", "maya@mergington.edu"]
-    },
-    "Art Club": {
-        "description": "Explore various art mediums including painting, drawing, and sculpture",
-        "schedule": "Thursdays, 3:30 PM - 5:30 PM",
-        "max_participants": 18,
-        "participants": ["luna@mergington.edu", "jacob@mergington.edu"]
-    },
-    "Drama Club": {
-        "description": "Acting, script reading, and theatrical performances",
-        "schedule": "Wednesdays and Fridays, 3:30 PM - 5:00 PM",
-        "max_participants": 22,
-        "participants": ["grace@mergington.edu", "ethan@mergington.edu"]
-    },
-    "Debate Team": {
-        "description": "Develop critical thinking and public speaking through competitive debates",
-        "schedule": "Tuesdays, 3:30 PM - 5:00 PM",
-        "max_participants": 16,
-        "participants": ["ava@mergington.edu", "noah@mergington.edu"]
-    },
-    "Science Olympiad": {
-        "description": "Competitive science team covering biology, chemistry, physics, and engineering",
-        "schedule": "Saturdays, 9:00 AM - 12:00 PM",
-        "max_participants": 14,
-        "participants": ["zoe@mergington.edu", "liam@mergington.edu"]
-    }
-}
+static_assets = AssetPipeline(os.path.join(current_dir, "static"))
+
+# Default activities, used to seed the store. ACTIVITY_SEED names another
+# .json file, or a packed .catalog (see src/catalog.py) for large catalogs.
+activities = load_catalog(os.environ.get("ACTIVITY_SEED",
+                                         os.path.join(current_dir, "activities.json")))
+
+# Storage engine selected with ACTIVITY_STORE ("memory" or "sqlite:///path/to.db")
+store = create_store(os.environ.get("ACTIVITY_STORE", "memory"), activities)
+# Only WEB_CONCURRENCY can be checked: workers started with uvicorn --workers
+# cannot tell themselves from the process of uvicorn --reload
+if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1 and not store.blocking:
+    raise RuntimeError("Every worker would have its own copy of the in-memory store: "
+                       "set ACTIVITY_STORE=sqlite:///path/to.db to run several workers")
+# Deliver changes made by other workers to the caches, indexes and event streams
+store.watch()
+
+# Read-only replica of another node, which serves the writes:
+# ACTIVITY_PRIMARY_URL=http://primary:8000
+replica = None
+if os.environ.get("ACTIVITY_PRIMARY_URL"):
+    if store.blocking:
+        raise RuntimeError("A replica keeps its copy of the activities in memory: "
+                           "unset ACTIVITY_STORE")
+    replica = Replica(store, os.environ["ACTIVITY_PRIMARY_URL"])
+    replica.start()
+    atexit.register(replica.close)
+
+# Optional write-ahead log making the in-memory store survive restarts.
+# ACTIVITY_LOG_FSYNC=always syncs every mutation instead of group commits.
+mutation_log = None
+if os.environ.get("ACTIVITY_LOG_DIR"):
+    if store.blocking:
+        raise RuntimeError("The write-ahead log is for the in-memory store, SQLite is already "
+                           "durable: unset ACTIVITY_LOG_DIR or ACTIVITY_STORE")
+    mutation_log = MutationLog(os.environ["ACTIVITY_LOG_DIR"],
+                               group_commit=os.environ.get("ACTIVITY_LOG_FSYNC") != "always")
+    mutation_log.recover(store)
+    mutation_log.start(store)
+    atexit.register(mutation_log.close)
+
+# Endpoints use the async interface: in-memory calls stay on the event loop
+async_store = AsyncActivityStore(store, log=mutation_log)
+
+# Serialized GET /activities payload, rebuilt only after the data changes
+activities_cache = SnapshotCache(store)
+
+# Indexes answering paginated and filtered listings
+activity_index = ActivityIndex(store)
+
+# Activities and waitlists of each student, for the student endpoints
+student_index = StudentIndex(store)
+
+# Weekly meetings of activities and students, for conflicts and free_at
+schedule_index = ScheduleIndex(store)
+
+# Words of activity names and descriptions, and participant emails, for search
+search_index = SearchIndex(store)
+
+# Every change as an event, for the history and past rosters of an activity
+audit_log = AuditLog(store)
+
+# Latest changes, tailed by replicas from /replication/changes
+change_feed = ChangeFeed(store)
+
+# Pushes roster changes to browsers listening on /activities/events
+event_broker = EventBroker(store)
+
+# Outcomes of signups and removals sent with an Idempotency-Key header, so
+# that client retries are answered without running the mutation again
+idempotency = IdempotencyCache(
+    max_entries=int(os.environ.get("ACTIVITY_IDEMPOTENCY_KEYS", "100000")),
+    ttl=float(os.environ.get("ACTIVITY_IDEMPOTENCY_TTL", "86400")))
+
+# Responses of at least ACTIVITY_COMPRESS_MIN_SIZE bytes are compressed. The
+# full activity list is compressed once per store version with the levels
+# that gave the smallest payloads in benchmarks/bench_json.py; listing pages
+# are compressed on every request, so they use the fastest levels.
+COMPRESS_MIN_SIZE = int(os.environ.get("ACTIVITY_COMPRESS_MIN_SIZE", "1024"))
+SNAPSHOT_LEVELS = {"gzip": 4, "zstd": 3}
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESS_MIN_SIZE,
+                   levels={"/activities": {"gzip": 1, "zstd": 1}})
+
+# Writes answer with the store version after them, which replicas wait for
+# before answering the writes they forwarded, so that readers see them
+app.add_middleware(VersionHeaderMiddleware, store=store)
+if replica is not None:
+    app.add_middleware(ReplicaMiddleware, replica=replica,
+                       read_your_writes=float(os.environ.get("ACTIVITY_READ_YOUR_WRITES", "1.0")),
+                       exempt=("/replication/status", "/metrics"))
+
+# At most ACTIVITY_MAX_IN_FLIGHT requests are served at once; the excess
+# waits in a bounded queue and is shed with 503 past ACTIVITY_MAX_QUEUE_WAIT.
+# ACTIVITY_MAX_LOOP_LAG (seconds, off by default) also sheds requests while
+# the event loop is that far behind. Event streams stay open for long, so
+# they are not counted.
+app.add_middleware(AdmissionMiddleware,
+                   max_in_flight=int(os.environ.get("ACTIVITY_MAX_IN_FLIGHT", "128")),
+                   max_queue=int(os.environ.get("ACTIVITY_MAX_QUEUE", "512")),
+                   max_wait=float(os.environ.get("ACTIVITY_MAX_QUEUE_WAIT", "1.0")),
+                   max_lag=(float(os.environ["ACTIVITY_MAX_LOOP_LAG"])
+                            if os.environ.get("ACTIVITY_MAX_LOOP_LAG") else None),
+                   exempt=("/activities/events", "/replication/changes"))
+
+# Opt-in token buckets per client IP (and per student for writes), set as
+# "rate" or "rate:burst" requests per second, e.g. ACTIVITY_RATE_LIMIT_READ=20:40
+app.add_middleware(RateLimitMiddleware,
+                   read=parse_limit(os.environ.get("ACTIVITY_RATE_LIMIT_READ")),
+                   write=parse_limit(os.environ.get("ACTIVITY_RATE_LIMIT_WRITE")),
+                   exempt=("/metrics", "/replication/changes"))
+
+# Lets the audit log record the client address of the request making a change
+app.add_middleware(ClientMiddleware)
+
+# Request and domain metrics exposed at /metrics
+metrics = Metrics(store, replica, mutation_log)
+app.add_middleware(MetricsMiddleware, metrics=metrics, routes=app.router.routes)
+
+# Opt-in profiling: ACTIVITY_PROFILE_SAMPLE is the fraction of requests to
+# profile (0 profiles only requests sent with "X-Profile: 1")
+profiler = Profiler(
+    sample_rate=(float(os.environ["ACTIVITY_PROFILE_SAMPLE"])
+                 if os.environ.get("ACTIVITY_PROFILE_SAMPLE") else None),
+    keep=int(os.environ.get("ACTIVITY_PROFILE_KEEP", "20")))
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+
+def store_error(error):
+    """Count a domain error and turn it into the matching HTTP error"""
+    metrics.count_error(error)
+    return HTTPException(status_code=error.status_code, detail=error.detail)
+
+
+@app.exception_handler(MutationLogError)
+async def mutation_log_error(request, error):
+    # Raised by every change once the write-ahead log failed, batches included
+    metrics.count_error(error)
+    return FastJSONResponse({"detail": error.detail}, status_code=error.status_code)
+
+
+def _asset_response(request, asset, cache_control):
+    encoding, body = asset.body(request.headers.get("accept-encoding"))
+    etag = variant_etag(asset.etag, encoding)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=asset.media_type, headers=headers)
 
 
 @app.get("/")
-def root():
-    return RedirectResponse(url="/static/index.html")
+async def root(request: Request):
+    """Serve the web page, which references the fingerprinted assets"""
+    return _asset_response(request, *static_assets.lookup("index.html"))
+
+
+@app.api_route("/static/{name}", methods=["GET", "HEAD"])
+async def static_file(request: Request, name: str):
+    """Serve a static file; fingerprinted names are cached forever"""
+    found = static_assets.lookup(name)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return _asset_response(request, *found)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Expose request and domain metrics in the Prometheus text format"""
+    return Response(content=await async_store.run(metrics.render),
+                    media_type=METRICS_CONTENT_TYPE)
+
+
+def _get_trace(trace_id):
+    trace = profiler.get(trace_id) if profiler.enabled else None
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+
+@app.get("/admin/profiles")
+async def list_profiles():
+    """List the slowest profiled requests, slowest first"""
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    return {"sample_rate": profiler.sample_rate,
+            "traces": [trace.summary() for trace in profiler.traces()]}
+
+
+@app.get("/admin/profiles/{trace_id}")
+async def get_profile(trace_id: int):
+    """Spans, framework phases and top functions of one profiled request"""
+    return _get_trace(trace_id).details()
+
+
+@app.get("/admin/profiles/{trace_id}/speedscope.json")
+async def get_profile_speedscope(trace_id: int):
+    """Download a profiled request for https://www.speedscope.app"""
+    trace = _get_trace(trace_id)
+    filename = f"trace-{trace_id}.speedscope.json"
+    return Response(content=encode_json(trace.speedscope()), media_type="application/json",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@app.get("/admin/profiles/{trace_id}/flamegraph.txt")
+async def get_profile_flamegraph(trace_id: int):
+    """Collapsed stacks of a profiled request, the input of flamegraph.pl"""
+    return PlainTextResponse(_get_trace(trace_id).collapsed())
+
+
+@app.get("/replication/snapshot")
+async def replication_snapshot():
+    """Every activity with its waitlist, the version they were read at and the feed to follow"""
+    # Large catalogs would stall the event loop, so this always uses a thread
+    return await run_in_threadpool(change_feed.snapshot)
+
+
+@app.get("/replication/changes")
+async def replication_changes(after: int, feed: Optional[str] = None, wait: float = 0.0,
+                              limit: int = 1000):
+    """Changes after version ``after`` as ``[version, op, activity, email]``, oldest first
+
+    With ``wait``, waits up to that many seconds for a change when there is
+    none yet. Answers 410 when the replica must load a new snapshot.
+    """
+    try:
+        changes, version = await change_feed.wait(after, min(max(wait, 0.0), MAX_WAIT),
+                                                  min(max(limit, 1), MAX_CHANGES), feed)
+    except ActivityStoreError as error:
+        raise store_error(error)
+    return {"version": version, "changes": changes}
+
+
+@app.get("/replication/status")
+async def replication_status():
+    """Role of this node; replicas add their state and replication lag"""
+    if replica is not None:
+        return replica.status()
+    return {"role": "primary", "version": await async_store.run(store.version)}
 
 
 @app.get("/activities")
-def get_activities():
-    return activities
+async def get_activities(request: Request, limit: Optional[int] = None,
+                         cursor: Optional[str] = None, prefix: Optional[str] = None,
+                         day: Optional[str] = None, has_free_seats: Optional[bool] = None,
+                         fields: Optional[str] = None, free_at: Optional[str] = None):
+    """List activities
 
+    Without query parameters every activity is returned. With any of them the
+    result is a page ordered by name: ``{"activities": ..., "next_cursor": ...}``.
+    """
+    if any(value is not None
+           for value in (limit, cursor, prefix, day, has_free_seats, fields, free_at)):
+        try:
+            return await async_store.run(
+                list_activities, store, activity_index, limit=50 if limit is None else limit,
+                cursor=cursor, prefix=prefix, day=day, has_free_seats=has_free_seats,
+                fields=fields, free_at=free_at, schedules=schedule_index)
+        except ActivityStoreError as error:
+            raise store_error(error)
+
+    snapshot = await async_store.run(activities_cache.get)
+    encoding = None
+    if len(snapshot.body) >= COMPRESS_MIN_SIZE:
+        encoding = choose_encoding(request.headers.get("accept-encoding"), available_encodings())
+    etag = variant_etag(snapshot.etag, encoding)
+    # no-cache lets browsers keep the payload but revalidate it with the ETag
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    # The compressed body is cached with the snapshot, once per encoding
+    body = await async_store.run(snapshot.encoded, encoding, SNAPSHOT_LEVELS.get(encoding))
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/activities/events")
+async def activity_events():
+    """Stream signup, removal and reset events as Server-Sent Events"""
+    return StreamingResponse(event_broker.stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/activities/search")
+async def search(q: str, limit: int = 10):
+    """Search activities by the words of their name and description, and students by email
+
+    Words match exactly, as a prefix or despite a typo; activities matching
+    every word are ranked best first.
+    """
+    try:
+        return await async_store.run(search_activities, store, search_index, student_index,
+                                     q, limit)
+    except ActivityStoreError as error:
+        raise store_error(error)
+
+
+@app.get("/activities/export")
+async def export_activities(format: Literal["ndjson", "csv"] = "ndjson"):
+    """Stream every (activity, email) pair as NDJSON or CSV"""
+    return StreamingResponse(export_roster(store, format), media_type=ROSTER_FORMATS[format])
+
+
+@app.post("/activities/import")
+async def import_activities(request: Request, format: Literal["ndjson", "csv"] = "ndjson"):
+    """Sign up every row of a roster sent as the request body
+
+    The body is parsed as it arrives and applied in batches, which check
+    membership and capacity like single signups but not schedule
+    conflicts. Rows applied before a fatal format error stay.
+    """
+    importer = RosterImporter(store, format)
+
+    async def apply(batch):
+        # Through the async store, which waits for the write-ahead log
+        importer.record(batch, await async_store.signup_many(importer.items(batch)))
+
+    try:
+        async for chunk in request.stream():
+            for batch in importer.feed(chunk):
+                await apply(batch)
+        for batch in importer.close():
+            await apply(batch)
+    except ActivityStoreError as error:
+        raise store_error(error)
+    return importer.summary()
+
+
+def _schedule_conflict(conflicts):
+    return ScheduleConflictError(f"Schedule conflicts with {', '.join(conflicts)}")
+
+
+async def _check_schedule(activity_name, email):
+    conflicts = await async_store.run(schedule_index.conflicts, activity_name, email)
+    if conflicts:
+        raise _schedule_conflict(conflicts)
+
+
+async def _signup(activity_name, email):
+    try:
+        # Under the student lock, so that two signups cannot both pass the
+        # check. The lock is per process: with several workers sharing SQLite,
+        # concurrent requests of one student are not checked against each other.
+        async with async_store.student_lock(email):
+            await _check_schedule(activity_name, email)
+            total = await async_store.signup(activity_name, email)
+    except ActivityStoreError as error:
+        raise store_error(error)
 
-@app.post("/activities/{activity_name}/signup")
-def signup_for_activity(activity_name: str, email: str):
-    """Sign up a student for an activity"""
-    # Validate activity exists
-    if activity_name not in activities:
-        raise HTTPException(status_code=404, detail="Activity not found")
-
-    # Get the specific activity
-    activity = activities[activity_name]
-
-    # Validate student is not already signed up
-    if email in activity["participants"]:
-        raise HTTPException(status_code=400, detail="Student already signed up for this activity")
-
-    # Check if activity is full
-    if len(activity["participants"]) >= activity["max_participants"]:
-        raise HTTPException(status_code=400, detail="Activity is full")
-
-    # Add student
-    activity["participants"].append(email)
-    
     return {
         "message": f"Successfully signed up for {activity_name}",
         "activity": activity_name,
         "email": email,
-        "total_participants": len(activity["participants"])
+        "total_participants": total
     }
 
 
-@app.delete("/activities/{activity_name}/remove")
-def remove_from_activity(activity_name: str, email: str):
-    """Remove a student from an activity"""
-    # Validate activity exists
-    if activity_name not in activities:
-        raise HTTPException(status_code=404, detail="Activity not found")
-
-    # Get the specific activity
-    activity = activities[activity_name]
-
-    # Check if student is signed up
-    if email not in activity["participants"]:
-        raise HTTPException(status_code=404, detail="Student not found in this activity")
-
-    # Remove student
-    activity["participants"].remove(email)
-    
+@app.post("/activities/{activity_name}/signup")
+async def signup_for_activity(activity_name: str, email: str,
+                              idempotency_key: Optional[str] = Header(None)):
+    """Sign up a student for an activity
+
+    Retries sent with the same ``Idempotency-Key`` get the first response.
+    """
+    return await idempotency.run(idempotency_key, ("signup", activity_name, email),
+                                 _signup, activity_name, email)
+
+
+async def _remove(activity_name, email):
+    try:
+        total = await async_store.remove(activity_name, email)
+    except ActivityStoreError as error:
+        raise store_error(error)
+
     return {
         "message": f"Successfully removed from {activity_name}",
         "activity": activity_name,
         "email": email,
-        "total_participants": len(activity["participants"])
+        "total_participants": total
     }
+
+
+@app.delete("/activities/{activity_name}/remove")
+async def remove_from_activity(activity_name: str, email: str,
+                               idempotency_key: Optional[str] = Header(None)):
+    """Remove a student from an activity
+
+    Retries sent with the same ``Idempotency-Key`` get the first response.
+    """
+    return await idempotency.run(idempotency_key, ("remove", activity_name, email),
+                                 _remove, activity_name, email)
+
+
+async def _join_waitlist(activity_name, email):
+    try:
+        async with async_store.student_lock(email):
+            await _check_schedule(activity_name, email)
+            position = await async_store.join_waitlist(activity_name, email)
+    except ActivityStoreError as error:
+        raise store_error(error)
+
+    if position == 0:
+        return {
+            "message": f"Successfully signed up for {activity_name}",
+            "activity": activity_name,
+            "email": email,
+            "status": "signed_up",
+            "position": 0
+        }
+    return {
+        "message": f"Added to the waitlist for {activity_name} at position {position}",
+        "activity": activity_name,
+        "email": email,
+        "status": "waitlisted",
+        "position": position
+    }
+
+
+@app.post("/activities/{activity_name}/waitlist")
+async def join_waitlist(activity_name: str, email: str,
+                        idempotency_key: Optional[str] = Header(None)):
+    """Queue a student for a full activity
+
+    The student is promoted as soon as a seat frees up, which is announced
+    with a ``promoted`` event. If a seat is already free they are signed up
+    right away.
+    """
+    return await idempotency.run(idempotency_key, ("waitlist", activity_name, email),
+                                 _join_waitlist, activity_name, email)
+
+
+@app.delete("/activities/{activity_name}/waitlist")
+async def leave_waitlist(activity_name: str, email: str):
+    """Take a student off the waitlist of an activity"""
+    try:
+        length = await async_store.leave_waitlist(activity_name, email)
+    except ActivityStoreError as error:
+        raise store_error(error)
+
+    return {
+        "message": f"Removed from the waitlist for {activity_name}",
+        "activity": activity_name,
+        "email": email,
+        "waiting": length
+    }
+
+
+@app.get("/activities/{activity_name}/waitlist")
+async def get_waitlist(activity_name: str, email: Optional[str] = None):
+    """Number of students waiting, and the position of ``email`` if given"""
+    try:
+        position, length = await async_store.run(store.waitlist_position, activity_name, email)
+    except ActivityStoreError as error:
+        raise store_error(error)
+
+    result = {"activity": activity_name, "waiting": length}
+    if email is not None:
+        result["email"] = email
+        result["position"] = position
+    return result
+
+
+@app.get("/activities/{activity_name}/history")
+async def get_history(activity_name: str, as_of: Optional[str] = None, after: int = 0,
+                      limit: int = 100):
+    """Changes of an activity, oldest first, or its roster at a past moment
+
+    Each change lists the student and the address of the client that made
+    it. With ``as_of`` (an ISO 8601 time, UTC unless it gives an offset, or
+    a store version) the participants and waitlist at that moment are
+    returned instead.
+    """
+    try:
+        return await async_store.run(activity_history, store, audit_log, activity_name,
+                                     as_of=as_of, after=after, limit=limit)
+    except ActivityStoreError as error:
+        raise store_error(error)
+
+
+@app.get("/students/{email}/activities")
+async def get_student_activities(email: str):
+    """List the activities a student takes part in and the waitlists they are on"""
+    names, waitlists = await async_store.run(student_index.lookup, email)
+    return {"email": email, "activities": names, "waitlists": waitlists}
+
+
+@app.delete("/students/{email}/activities")
+async def remove_student_everywhere(email: str):
+    """Remove a student from every activity and waitlist they are on
+
+    Each freed seat goes to the head of that activity's waitlist.
+    """
+    _, waitlists = await async_store.run(student_index.lookup, email)
+    left = []
+    # Waitlists first, so that no seat is given to the student meanwhile
+    for name in waitlists:
+        try:
+            await async_store.leave_waitlist(name, email)
+        except ActivityStoreError:
+            # Promoted since the lookup: removed with the other activities below
+            continue
+        left.append(name)
+    names, _ = await async_store.run(student_index.lookup, email)
+    results = await async_store.remove_many([(name, email) for name in names])
+    return {
+        "email": email,
+        "removed_from": [result.activity for result in results if result.error is None],
+        "left_waitlists": left
+    }
+
+
+class BatchEmails(BaseModel):
+    emails: List[str]
+    mode: Literal["best_effort", "all_or_nothing"] = "best_effort"
+
+
+class BatchItem(BaseModel):
+    activity: str
+    email: str
+
+
+class BatchItems(BaseModel):
+    items: List[BatchItem]
+    mode: Literal["best_effort", "all_or_nothing"] = "best_effort"
+
+
+def _batch_response(results):
+    items = []
+    applied = 0
+    for result in results:
+        item = {"activity": result.activity, "email": result.email}
+        if result.error is None:
+            applied += 1
+            item["status"] = 200
+            item["total_participants"] = result.total
+        else:
+            item["status"] = result.error.status_code
+            item["detail"] = result.error.detail
+        items.append(item)
+    return {"applied": applied, "results": items}
+
+
+async def _signup_many(items, atomic):
+    # Under the lock of every student of the batch, taken in order so that
+    # two batches never wait for each other, as for single signups
+    async with AsyncExitStack() as stack:
+        for email in sorted({email for _, email in items}):
+            await stack.enter_async_context(async_store.student_lock(email))
+        conflicts = await async_store.run(schedule_index.conflicts_many, items)
+        errors = {position: _schedule_conflict(found)
+                  for position, found in enumerate(conflicts) if found}
+        if not errors:
+            return await async_store.signup_many(items, atomic=atomic)
+        if atomic:
+            return [BatchItemResult(activity_name, email, errors.get(position, BatchRejectedError()))
+                    for position, (activity_name, email) in enumerate(items)]
+        results = iter(await async_store.signup_many(
+            [item for position, item in enumerate(items) if position not in errors]))
+        return [BatchItemResult(*item, errors[position]) if position in errors else next(results)
+                for position, item in enumerate(items)]
+
+
+@app.post("/activities/signups:batch")
+async def batch_signup(batch: BatchItems):
+    """Sign up many students to many activities in a single pass
+
+    Items are checked for schedule conflicts, also against the earlier items
+    of the batch, and those that conflict are reported with 409.
+    """
+    results = await _signup_many([(item.activity, item.email) for item in batch.items],
+                                 atomic=batch.mode == "all_or_nothing")
+    return _batch_response(results)
+
+
+@app.post("/activities/removals:batch")
+async def batch_remove(batch: BatchItems):
+    """Remove many students from many activities in a single pass"""
+    results = await async_store.remove_many([(item.activity, item.email) for item in batch.items],
+                                            atomic=batch.mode == "all_or_nothing")
+    return _batch_response(results)
+
+
+@app.post("/activities/{activity_name}/signups:batch")
+async def batch_signup_for_activity(activity_name: str, batch: BatchEmails):
+    """Sign up many students for one activity in a single pass, checking their schedules"""
+    results = await _signup_many([(activity_name, email) for email in batch.emails],
+                                 atomic=batch.mode == "all_or_nothing")
+    return _batch_response(results)
+
+
+@app.post("/activities/{activity_name}/removals:batch")
+async def batch_remove_from_activity(activity_name: str, batch: BatchEmails):
+    """Remove many students from one activity in a single pass"""
+    results = await async_store.remove_many([(activity_name, email) for email in batch.emails],
+                                            atomic=batch.mode == "all_or_nothing")
+    return _batch_response(results)
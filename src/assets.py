@@ -0,0 +1,281 @@
+"""
+Static asset pipeline
+
+At startup every file in ``static/`` is minified, given a fingerprinted name
+containing a hash of its content (``app.3f9c1e2ab4d07c55.js``) and
+precompressed with gzip, and with brotli when the ``brotli`` package is
+installed. ``index.html`` is rewritten to reference the fingerprinted names.
+
+Fingerprinted names never change content, so they are served with
+``Cache-Control: public, max-age=31536000, immutable``; the original names
+stay available with ``no-cache`` and an ETag. Each response uses the smallest
+encoding the client accepts.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field
+
+from .responses import choose_encoding
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are built without it
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+# Minifiers. They only remove comments and whitespace and leave every string,
+# template and regular expression literal untouched, which keeps them safe
+# for the small files of this app without a full parser.
+
+_JS_TIGHT = set("{}()[];,:=<>?!&|*/.%")
+# A "/" after these starts a regular expression; after anything else
+# (a name, a number, ")" or "]") it is a division
+_JS_REGEX_AFTER = set("{}([;,:=<>?!&|*+-%~^")
+_JS_REGEX_KEYWORDS = {"return", "typeof", "instanceof", "in", "of", "new", "delete", "void",
+                      "throw", "case", "do", "else", "yield", "await"}
+
+
+def _skip_quoted(source, position, quote):
+    """Return the index just after the string starting at ``position``"""
+    position += 1
+    while position < len(source):
+        char = source[position]
+        if char == "\\":
+            position += 2
+            continue
+        if char == quote:
+            return position + 1
+        position += 1
+    return position
+
+
+def _skip_template(source, position):
+    """Return the index just after the template literal starting at ``position``"""
+    position += 1
+    while position < len(source):
+        char = source[position]
+        if char == "\\":
+            position += 2
+        elif char == "`":
+            return position + 1
+        elif source.startswith("${", position):
+            position = _skip_code(source, position + 2, closing="}")
+        else:
+            position += 1
+    return position
+
+
+def _skip_code(source, position, closing):
+    """Return the index just after the ``closing`` brace matching the code at ``position``"""
+    depth = 0
+    while position < len(source):
+        char = source[position]
+        if char in "'\"":
+            position = _skip_quoted(source, position, char)
+        elif char == "`":
+            position = _skip_template(source, position)
+        elif char == "{":
+            depth += 1
+            position += 1
+        elif char == closing and depth == 0:
+            return position + 1
+        else:
+            if char == "}":
+                depth -= 1
+            position += 1
+    return position
+
+
+def _skip_regex(source, position):
+    """Return the index just after the regular expression starting at ``position``
+
+    Returns None when no closing "/" is found on the line.
+    """
+    in_class = False
+    position += 1
+    while position < len(source):
+        char = source[position]
+        if char == "\\":
+            position += 2
+            continue
+        if char == "\n":
+            return None
+        if char == "[":
+            in_class = True
+        elif char == "]":
+            in_class = False
+        elif char == "/" and not in_class:
+            return position + 1
+        position += 1
+    return None
+
+
+def _regex_allowed(output):
+    """Whether a "/" following the minified ``output`` starts a regular expression"""
+    # The longest keyword fits in the last chunks, which are mostly single characters
+    tail = "".join(output[-12:]).rstrip()
+    if not tail or tail[-1] in _JS_REGEX_AFTER:
+        return True
+    word = re.search(r"[\w$]+$", tail)
+    return word is not None and word.group() in _JS_REGEX_KEYWORDS
+
+
+def minify_js(source):
+    """Drop comments and collapse whitespace outside strings, templates and regexes
+
+    Line breaks are kept where automatic semicolon insertion may need them.
+    Whether a "/" starts a regular expression is told from what precedes it.
+    """
+    output = []
+    position = 0
+    length = len(source)
+    pending_space = None
+
+    def flush_space(next_char):
+        previous = output[-1][-1] if output else ""
+        if pending_space is None or not previous:
+            return
+        if "\n" in pending_space:
+            if previous in "{[(;," or next_char in ")]}":
+                return
+            output.append("\n")
+        elif previous not in _JS_TIGHT and next_char not in _JS_TIGHT:
+            output.append(" ")
+
+    while position < length:
+        char = source[position]
+        if source.startswith("//", position):
+            end = source.find("\n", position)
+            position = length if end == -1 else end
+            pending_space = (pending_space or "") + "\n"
+            continue
+        if source.startswith("/*", position):
+            end = source.find("*/", position + 2)
+            position = length if end == -1 else end + 2
+            pending_space = (pending_space or "") + " "
+            continue
+        if char.isspace():
+            end = position
+            while end < length and source[end].isspace():
+                end += 1
+            pending_space = (pending_space or "") + source[position:end]
+            position = end
+            continue
+        flush_space(char)
+        pending_space = None
+        if char in "'\"":
+            end = _skip_quoted(source, position, char)
+        elif char == "`":
+            end = _skip_template(source, position)
+        elif char == "/" and _regex_allowed(output):
+            end = _skip_regex(source, position) or position + 1
+        else:
+            end = position + 1
+        output.append(source[position:end])
+        position = end
+    return "".join(output)
+
+
+def minify_css(source):
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.S)
+    source = re.sub(r"\s+", " ", source)
+    # A space before ":" is significant in selectors ("a :hover"), after it is not
+    source = re.sub(r"\s*([{};,>])\s*", r"\1", source)
+    source = re.sub(r":\s+", ":", source)
+    return source.replace(";}", "}").strip()
+
+
+def minify_html(source):
+    source = re.sub(r"<!--.*?-->", "", source, flags=re.S)
+    return re.sub(r"\s+", " ", source).strip()
+
+
+MINIFIERS = {".js": minify_js, ".css": minify_css, ".html": minify_html}
+
+
+def fingerprinted_name(name, content):
+    stem, extension = os.path.splitext(name)
+    digest = hashlib.blake2b(content, digest_size=8).hexdigest()
+    return f"{stem}.{digest}{extension}"
+
+
+def precompress(content):
+    """Return the encoded variants of ``content`` that are smaller than it"""
+    variants = {}
+    gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(gzipped) < len(content):
+        variants["gzip"] = gzipped
+    if brotli is not None:
+        compressed = brotli.compress(content, quality=11)
+        if len(compressed) < len(content):
+            variants["br"] = compressed
+    return variants
+
+
+@dataclass
+class Asset:
+    name: str
+    media_type: str
+    content: bytes
+    etag: str
+    variants: dict = field(default_factory=dict)
+
+    def body(self, accept_encoding):
+        """Return ``(encoding, body)`` for a request's ``Accept-Encoding`` header"""
+        encoding = choose_encoding(accept_encoding, self.variants)
+        if encoding is None:
+            return None, self.content
+        return encoding, self.variants[encoding]
+
+
+class AssetPipeline:
+    """Minified, fingerprinted and precompressed copies of the static files"""
+
+    def __init__(self, directory, minify=True):
+        self.assets = {}
+        self.urls = {}
+        sources = {}
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path):
+                continue
+            with open(path, "rb") as source:
+                content = source.read()
+            minifier = MINIFIERS.get(os.path.splitext(name)[1]) if minify else None
+            if minifier is not None:
+                content = minifier(content.decode("utf-8")).encode("utf-8")
+            sources[name] = content
+
+        # HTML references the other files, so it is fingerprinted last
+        for name, content in sorted(sources.items(), key=lambda item: item[0].endswith(".html")):
+            if name.endswith(".html"):
+                content = self._rewrite_references(content)
+            fingerprinted = fingerprinted_name(name, content)
+            media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if media_type.startswith("text/") or media_type == "application/javascript":
+                media_type += "; charset=utf-8"
+            asset = Asset(name, media_type, content,
+                          '"' + fingerprinted.rsplit(".", 2)[-2] + '"', precompress(content))
+            self.assets[name] = asset
+            self.assets[fingerprinted] = asset
+            self.urls[name] = f"/static/{fingerprinted}"
+
+    def _rewrite_references(self, html):
+        text = html.decode("utf-8")
+        for name, url in self.urls.items():
+            text = re.sub(r'((?:src|href)=")' + re.escape(name) + '"', r"\g<1>" + url + '"', text)
+        return text.encode("utf-8")
+
+    def lookup(self, name):
+        """Return ``(asset, cache_control)`` for a requested file name, or None"""
+        asset = self.assets.get(name)
+        if asset is None:
+            return None
+        return asset, (REVALIDATE if name == asset.name else IMMUTABLE)
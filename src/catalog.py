@@ -0,0 +1,98 @@
+"""
+Activity catalogs: the seed data the store starts from
+
+``load_catalog`` reads a ``.json`` file (an object of activities keyed by
+name, like ``src/activities.json``) into a dict, or opens a packed
+``.catalog`` file. Packed catalogs are built with
+
+    python -m src.catalog activities.json activities.catalog
+
+and are memory-mapped: opening one reads only the activity names and
+offsets, and each activity is decoded from the mapping when it is read. The
+in-memory store never changes a catalog (it copies an activity on its
+first change), so a large catalog costs little until it is used.
+
+Packed layout: a magic line, one JSON document per activity, the JSON
+array of names, the little-endian uint64 offsets of the documents (plus
+the end of the last one), then the offset of the names and the count.
+"""
+
+import array
+import itertools
+import json
+import mmap
+import struct
+import sys
+from collections.abc import Mapping
+
+from .responses import encode_json, orjson
+
+MAGIC = b"MHSCATALOG1\n"
+_TRAILER = struct.Struct("<QQ")
+
+decode_json = orjson.loads if orjson is not None else json.loads
+
+
+class PackedCatalog(Mapping):
+    """Read-only mapping of activity names to details, decoded on access"""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a packed activity catalog")
+        names_offset, count = _TRAILER.unpack_from(self._map, len(self._map) - _TRAILER.size)
+        offsets_start = len(self._map) - _TRAILER.size - (count + 1) * 8
+        self._offsets = array.array("Q", self._map[offsets_start:len(self._map) - _TRAILER.size])
+        if sys.byteorder == "big":
+            self._offsets.byteswap()
+        names = decode_json(self._map[names_offset:offsets_start])
+        self._positions = dict(zip(names, itertools.count()))
+
+    def __getitem__(self, name):
+        position = self._positions[name]
+        return decode_json(self._map[self._offsets[position]:self._offsets[position + 1]])
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def __iter__(self):
+        return iter(self._positions)
+
+    def __len__(self):
+        return len(self._positions)
+
+
+def write_catalog(activities, path):
+    """Write ``activities`` (name -> details) as a packed catalog"""
+    offsets = array.array("Q")
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+        for details in activities.values():
+            offsets.append(file.tell())
+            file.write(encode_json(details))
+        names_offset = file.tell()
+        offsets.append(names_offset)
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        file.write(encode_json(list(activities)))
+        file.write(offsets.tobytes())
+        file.write(_TRAILER.pack(names_offset, len(activities)))
+
+
+def load_catalog(path):
+    """Return the activities of a ``.json`` file or a packed ``.catalog`` file"""
+    if str(path).endswith(".catalog"):
+        return PackedCatalog(path)
+    with open(path, "rb") as file:
+        return decode_json(file.read())
+
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python -m src.catalog activities.json activities.catalog")
+    write_catalog(load_catalog(sys.argv[1]), sys.argv[2])
+
+
+if __name__ == "__main__":
+    main()
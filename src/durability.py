@@ -0,0 +1,319 @@
+"""
+Write-ahead log for the in-memory store
+
+With ``ACTIVITY_LOG_DIR`` set, every signup and removal is appended to an
+NDJSON log before the API acknowledges it, and the in-memory activities are
+rebuilt from the latest snapshot plus the log tail at startup.
+
+Files in the log directory:
+
+- ``snapshot.json``: ``{"version": v, "activities": {...}}``, replaced atomically
+- ``log-<n>.ndjson``: one ``[version, op, activity, email]`` per line, where
+  ``op`` is ``s`` (signup), ``r`` (removal), ``w`` (joined the waitlist),
+  ``u`` (left it) or ``p`` (promoted from the waitlist)
+
+A single writer thread drains the pending mutations, writes them and calls
+fsync once for the whole group (group commit), so concurrent requests share
+the cost of a sync. With ``group_commit=False`` every record is synced on its
+own. Once a segment holds ``snapshot_every`` records, the writer starts a new
+segment, writes a snapshot and deletes the older segments. Snapshots are
+taken while requests keep running, so replay skips records the snapshot
+already contains and applies the rest idempotently.
+
+If the writer cannot write (disk full, I/O error), it stops: every request
+waiting for durability, and every later one, fails with ``MutationLogError``
+(503), and ``error`` holds the cause, which ``/metrics`` reports.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+
+from .store import ActivityStoreError
+
+SNAPSHOT_FILE = "snapshot.json"
+OPS = {"signup": "s", "remove": "r", "waitlist": "w", "unwaitlist": "u", "promote": "p"}
+
+logger = logging.getLogger(__name__)
+
+
+class MutationLogError(ActivityStoreError):
+    status_code = 503
+    detail = "Changes can no longer be written to the write-ahead log"
+
+
+def _fsync_directory(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _read_records(path, chunk_lines=65536):
+    """Yield the records of a log segment, stopping at a torn final record
+
+    Lines are decoded a chunk at a time as one JSON array, which is much
+    faster than one ``json.loads`` call per line.
+    """
+    with open(path, encoding="utf-8") as segment:
+        while True:
+            lines = list(itertools.islice(segment, chunk_lines))
+            if not lines:
+                return
+            try:
+                records = json.loads("[" + ",".join(lines) + "]")
+            except ValueError:
+                # Torn write at the end of the log after a crash
+                for line in lines:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        return
+                    yield record
+                return
+            yield from records
+
+
+class MutationLog:
+    """Durable, group-committed log of store mutations"""
+
+    def __init__(self, directory, group_commit=True, snapshot_every=1_000_000):
+        self.directory = directory
+        self.group_commit = group_commit
+        self.snapshot_every = snapshot_every
+        self.store = None
+        os.makedirs(directory, exist_ok=True)
+        self._cond = threading.Condition()
+        self._pending = []
+        self._waiters = []
+        self._waiter_ids = itertools.count()
+        self._durable = 0
+        self._closing = False
+        # The exception that stopped the writer thread, if any
+        self.error = None
+        self._segment = None
+        self._segment_number = 0
+        self._segment_records = 0
+        self._thread = None
+
+    # Recovery
+
+    def _segments(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith("log-") and name.endswith(".ndjson"):
+                numbers.append(int(name[4:-7]))
+        return [os.path.join(self.directory, f"log-{n}.ndjson") for n in sorted(numbers)]
+
+    def recover(self, store):
+        """Rebuild ``store`` from the snapshot and log; return the number of replayed records
+
+        Only stores with a ``restore`` method (the in-memory store) can be
+        rebuilt; others raise ``TypeError`` before anything is read.
+        """
+        if not hasattr(store, "restore"):
+            raise TypeError(f"{type(store).__name__} cannot be restored from a write-ahead log")
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if not os.path.exists(snapshot_path):
+            return 0
+        with open(snapshot_path, encoding="utf-8") as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        version = snapshot_version = snapshot["version"]
+        activities = snapshot["activities"]
+        for details in activities.values():
+            details["participants"] = dict.fromkeys(details["participants"])
+            details["waitlist"] = dict.fromkeys(details.get("waitlist", ()))
+
+        replayed = 0
+        for path in self._segments():
+            for record_version, op, activity_name, email in _read_records(path):
+                if record_version <= snapshot_version:
+                    continue
+                details = activities.get(activity_name)
+                if details is not None:
+                    if op in ("s", "p"):
+                        details["participants"][email] = None
+                        details["waitlist"].pop(email, None)
+                    elif op == "r":
+                        details["participants"].pop(email, None)
+                    elif op == "w":
+                        details["waitlist"][email] = None
+                    else:
+                        details["waitlist"].pop(email, None)
+                version = max(version, record_version)
+                replayed += 1
+
+        for details in activities.values():
+            details["participants"] = list(details["participants"])
+            details["waitlist"] = list(details["waitlist"])
+        store.restore(activities, version)
+        return replayed
+
+    # Writing
+
+    def start(self, store):
+        """Begin logging the mutations of ``store``"""
+        self.store = store
+        self._durable = store.version()
+        self._segment_number = max(
+            [int(os.path.basename(path)[4:-7]) for path in self._segments()], default=0)
+        # A fresh snapshot makes the existing log redundant and compacts it
+        self._snapshot()
+        store.subscribe(self.append)
+        self._thread = threading.Thread(target=self._run, name="mutation-log", daemon=True)
+        self._thread.start()
+
+    def append(self, mutation):
+        """Store listener: queue a mutation for the writer thread"""
+        with self._cond:
+            if self.error is None:
+                self._pending.append(mutation)
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                batch, self._pending = self._pending, []
+                closing = self._closing
+            if batch:
+                try:
+                    self._write(batch)
+                except OSError as error:
+                    self._fail(error)
+                    return
+            if closing and not batch:
+                return
+
+    def _fail(self, error):
+        logger.error("Write-ahead log stopped, changes are no longer durable", exc_info=error)
+        with self._cond:
+            self.error = error
+            self._pending = []
+            waiters, self._waiters = self._waiters, []
+        # Woken without their version being durable, the waiters raise
+        for _, _, wake in waiters:
+            wake()
+
+    def _write(self, batch):
+        for mutation in batch:
+            if mutation.kind == "load":
+                # The data was replaced wholesale: only a snapshot can record it
+                self._sync()
+                self._snapshot()
+                self._mark_durable(mutation.version)
+                continue
+            line = json.dumps([mutation.version, OPS[mutation.kind], mutation.activity,
+                               mutation.email], ensure_ascii=False)
+            self._segment.write(line.encode("utf-8") + b"\n")
+            self._segment_records += 1
+            if not self.group_commit:
+                self._sync()
+                self._mark_durable(mutation.version)
+        if self.group_commit:
+            self._sync()
+            self._mark_durable(batch[-1].version)
+        if self._segment_records >= self.snapshot_every:
+            self._snapshot()
+
+    def _sync(self):
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+
+    def _open_segment(self):
+        if self._segment is not None:
+            self._sync()
+            self._segment.close()
+        self._segment_number += 1
+        path = os.path.join(self.directory, f"log-{self._segment_number}.ndjson")
+        self._segment = open(path, "ab")
+        self._segment_records = 0
+        _fsync_directory(self.directory)
+
+    def _snapshot(self):
+        """Start a new segment, write a snapshot and drop the segments it covers"""
+        old_segments = self._segments()
+        self._open_segment()
+        # Everything written to the old segments happened before this version
+        version, activities = self.store.snapshot()
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as snapshot_file:
+            json.dump({"version": version, "activities": activities}, snapshot_file,
+                      ensure_ascii=False)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(tmp_path, path)
+        _fsync_directory(self.directory)
+        for segment in old_segments:
+            os.remove(segment)
+
+    # Waiting for durability
+
+    def _mark_durable(self, version):
+        with self._cond:
+            self._durable = max(self._durable, version)
+            while self._waiters and self._waiters[0][0] <= self._durable:
+                _, _, wake = heapq.heappop(self._waiters)
+                wake()
+
+    def _add_waiter(self, version, wake):
+        with self._cond:
+            if self._durable >= version:
+                return False
+            self._check()
+            heapq.heappush(self._waiters, (version, next(self._waiter_ids), wake))
+            return True
+
+    def _check(self):
+        if self.error is not None:
+            raise MutationLogError() from self.error
+
+    def wait_durable(self, version, timeout=None):
+        """Block until every mutation up to ``version`` is on disk
+
+        Raises ``MutationLogError`` if the writer stopped before that.
+        """
+        event = threading.Event()
+        if self._add_waiter(version, event.set):
+            woken = event.wait(timeout)
+            if woken and self._durable < version:
+                self._check()
+            return woken
+        return True
+
+    async def wait_durable_async(self, version):
+        """Wait, without blocking the event loop, until ``version`` is on disk"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        if self._add_waiter(version, wake):
+            await future
+            if self._durable < version:
+                self._check()
+
+    def close(self):
+        """Write out pending mutations and stop the writer thread"""
+        if self._thread is None:
+            return
+        if self.store is not None:
+            self.store.unsubscribe(self.append)
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join()
+        self._thread = None
+        try:
+            self._segment.close()
+        except OSError:
+            # Unwritten records of a failed log are lost either way
+            pass
@@ -0,0 +1,102 @@
+"""
+Server-Sent Events for roster changes
+
+``EventBroker`` listens to store mutations and fans them out to every
+connected ``GET /activities/events`` client as small delta events, so
+browsers can update a single activity instead of re-fetching everything.
+
+Mutations happen in worker threads, so they are handed to the event loop
+with ``call_soon_threadsafe`` and fanned out there. Each client has a
+bounded queue; a client that falls too far behind is dropped and told to
+``reset`` (re-fetch the full list) rather than slowing everybody down.
+"""
+
+import asyncio
+import json
+from collections import deque
+
+# Waitlist joins and departures change no roster, so they are not sent
+EVENT_NAMES = {"signup": "signup", "remove": "removed", "promote": "promoted", "load": "reset"}
+
+
+def format_event(mutation):
+    """Encode a store mutation as an SSE message"""
+    if mutation.kind == "load":
+        data = {}
+    else:
+        data = {
+            "activity": mutation.activity,
+            "email": mutation.email,
+            "participant_count": mutation.total,
+            "spots_left": mutation.max_participants - mutation.total,
+        }
+    return (f"id: {mutation.version}\n"
+            f"event: {EVENT_NAMES[mutation.kind]}\n"
+            f"data: {json.dumps(data, ensure_ascii=False)}\n\n")
+
+
+class _Client:
+    __slots__ = ("queue", "wakeup", "dropped")
+
+    def __init__(self):
+        self.queue = deque()
+        self.wakeup = asyncio.Event()
+        self.dropped = False
+
+
+class EventBroker:
+    """In-process pub/sub fan-out of store mutations to SSE clients"""
+
+    def __init__(self, store, max_queue=256, keepalive=15.0):
+        self.max_queue = max_queue
+        self.keepalive = keepalive
+        self.clients = set()
+        self._loop = None
+        store.subscribe(self.publish)
+
+    def publish(self, mutation):
+        """Store listener: queue the encoded event for every client"""
+        loop = self._loop
+        if loop is None or not self.clients or mutation.kind not in EVENT_NAMES:
+            return
+        try:
+            loop.call_soon_threadsafe(self._fan_out, format_event(mutation))
+        except RuntimeError:
+            # The event loop is closed, e.g. after the test client shut down
+            self._loop = None
+
+    def _fan_out(self, message):
+        for client in list(self.clients):
+            if len(client.queue) >= self.max_queue:
+                # Slow consumer: drop it instead of buffering without bound
+                client.dropped = True
+                self.clients.discard(client)
+            else:
+                client.queue.append(message)
+            client.wakeup.set()
+
+    def _subscribe(self):
+        self._loop = asyncio.get_running_loop()
+        client = _Client()
+        self.clients.add(client)
+        return client
+
+    async def stream(self):
+        """Yield SSE messages for one client until it disconnects or is dropped"""
+        client = self._subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    await asyncio.wait_for(client.wakeup.wait(), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                client.wakeup.clear()
+                while client.queue:
+                    yield client.queue.popleft()
+                if client.dropped:
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+        finally:
+            self.clients.discard(client)
@@ -0,0 +1,329 @@
+"""
+Audit log of every change, with point-in-time rosters
+
+``AuditLog`` listens to store mutations and records each one as an
+immutable event: its store version, time, kind, activity, student and the
+address of the client whose request made it. Events are kept in columns
+(``array`` objects, with activity names, emails and client addresses
+interned), about 30 bytes an event, plus the event rows of each activity.
+
+Rosters in the past are rebuilt forward from the activities the store was
+loaded with (the seed catalog, which the in-memory store never changes).
+Replays leave a checkpoint of the roster every ``checkpoint_every`` events
+of the activity, so reading a roster ``as_of`` some moment replays at most
+that many events from the nearest checkpoint before it, instead of the
+whole history.
+
+When the activities of a load are not known (the log started after the
+store changed, or another worker reloaded a shared SQLite database), the
+log reads the store and replays later events idempotently. Rosters older
+than that read can then only be rebuilt for activities that did not
+change in between.
+
+Client addresses are only recorded for the in-memory store, whose
+listeners run within the request making the change: listeners of the
+SQLite store also receive the changes of every other worker.
+"""
+
+import array
+import bisect
+import contextvars
+import operator
+import threading
+import time
+from datetime import datetime, timezone
+
+from .listing import InvalidQueryError
+from .store import ActivityNotFoundError, ActivityStoreError
+
+KINDS = ("signup", "remove", "waitlist", "unwaitlist", "promote", "load")
+SIGNUP, REMOVE, WAITLIST, UNWAITLIST, PROMOTE, LOAD = range(len(KINDS))
+CHECKPOINT_EVERY = 64
+MAX_LIMIT = 1000
+
+# Address of the client whose request is being served, set by ClientMiddleware
+current_client = contextvars.ContextVar("current_client", default=None)
+
+
+class HistoryUnavailableError(ActivityStoreError):
+    status_code = 404
+    detail = "No history recorded that far back"
+
+
+class ClientMiddleware:
+    """Pure ASGI middleware exposing the client address of each request to the audit log"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        client = scope.get("client")
+        token = current_client.set(client[0] if client else None)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_client.reset(token)
+
+
+def format_time(timestamp):
+    return (datetime.fromtimestamp(timestamp, timezone.utc)
+            .isoformat(timespec="milliseconds").replace("+00:00", "Z"))
+
+
+def parse_as_of(value):
+    """Return a store version (an int) or an aware datetime for an ``as_of`` value
+
+    Times without a UTC offset are taken as UTC.
+    """
+    if value.isdigit():
+        return int(value)
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidQueryError("Invalid as_of: expected an ISO 8601 time or a version") from None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+class _Strings:
+    """Strings numbered in order of first appearance"""
+
+    __slots__ = ("ids", "values")
+
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def intern(self, value):
+        if value is None:
+            return -1
+        number = self.ids.get(value)
+        if number is None:
+            number = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return number
+
+    def value(self, number):
+        return self.values[number] if number >= 0 else None
+
+
+class _Epoch:
+    """Events from one load of the store to the next
+
+    ``activities`` are the activities (name -> details with an optional
+    ``waitlist``) as of ``base_version``, or None until read from the store.
+    """
+
+    __slots__ = ("version", "time", "base_version", "activities")
+
+    def __init__(self, version, time, activities):
+        self.version = version
+        self.time = time
+        self.base_version = version
+        self.activities = activities
+
+
+class AuditLog:
+    """Columnar in-memory log of store mutations, with point-in-time rosters"""
+
+    def __init__(self, store, checkpoint_every=CHECKPOINT_EVERY, clock=time.time):
+        self.store = store
+        self.checkpoint_every = checkpoint_every
+        self.clock = clock
+        self.versions = array.array("q")
+        self.times = array.array("d")
+        self.kinds = array.array("b")
+        self.activities = array.array("i")
+        self.emails = array.array("i")
+        self.clients = array.array("i")
+        self._names = _Strings()
+        self._emails = _Strings()
+        self._clients = _Strings()
+        # Activity number -> rows of its events, and its checkpoints as
+        # (position, participants, waitlist): the roster after rows[:position]
+        self._rows = {}
+        self._checkpoints = {}
+        self._record_clients = not store.blocking
+        # Held while appending, which happens under the store's locks, so
+        # replays and reads of the store use their own lock
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        with self._lock:
+            store.subscribe(self.record)
+            version = store.version()
+            self.epochs = [_Epoch(version, clock(), store.loaded_activities(version))]
+        self._base(self.epochs[0])
+
+    def record(self, mutation):
+        """Store listener: append the mutation as an event"""
+        client = current_client.get() if self._record_clients else None
+        with self._lock:
+            now = self.clock()
+            if self.times and now < self.times[-1]:
+                # Keep times sorted even if the wall clock steps back
+                now = self.times[-1]
+            row = len(self.versions)
+            self.versions.append(mutation.version)
+            self.times.append(now)
+            self.kinds.append(KINDS.index(mutation.kind))
+            activity = self._names.intern(mutation.activity)
+            self.activities.append(activity)
+            self.emails.append(self._emails.intern(mutation.email))
+            self.clients.append(self._clients.intern(client))
+            if mutation.kind == "load":
+                self.epochs.append(_Epoch(mutation.version, now,
+                                          self.store.loaded_activities(mutation.version)))
+                return
+            rows = self._rows.get(activity)
+            if rows is None:
+                rows = self._rows[activity] = array.array("I")
+            rows.append(row)
+
+    def _activity_rows(self, activity_name):
+        # Rows are only appended: reading the first ``count`` needs no lock
+        with self._lock:
+            rows = self._rows.get(self._names.ids.get(activity_name))
+            return rows, len(rows) if rows is not None else 0
+
+    def events(self, activity_name, after=0, limit=100):
+        """Return up to ``limit`` events of an activity after version ``after``, oldest first
+
+        Also returns whether more events follow.
+        """
+        rows, count = self._activity_rows(activity_name)
+        if rows is None:
+            return [], False
+        start = bisect.bisect_right(rows, after, 0, count, key=self.versions.__getitem__)
+        end = min(count, start + limit)
+        events = []
+        for row in rows[start:end]:
+            events.append({
+                "version": self.versions[row],
+                "time": format_time(self.times[row]),
+                "event": KINDS[self.kinds[row]],
+                "email": self._emails.value(self.emails[row]),
+                "client": self._clients.value(self.clients[row]),
+            })
+        return events, end < count
+
+    def version_at(self, moment):
+        """Return the store version at ``moment``, an aware datetime"""
+        timestamp = moment.timestamp()
+        with self._lock:
+            first = self.epochs[0]
+            count = len(self.times)
+        if timestamp < first.time:
+            raise HistoryUnavailableError(f"History starts at {format_time(first.time)}")
+        position = bisect.bisect_right(self.times, timestamp, 0, count)
+        return max(first.version, self.versions[position - 1] if position else first.version)
+
+    def roster(self, activity_name, version):
+        """Return the participants and waitlist of an activity right after ``version``
+
+        Raises ``ActivityNotFoundError`` when the activity did not exist then.
+        """
+        with self._lock:
+            index = bisect.bisect_right(self.epochs, version,
+                                        key=operator.attrgetter("version")) - 1
+            if index < 0:
+                raise HistoryUnavailableError(
+                    f"History starts at version {self.epochs[0].version}")
+            epoch = self.epochs[index]
+        activities = self._base(epoch)
+        details = activities.get(activity_name)
+        if details is None:
+            raise ActivityNotFoundError()
+        rows, count = self._activity_rows(activity_name)
+        participants = details["participants"]
+        waitlist = details.get("waitlist", ())
+        if rows is None:
+            return list(participants), list(waitlist)
+        key = self.versions.__getitem__
+        start = bisect.bisect_right(rows, epoch.base_version, 0, count, key=key)
+        end = bisect.bisect_right(rows, version, 0, count, key=key)
+        if end < start:
+            # Before the activities were read, and the activity changed since
+            raise HistoryUnavailableError(
+                f"History of {activity_name} starts at version {epoch.base_version}")
+        return self._replay(self._names.ids[activity_name], rows, start, end,
+                            participants, waitlist)
+
+    def _base(self, epoch):
+        if epoch.activities is not None:
+            return epoch.activities
+        with self._replay_lock:
+            if epoch.activities is None:
+                # The events after the snapshot version are replayed idempotently
+                version, activities = self.store.snapshot()
+                with self._lock:
+                    if self.epochs[-1] is not epoch:
+                        # Reloaded since: that epoch is gone from the store
+                        raise HistoryUnavailableError()
+                    epoch.base_version = version
+                    epoch.activities = activities
+        return epoch.activities
+
+    def _replay(self, activity, rows, start, end, participants, waitlist):
+        emails = self._emails.values
+        with self._replay_lock:
+            checkpoints = self._checkpoints.setdefault(activity, [])
+            index = bisect.bisect_right(checkpoints, end, key=operator.itemgetter(0)) - 1
+            # Checkpoints up to ``start`` belong to an earlier epoch
+            if index >= 0 and checkpoints[index][0] > start:
+                start, participants, waitlist = checkpoints[index]
+                index += 1
+            else:
+                index = bisect.bisect_right(checkpoints, start, key=operator.itemgetter(0))
+            participants = dict.fromkeys(participants)
+            waitlist = dict.fromkeys(waitlist)
+            for position in range(start, end):
+                row = rows[position]
+                kind = self.kinds[row]
+                email = emails[self.emails[row]]
+                if kind == SIGNUP or kind == PROMOTE:
+                    participants[email] = None
+                    waitlist.pop(email, None)
+                elif kind == REMOVE:
+                    participants.pop(email, None)
+                elif kind == WAITLIST:
+                    waitlist[email] = None
+                else:
+                    waitlist.pop(email, None)
+                if (position + 1) % self.checkpoint_every == 0:
+                    checkpoints.insert(index, (position + 1, tuple(participants),
+                                               tuple(waitlist)))
+                    index += 1
+        return list(participants), list(waitlist)
+
+
+def activity_history(store, log, activity_name, as_of=None, after=0, limit=100):
+    """Return the events of an activity, or its roster ``as_of`` a time or version
+
+    Events come as ``{"activity": ..., "events": [...], "next_after": ...}``,
+    where ``next_after`` is the ``after`` of the next page (None on the last
+    one). With ``as_of`` the result is ``{"activity": ..., "as_of": ...,
+    "version": ..., "participants": [...], "waitlist": [...]}``.
+    """
+    if as_of is not None:
+        moment = parse_as_of(as_of)
+        if isinstance(moment, int):
+            version = moment
+            if version > store.version():
+                raise InvalidQueryError("Invalid as_of: version not reached yet")
+        else:
+            version = log.version_at(moment)
+        participants, waitlist = log.roster(activity_name, version)
+        return {"activity": activity_name, "as_of": as_of, "version": version,
+                "participants": participants, "waitlist": waitlist}
+
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidQueryError(f"limit must be between 1 and {MAX_LIMIT}")
+    events, has_more = log.events(activity_name, after, limit)
+    if not events and not store.get_many([activity_name], include_participants=False):
+        raise ActivityNotFoundError()
+    return {"activity": activity_name, "events": events,
+            "next_after": events[-1]["version"] if has_more else None}
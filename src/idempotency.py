@@ -0,0 +1,127 @@
+"""
+Idempotency keys for signup and removal
+
+Clients that retry a mutation send the same ``Idempotency-Key`` header with
+every attempt. The first attempt runs and its outcome (successes and domain
+errors alike) is stored; later attempts get the stored response, marked with
+``Idempotent-Replayed: true``, without touching the roster. Attempts arriving
+while the first one is still running wait for it instead of running again.
+
+Outcomes are kept in insertion order, which with a single TTL is also expiry
+order: expired entries are dropped from the front and, when ``max_entries``
+is reached, the oldest entry is evicted. Memory stays bounded by
+``max_entries`` whatever the number of keys per day.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from .responses import encode_json
+
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class _Outcome:
+    __slots__ = ("fingerprint", "status_code", "body", "expires")
+
+    def __init__(self, fingerprint, status_code, body, expires):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.body = body
+        self.expires = expires
+
+    def response(self, replayed):
+        headers = {REPLAYED_HEADER: "true"} if replayed else None
+        return Response(content=self.body, status_code=self.status_code,
+                        media_type="application/json", headers=headers)
+
+
+class IdempotencyCache:
+    """Bounded TTL cache of mutation outcomes, with in-flight coalescing
+
+    Runs on the event loop: lookups, inserts and evictions need no lock.
+    """
+
+    def __init__(self, max_entries=100_000, ttl=86400.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._outcomes = OrderedDict()
+        self._in_flight = {}
+        self.replayed = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._outcomes)
+
+    def _expire(self, now):
+        outcomes = self._outcomes
+        while outcomes:
+            key, outcome = next(iter(outcomes.items()))
+            if outcome.expires > now:
+                break
+            del outcomes[key]
+
+    def _store(self, key, outcome):
+        self._outcomes[key] = outcome
+        while len(self._outcomes) > self.max_entries:
+            self._outcomes.popitem(last=False)
+
+    @staticmethod
+    def _check(fingerprint, stored):
+        if stored != fingerprint:
+            raise HTTPException(status_code=422,
+                                detail="Idempotency-Key was already used for another request")
+
+    async def run(self, key, fingerprint, func, *args):
+        """Return the response of ``await func(*args)``, at most once per ``key``
+
+        ``fingerprint`` identifies the request; reusing a key for a different
+        request is rejected with 422. ``func`` returns the JSON content of a
+        200 response or raises ``HTTPException``. Without a key ``func`` just
+        runs.
+        """
+        if key is None:
+            return await func(*args)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400,
+                                detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+        while True:
+            self._expire(self.clock())
+            outcome = self._outcomes.get(key)
+            if outcome is not None:
+                self._check(fingerprint, outcome.fingerprint)
+                self.replayed += 1
+                return outcome.response(replayed=True)
+            pending = self._in_flight.get(key)
+            if pending is None:
+                break
+            self._check(fingerprint, pending[0])
+            self.coalesced += 1
+            # None means the first attempt failed without an outcome: retry
+            outcome = await asyncio.shield(pending[1])
+            if outcome is not None:
+                return outcome.response(replayed=True)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (fingerprint, future)
+        outcome = None
+        try:
+            try:
+                status_code, content = 200, await func(*args)
+            except HTTPException as error:
+                status_code, content = error.status_code, {"detail": error.detail}
+            # orjson over-allocates small outputs; keep an exact-size copy
+            body = bytes(memoryview(encode_json(content)))
+            outcome = _Outcome(fingerprint, status_code, body, self.clock() + self.ttl)
+            self._store(key, outcome)
+        finally:
+            # Unexpected errors and cancellations are not stored
+            del self._in_flight[key]
+            future.set_result(outcome)
+        return outcome.response(replayed=False)
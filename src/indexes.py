@@ -0,0 +1,326 @@
+"""
+In-process indexes derived from the activity store
+
+Indexes subscribe to store mutations and update themselves incrementally.
+Changes made by other workers sharing a SQLite database reach them through
+the store's change feed. When they still miss a change (the store was
+reloaded, or the feed was pruned) they notice that the store version moved
+on and rebuild from a full read on their next use.
+"""
+
+import bisect
+import threading
+from abc import ABC, abstractmethod
+
+from .schedule import parse_days, parse_meetings
+
+
+class DerivedIndex(ABC):
+    """Base class for indexes kept up to date from store mutations
+
+    Subclasses implement ``rebuild(activities)`` from a ``get_all()`` dict and
+    ``apply(mutation)`` for a single signup or removal. Those setting
+    ``with_waitlists`` also find the waitlist of each activity that has one
+    under a ``"waitlist"`` key.
+    """
+
+    with_waitlists = False
+
+    def __init__(self, store):
+        self.store = store
+        self.version = None
+        self._lock = threading.RLock()
+        store.subscribe(self._on_mutation)
+
+    def _on_mutation(self, mutation):
+        with self._lock:
+            if self.version is None:
+                return
+            if mutation.version <= self.version:
+                # Already in the data the index was rebuilt from
+                return
+            if mutation.kind != "load" and mutation.version == self.version + 1:
+                self.apply(mutation)
+                self.version = mutation.version
+            else:
+                # Missed a change: rebuild on next use
+                self.version = None
+
+    def _read(self):
+        if self.with_waitlists:
+            return self.store.snapshot()
+        return self.store.version(), self.store.get_all()
+
+    def ensure_current(self):
+        """Bring the index up to date with the store
+
+        The store is read without the index lock, which writers wait for
+        while they notify the index, and the data is only used if the store
+        version did not move while it was read: a change made meanwhile
+        could be missing from it or be applied to it a second time, so it
+        is read again.
+        """
+        if self.version == self.store.version():
+            return
+        # Changes from other processes can usually be applied one by one
+        self.store.catch_up()
+        while True:
+            with self._lock:
+                if self.version == self.store.version():
+                    return
+            version, activities = self._read()
+            with self._lock:
+                # Changes after ``version`` are applied once the lock is released
+                if self.store.version() == version:
+                    if self.version != version:
+                        self.rebuild(activities)
+                        self.version = version
+                    return
+
+    @abstractmethod
+    def rebuild(self, activities):
+        """Replace the index with one built from every activity"""
+
+    @abstractmethod
+    def apply(self, mutation):
+        """Update the index for one change"""
+
+
+class ActivityIndex(DerivedIndex):
+    """Sorted names, day-of-week and free-seat indexes for listing queries"""
+
+    def rebuild(self, activities):
+        self.names = sorted(activities)
+        self.by_day = {}
+        self.with_free_seats = set()
+        self.full = set()
+        parsed = {}
+        for name in self.names:
+            details = activities[name]
+            schedule = details["schedule"]
+            days = parsed.get(schedule)
+            if days is None:
+                days = parsed[schedule] = parse_days(schedule)
+            for day in days:
+                self.by_day.setdefault(day, []).append(name)
+            if len(details["participants"]) < details["max_participants"]:
+                self.with_free_seats.add(name)
+            else:
+                self.full.add(name)
+
+    def apply(self, mutation):
+        if mutation.total < mutation.max_participants:
+            self.with_free_seats.add(mutation.activity)
+            self.full.discard(mutation.activity)
+        else:
+            self.full.add(mutation.activity)
+            self.with_free_seats.discard(mutation.activity)
+
+    def query(self, limit, after=None, prefix=None, day=None, has_free_seats=None,
+              within=None):
+        """Return up to ``limit`` matching names sorted by name, and whether more follow
+
+        The sorted name list (or the sorted list of activities held on
+        ``day``, or the sorted names given as ``within``) is entered with
+        bisect at the cursor or prefix, and the free-seat filter is a set
+        lookup, so only the page is visited.
+        """
+        self.ensure_current()
+        with self._lock:
+            if within is not None:
+                names = within
+            else:
+                names = self.names if day is None else self.by_day.get(day, [])
+            seats = None
+            if has_free_seats is not None:
+                seats = self.with_free_seats if has_free_seats else self.full
+            start = 0
+            if after is not None:
+                start = bisect.bisect_right(names, after)
+            if prefix:
+                start = max(start, bisect.bisect_left(names, prefix))
+            page = []
+            for position in range(start, len(names)):
+                name = names[position]
+                if prefix and not name.startswith(prefix):
+                    return page, False
+                if seats is not None and name not in seats:
+                    continue
+                if len(page) == limit:
+                    return page, True
+                page.append(name)
+            return page, False
+
+
+class StudentIndex(DerivedIndex):
+    """Activities and waitlists of each student, by email
+
+    A lookup is a dict access plus a sort of that student's own activities,
+    whatever the number of activities.
+    """
+
+    with_waitlists = True
+
+    def rebuild(self, activities):
+        self.activities = {}
+        self.waitlists = {}
+        for name, details in activities.items():
+            for email in details["participants"]:
+                self.activities.setdefault(email, set()).add(name)
+            for email in details.get("waitlist", ()):
+                self.waitlists.setdefault(email, set()).add(name)
+
+    @staticmethod
+    def _add(index, email, name):
+        index.setdefault(email, set()).add(name)
+
+    @staticmethod
+    def _discard(index, email, name):
+        names = index.get(email)
+        if names is not None:
+            names.discard(name)
+            if not names:
+                del index[email]
+
+    def apply(self, mutation):
+        kind, email, name = mutation.kind, mutation.email, mutation.activity
+        if kind in ("signup", "promote"):
+            self._add(self.activities, email, name)
+            self._discard(self.waitlists, email, name)
+        elif kind == "remove":
+            self._discard(self.activities, email, name)
+        elif kind == "waitlist":
+            self._add(self.waitlists, email, name)
+        elif kind == "unwaitlist":
+            self._discard(self.waitlists, email, name)
+
+    def lookup(self, email):
+        """Return ``(activities, waitlists)`` of ``email`` as sorted lists of names"""
+        self.ensure_current()
+        with self._lock:
+            return (sorted(self.activities.get(email, ())),
+                    sorted(self.waitlists.get(email, ())))
+
+
+class ScheduleIndex(DerivedIndex):
+    """Weekly meetings of every activity, and busy times of every student
+
+    Meetings are ``(start, end)`` minutes since Monday 00:00 from
+    ``parse_meetings``. They sit in one timeline sorted by start, and each
+    student has a sorted list of the meetings of their activities and of
+    the waitlists they are on, as a waitlisted student may be promoted
+    into their seat at any time. As no
+    meeting lasts longer than ``longest``, the meetings overlapping a time
+    all start less than ``longest`` before it: overlaps are found by
+    bisecting and scanning that stretch only, never by comparing every pair.
+    """
+
+    with_waitlists = True
+
+    def rebuild(self, activities):
+        # Catalogs reuse a few schedules: parse each once
+        parsed = {}
+        self.meetings = {}
+        self.busy = {}
+        timeline = []
+        for name, details in activities.items():
+            schedule = details["schedule"]
+            meetings = parsed.get(schedule)
+            if meetings is None:
+                meetings = parsed[schedule] = parse_meetings(schedule)
+            self.meetings[name] = meetings
+            if meetings:
+                entries = tuple((start, end, name) for start, end in meetings)
+                timeline.extend(entries)
+                for email in (*details["participants"], *details.get("waitlist", ())):
+                    busy = self.busy.get(email)
+                    if busy is None:
+                        self.busy[email] = list(entries)
+                    else:
+                        busy.extend(entries)
+        for busy in self.busy.values():
+            if len(busy) > 1:
+                busy.sort()
+        timeline.sort()
+        self.timeline = timeline
+        self.longest = max((end - start for meetings in parsed.values()
+                            for start, end in meetings), default=0)
+
+    def apply(self, mutation):
+        # A promotion keeps the meetings the student had from the waitlist
+        if mutation.kind == "promote":
+            return
+        meetings = self.meetings.get(mutation.activity, ())
+        if not meetings:
+            return
+        busy = self.busy.setdefault(mutation.email, [])
+        for start, end in meetings:
+            entry = (start, end, mutation.activity)
+            position = bisect.bisect_left(busy, entry)
+            present = position < len(busy) and busy[position] == entry
+            if mutation.kind in ("remove", "unwaitlist"):
+                if present:
+                    del busy[position]
+            elif not present:
+                busy.insert(position, entry)
+        if not busy:
+            del self.busy[mutation.email]
+
+    def _overlapping(self, entries, start, end):
+        """Yield the entries of a sorted list overlapping ``[start, end)``"""
+        position = bisect.bisect_right(entries, (start - self.longest,))
+        while position < len(entries) and entries[position][0] < end:
+            if entries[position][1] > start:
+                yield entries[position]
+            position += 1
+
+    def conflicts(self, activity_name, email):
+        """Return the sorted names of activities of ``email`` meeting at the same time
+
+        Activities whose waitlist the student is on count as theirs.
+        """
+        return self.conflicts_many([(activity_name, email)])[0]
+
+    def conflicts_many(self, items):
+        """Return the conflicts of each ``(activity_name, email)`` of a batch
+
+        Each item is also checked against the earlier items of the same
+        student that had no conflict, as they are signed up in the same pass.
+        """
+        self.ensure_current()
+        with self._lock:
+            pending = {}
+            results = []
+            for activity_name, email in items:
+                meetings = self.meetings.get(activity_name, ())
+                found = set()
+                for busy in (self.busy.get(email, ()), pending.get(email, ())):
+                    for start, end in meetings:
+                        for _, _, name in self._overlapping(busy, start, end):
+                            if name != activity_name:
+                                found.add(name)
+                if meetings and not found:
+                    added = pending.setdefault(email, [])
+                    for start, end in meetings:
+                        bisect.insort(added, (start, end, activity_name))
+                results.append(sorted(found))
+            return results
+
+    def available(self, start, end):
+        """Return the sorted names of activities held at a time
+
+        For a moment (``start == end``) these are the activities in session
+        then; for a window, those with a meeting that fits inside it.
+        """
+        self.ensure_current()
+        with self._lock:
+            if start == end:
+                found = {name for _, _, name in self._overlapping(self.timeline, start, start + 1)}
+            else:
+                found = set()
+                position = bisect.bisect_left(self.timeline, (start,))
+                while position < len(self.timeline) and self.timeline[position][0] < end:
+                    if self.timeline[position][1] <= end:
+                        found.add(self.timeline[position][2])
+                    position += 1
+            return sorted(found)
@@ -0,0 +1,224 @@
+"""
+Per-client rate limiting and admission control
+
+``RateLimitMiddleware`` gives every client a token bucket for reads (GET and
+HEAD) and another for writes, keyed by client IP; writes that name a student
+(``?email=``) also spend from a bucket for that email, so one student cannot
+be hammered from many addresses. A request that finds its bucket empty is
+answered 429 with ``Retry-After`` before any routing or store work.
+
+``AdmissionMiddleware`` bounds the requests being served at once. Requests
+over the limit wait in a FIFO queue; when the queue is full, or a request
+has waited longer than the target, it is shed with 503 and ``Retry-After``.
+Requests mostly queue before they reach the app though, in the event loop
+of the single worker: with ``max_lag`` set, new requests are also shed
+while the loop runs callbacks later than that. Shedding early keeps latency
+flat for the requests that are admitted instead of letting every request
+slow down together.
+
+Both run on the event loop and need no lock.
+"""
+
+import asyncio
+import math
+import random
+import time
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs
+
+READ_METHODS = ("GET", "HEAD")
+
+
+def parse_limit(value):
+    """Parse ``"rate"`` or ``"rate:burst"`` (requests per second) into ``(rate, burst)``
+
+    The burst defaults to twice the rate. Returns None for an empty value.
+    """
+    if not value:
+        return None
+    rate, _, burst = value.partition(":")
+    rate = float(rate)
+    return rate, float(burst) if burst else max(2 * rate, 1.0)
+
+
+class TokenBuckets:
+    """Token buckets refilled at ``rate`` per second up to ``burst``, one per key
+
+    At most ``max_keys`` buckets are kept; the least recently used is dropped
+    first, which is harmless as an idle bucket refills to ``burst`` anyway.
+    """
+
+    def __init__(self, rate, burst, max_keys=100_000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        # key -> [tokens, last refill]
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key):
+        """Spend a token of ``key``; return 0 or the seconds until one is available"""
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0
+        return (1 - bucket[0]) / self.rate
+
+    def clear(self):
+        self._buckets.clear()
+
+
+def _reject(status, detail, retry_after):
+    body = f'{{"detail":"{detail}"}}'.encode("utf-8")
+    headers = [(b"content-type", b"application/json"),
+               (b"content-length", str(len(body)).encode("latin-1")),
+               (b"retry-after", str(max(1, math.ceil(retry_after))).encode("latin-1"))]
+    return ({"type": "http.response.start", "status": status, "headers": headers},
+            {"type": "http.response.body", "body": body})
+
+
+def _client_ip(scope):
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware enforcing per-client read and write token buckets
+
+    ``read`` and ``write`` are ``(rate, burst)`` pairs, or None for no limit.
+    Paths in ``exempt`` are never limited.
+    """
+
+    def __init__(self, app, read=None, write=None, exempt=(), clock=time.monotonic):
+        self.app = app
+        self.reads = TokenBuckets(*read, clock=clock) if read is not None else None
+        self.writes = TokenBuckets(*write, clock=clock) if write is not None else None
+        self.exempt = frozenset(exempt)
+        self.rejected = 0
+
+    def _wait(self, scope):
+        if scope["method"] in READ_METHODS:
+            return self.reads.take(_client_ip(scope)) if self.reads is not None else 0
+        if self.writes is None:
+            return 0
+        wait = self.writes.take(_client_ip(scope))
+        email = parse_qs(scope["query_string"].decode("latin-1")).get("email")
+        if email:
+            wait = max(wait, self.writes.take("email:" + email[0].lower()))
+        return wait
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt:
+            await self.app(scope, receive, send)
+            return
+        wait = self._wait(scope)
+        if wait:
+            self.rejected += 1
+            for message in _reject(429, "Too many requests", wait):
+                await send(message)
+            return
+        await self.app(scope, receive, send)
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware serving at most ``max_in_flight`` requests at once
+
+    Up to ``max_queue`` more wait for a slot, each for at most ``max_wait``
+    seconds. With ``max_lag``, requests are shed while the event loop lag,
+    probed every ``LAG_PROBE_INTERVAL`` seconds, exceeds it. Paths in
+    ``exempt`` (long-lived streams) bypass it.
+    """
+
+    LAG_PROBE_INTERVAL = 0.01
+
+    def __init__(self, app, max_in_flight=128, max_queue=512, max_wait=1.0, max_lag=None,
+                 exempt=()):
+        self.app = app
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_lag = max_lag
+        self.exempt = frozenset(exempt)
+        self.in_flight = 0
+        self.shed = 0
+        self.lag = 0.0
+        self._waiters = deque()
+        self._probed_loop = None
+
+    def _probe(self, loop, expected):
+        # A chain of timer callbacks rather than a task: it simply stops
+        # when the loop is closed
+        now = loop.time()
+        self.lag = max(0.0, now - expected)
+        loop.call_later(self.LAG_PROBE_INTERVAL, self._probe, loop,
+                        now + self.LAG_PROBE_INTERVAL)
+
+    def _overloaded(self):
+        loop = asyncio.get_running_loop()
+        if self._probed_loop is not loop:
+            self._probed_loop = loop
+            self.lag = 0.0
+            self._probe(loop, loop.time())
+        # Shed a share of requests growing with the lag rather than all of
+        # them, so that clients polling in a tight loop cannot grab every
+        # slot that opens up
+        return random.random() < (self.lag - self.max_lag) / self.max_lag
+
+    async def _admit(self):
+        if self.max_lag is not None and self._overloaded():
+            return False
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # The slot is handed over by _release, so in_flight already counts it
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+            return True
+        except BaseException as error:
+            if waiter.done():
+                # Handed a slot just as the wait ended: give it back
+                self._release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(error, asyncio.TimeoutError):
+                return False
+            raise
+
+    def _release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt:
+            await self.app(scope, receive, send)
+            return
+        if not await self._admit():
+            self.shed += 1
+            for message in _reject(503, "Server overloaded", self.max_wait):
+                await send(message)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._release()
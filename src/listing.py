@@ -0,0 +1,96 @@
+"""
+Paginated, filtered and projected activity listings
+
+Used by ``GET /activities`` when any query parameter is given. Pages are
+ordered by activity name and addressed by an opaque cursor.
+"""
+
+import base64
+import binascii
+
+from .profiling import span
+from .schedule import normalize_day, parse_slot
+from .store import ActivityStoreError
+
+DEFAULT_FIELDS = ("description", "schedule", "max_participants", "participants")
+FIELDS = DEFAULT_FIELDS + ("counts",)
+MAX_LIMIT = 500
+
+
+class InvalidQueryError(ActivityStoreError):
+    status_code = 400
+    detail = "Invalid query"
+
+
+def encode_cursor(name):
+    return base64.urlsafe_b64encode(name.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        return base64.b64decode(cursor.encode("ascii"), altchars=b"-_",
+                                validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeError, ValueError):
+        raise InvalidQueryError("Invalid cursor") from None
+
+
+def parse_fields(fields):
+    if fields is None:
+        return DEFAULT_FIELDS
+    selected = tuple(field.strip() for field in fields.split(",") if field.strip())
+    unknown = [field for field in selected if field not in FIELDS]
+    if unknown:
+        raise InvalidQueryError(f"Unknown field: {unknown[0]}")
+    return selected
+
+
+def _project(details, fields):
+    item = {}
+    for field in fields:
+        if field == "counts":
+            count = details.get("participant_count")
+            if count is None:
+                count = len(details["participants"])
+            item["participant_count"] = count
+            item["spots_left"] = details["max_participants"] - count
+        else:
+            item[field] = details[field]
+    return item
+
+
+def list_activities(store, index, limit=50, cursor=None, prefix=None, day=None,
+                    has_free_seats=None, fields=None, free_at=None, schedules=None):
+    """Return one page of activities as ``{"activities": ..., "next_cursor": ...}``
+
+    ``free_at`` is looked up in ``schedules``, a ``ScheduleIndex``.
+    """
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidQueryError(f"limit must be between 1 and {MAX_LIMIT}")
+    if day is not None:
+        day = normalize_day(day)
+        if day is None:
+            raise InvalidQueryError("Invalid day")
+    if free_at is not None and day is not None:
+        raise InvalidQueryError("free_at already names the day")
+    selected = parse_fields(fields)
+    after = decode_cursor(cursor) if cursor is not None else None
+    within = None
+    if free_at is not None:
+        try:
+            slot = parse_slot(free_at)
+        except ValueError as error:
+            raise InvalidQueryError(f"Invalid free_at: {error}") from None
+        with span("schedule_query"):
+            within = schedules.available(*slot)
+
+    with span("index_query"):
+        names, has_more = index.query(limit, after=after, prefix=prefix,
+                                      day=day,
+                                      has_free_seats=has_free_seats, within=within)
+    with span("fetch"):
+        details = store.get_many(names, include_participants="participants" in selected)
+    return {
+        "activities": {name: _project(details[name], selected)
+                       for name in names if name in details},
+        "next_cursor": encode_cursor(names[-1]) if has_more else None,
+    }
@@ -0,0 +1,243 @@
+"""
+Prometheus metrics for the API
+
+``MetricsMiddleware`` records, for every HTTP request, a count by method,
+route template and status, a latency histogram by method and route, and the
+number of requests in flight. ``GET /metrics`` renders them in the Prometheus
+text exposition format together with domain gauges (total participants,
+activities at capacity, replication lag on replicas) and counts of domain
+errors.
+
+Each thread updates its own shard of plain dicts and ints, so recording a
+request takes no lock; a scrape sums the shards. Under the GIL a scrape may
+see one request counted but not yet timed, which Prometheus tolerates.
+"""
+
+import bisect
+import threading
+import time
+
+from starlette.routing import Match
+
+from .indexes import DerivedIndex
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Shard:
+    """Counters written by a single thread"""
+
+    __slots__ = ("requests", "latency", "in_flight", "errors")
+
+    def __init__(self):
+        self.requests = {}
+        # (method, route) -> per-bucket counts, the +Inf bucket, then the sum
+        self.latency = {}
+        self.in_flight = 0
+        self.errors = {}
+
+    def observe(self, method, route, status, seconds):
+        key = (method, route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        key = (method, route)
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = [0] * (len(BUCKETS) + 2)
+        histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+
+class RosterGauges(DerivedIndex):
+    """Total participants and number of full activities, kept from store mutations"""
+
+    def rebuild(self, activities):
+        self.participants = 0
+        self.at_capacity = 0
+        for details in activities.values():
+            count = len(details["participants"])
+            self.participants += count
+            if count >= details["max_participants"]:
+                self.at_capacity += 1
+
+    def apply(self, mutation):
+        if mutation.kind in ("signup", "promote"):
+            self.participants += 1
+            if mutation.total == mutation.max_participants:
+                self.at_capacity += 1
+        elif mutation.kind == "remove":
+            self.participants -= 1
+            if mutation.total == mutation.max_participants - 1:
+                self.at_capacity -= 1
+
+    def read(self):
+        self.ensure_current()
+        with self._lock:
+            return self.participants, self.at_capacity
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_label(value)}"' for name, value in labels.items()) + "}"
+
+
+class Metrics:
+    """Registry of per-thread shards, aggregated when scraped"""
+
+    def __init__(self, store, replica=None, log=None):
+        self.gauges = RosterGauges(store)
+        self.replica = replica
+        self.log = log
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def shard(self):
+        """Return the calling thread's shard"""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+            return shard
+
+    def count_error(self, error):
+        """Count a domain error by its class name"""
+        errors = self.shard().errors
+        name = type(error).__name__
+        errors[name] = errors.get(name, 0) + 1
+
+    def _aggregate(self):
+        with self._shards_lock:
+            shards = list(self._shards)
+        requests, latency, errors, in_flight = {}, {}, {}, 0
+        for shard in shards:
+            # dict() copies in one step, so a concurrent insert cannot break it
+            for key, count in dict(shard.requests).items():
+                requests[key] = requests.get(key, 0) + count
+            for key, histogram in dict(shard.latency).items():
+                total = latency.setdefault(key, [0] * (len(BUCKETS) + 2))
+                for position, value in enumerate(list(histogram)):
+                    total[position] += value
+            for key, count in dict(shard.errors).items():
+                errors[key] = errors.get(key, 0) + count
+            in_flight += shard.in_flight
+        return requests, latency, errors, in_flight
+
+    def render(self):
+        """Return every metric in the Prometheus text format"""
+        requests, latency, errors, in_flight = self._aggregate()
+        participants, at_capacity = self.gauges.read()
+        lines = [
+            "# HELP http_requests_total HTTP requests by method, route and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(requests.items()):
+            lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+        lines += [
+            "# HELP http_request_duration_seconds HTTP request latency by method and route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), histogram in sorted(latency.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), histogram):
+                cumulative += count
+                labels = _labels(method=method, route=route, le=bound)
+                lines.append(f"http_request_duration_seconds_bucket{labels} {cumulative}")
+            labels = _labels(method=method, route=route)
+            lines.append(f"http_request_duration_seconds_sum{labels} {histogram[-1]}")
+            lines.append(f"http_request_duration_seconds_count{labels} {cumulative}")
+
+        lines += [
+            "# HELP http_requests_in_flight HTTP requests being served.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {in_flight}",
+            "# HELP activity_errors_total Rejected activity operations by error.",
+            "# TYPE activity_errors_total counter",
+        ]
+        for name, count in sorted(errors.items()):
+            lines.append(f"activity_errors_total{_labels(error=name)} {count}")
+
+        lines += [
+            "# HELP activity_participants Students signed up across all activities.",
+            "# TYPE activity_participants gauge",
+            f"activity_participants {participants}",
+            "# HELP activities_at_capacity Activities with no free seats.",
+            "# TYPE activities_at_capacity gauge",
+            f"activities_at_capacity {at_capacity}",
+        ]
+        if self.log is not None:
+            lines += [
+                "# HELP mutation_log_failed Whether the write-ahead log stopped on a write error.",
+                "# TYPE mutation_log_failed gauge",
+                f"mutation_log_failed {int(self.log.error is not None)}",
+            ]
+        if self.replica is not None:
+            status = self.replica.status()
+            if status["applied_version"] is not None:
+                lines += [
+                    "# HELP replication_lag_seconds Time since this replica last had every "
+                    "change of the primary.",
+                    "# TYPE replication_lag_seconds gauge",
+                    f"replication_lag_seconds {status['lag_seconds']}",
+                    "# HELP replication_lag_versions Changes of the primary not applied yet.",
+                    "# TYPE replication_lag_versions gauge",
+                    f"replication_lag_versions {status['lag_versions']}",
+                ]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording request counts, latency and in-flight requests
+
+    Requests are labelled with the route template (``/activities/{activity_name}/signup``)
+    rather than the path, so the number of series stays bounded; requests
+    that match no route are labelled ``unmatched``. Requests answered before
+    reaching the router, such as those shed with 429 or 503 by the rate
+    limits and admission control, are matched against ``routes`` (the app's
+    route list) afterwards, so shed load is counted against its endpoint.
+    """
+
+    def __init__(self, app, metrics, routes=()):
+        self.app = app
+        self.metrics = metrics
+        self.routes = routes
+
+    def _route_path(self, scope):
+        route = scope.get("route")
+        if route is not None:
+            return route.path
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        shard = self.metrics.shard()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        shard.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            shard.in_flight -= 1
+            shard.observe(scope["method"], self._route_path(scope), status, elapsed)
@@ -0,0 +1,231 @@
+"""
+In-memory records for activities, their participants and waitlists
+"""
+import bisect
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+
+class ParticipantSet:
+    """Insertion-ordered set of participant emails
+
+    Backed by a dict (which keeps insertion order), so membership, add and
+    remove are O(1) while iteration still yields emails in signup order.
+    """
+
+    __slots__ = ("_emails",)
+
+    def __init__(self, emails=()):
+        self._emails = dict.fromkeys(emails)
+
+    def __contains__(self, email):
+        return email in self._emails
+
+    def __len__(self):
+        return len(self._emails)
+
+    def __iter__(self):
+        return iter(self._emails)
+
+    def __eq__(self, other):
+        if isinstance(other, ParticipantSet):
+            return list(self._emails) == list(other._emails)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"ParticipantSet({list(self._emails)!r})"
+
+    def add(self, email):
+        self._emails[email] = None
+
+    def remove(self, email):
+        del self._emails[email]
+
+    def to_list(self):
+        return list(self._emails)
+
+
+class Waitlist:
+    """FIFO queue of emails with position lookup
+
+    Each email gets an increasing ticket number when it joins. Joining,
+    promoting the head and membership are O(1) (an ``OrderedDict``, whose
+    ``popitem(last=False)`` stays O(1) unlike a plain dict's first item).
+    The position of an email is its ticket minus the tickets already
+    served, less the sorted tickets of students who left from the middle
+    of the queue, which are forgotten as the head moves past them: O(1),
+    or O(log k) while k students who left are still ahead of someone.
+    """
+
+    __slots__ = ("_tickets", "_next_ticket", "_served", "_left")
+
+    def __init__(self, emails=()):
+        self._tickets = OrderedDict()
+        self._next_ticket = 0
+        # Every ticket below this one has been promoted or has left
+        self._served = 0
+        self._left = []
+        for email in emails:
+            self.append(email)
+
+    def __contains__(self, email):
+        return email in self._tickets
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def __iter__(self):
+        return iter(self._tickets)
+
+    def __repr__(self):
+        return f"Waitlist({list(self._tickets)!r})"
+
+    def append(self, email):
+        """Add ``email`` at the end and return its position (1 for the head)"""
+        self._tickets[email] = self._next_ticket
+        self._next_ticket += 1
+        return len(self._tickets)
+
+    def popleft(self):
+        """Remove and return the email at the head"""
+        email, ticket = self._tickets.popitem(last=False)
+        self._served = ticket + 1
+        # Students who left from ahead of the new head no longer count
+        del self._left[:bisect.bisect_left(self._left, self._served)]
+        return email
+
+    def remove(self, email):
+        ticket = self._tickets.pop(email)
+        if not self._tickets:
+            self._served = self._next_ticket
+            self._left.clear()
+        elif ticket == self._served:
+            self._served = next(iter(self._tickets.values()))
+            del self._left[:bisect.bisect_left(self._left, self._served)]
+        else:
+            bisect.insort(self._left, ticket)
+
+    def position(self, email):
+        """Return the 1-based position of ``email``, or None when it is not waiting"""
+        ticket = self._tickets.get(email)
+        if ticket is None:
+            return None
+        return ticket - self._served - bisect.bisect_left(self._left, ticket) + 1
+
+    def to_list(self):
+        return list(self._tickets)
+
+
+class Activity:
+    """A single extracurricular activity
+
+    Each activity has its own lock, held while checking and changing its
+    participants, so signups for different activities never wait on each other.
+    """
+
+    __slots__ = ("description", "schedule", "max_participants", "participants", "waitlist",
+                 "lock")
+
+    def __init__(self, description, schedule, max_participants, participants=(), waitlist=()):
+        self.description = description
+        self.schedule = schedule
+        self.max_participants = max_participants
+        self.participants = ParticipantSet(participants)
+        self.waitlist = Waitlist(waitlist)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["description"], data["schedule"], data["max_participants"],
+                   data["participants"], data.get("waitlist", ()))
+
+    def to_dict(self):
+        """Return the activity in the JSON shape served by GET /activities"""
+        return {
+            "description": self.description,
+            "schedule": self.schedule,
+            "max_participants": self.max_participants,
+            "participants": self.participants.to_list(),
+        }
+
+    def summary(self):
+        """Return the activity without its participants, but with their count"""
+        return {
+            "description": self.description,
+            "schedule": self.schedule,
+            "max_participants": self.max_participants,
+            "participant_count": len(self.participants),
+        }
+
+    @property
+    def is_full(self):
+        return len(self.participants) >= self.max_participants
+
+
+class ActivityTable(Mapping):
+    """Activities of the in-memory store, copied from a catalog on first use
+
+    ``catalog`` maps names to JSON-ready dicts (a dict, or a ``PackedCatalog``)
+    and is never changed: looking an activity up builds its ``Activity``
+    record from the catalog entry the first time. ``details`` and
+    ``waitlist`` read entries not looked up yet straight from the catalog,
+    so reads build no records, and loading a catalog costs nothing per
+    activity.
+    """
+
+    def __init__(self, catalog=None):
+        self.catalog = catalog if catalog is not None else {}
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        record = self._records.get(name)
+        if record is None:
+            details = self.catalog[name]
+            with self._lock:
+                record = self._records.get(name)
+                if record is None:
+                    record = self._records[name] = Activity.from_dict(details)
+        return record
+
+    def __contains__(self, name):
+        return name in self.catalog
+
+    def __iter__(self):
+        return iter(self.catalog)
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def details(self, name, include_participants=True):
+        """Return the activity as served by GET /activities, or a summary without participants
+
+        The participant list of an unchanged activity is the catalog's own:
+        callers must not modify it.
+        """
+        record = self._records.get(name)
+        if record is not None:
+            with record.lock:
+                if include_participants:
+                    return record.to_dict()
+                return record.summary()
+        data = self.catalog[name]
+        result = {
+            "description": data["description"],
+            "schedule": data["schedule"],
+            "max_participants": data["max_participants"],
+        }
+        if include_participants:
+            result["participants"] = data["participants"]
+        else:
+            result["participant_count"] = len(data["participants"])
+        return result
+
+    def waitlist(self, name):
+        """Return the emails waiting for ``name``, in order"""
+        record = self._records.get(name)
+        if record is not None:
+            with record.lock:
+                return record.waitlist.to_list()
+        return list(self.catalog[name].get("waitlist", ()))
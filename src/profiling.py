@@ -0,0 +1,351 @@
+"""
+Opt-in request profiling
+
+With ``ACTIVITY_PROFILE_SAMPLE`` set (a fraction between 0 and 1) the
+``ProfilingMiddleware`` profiles that fraction of requests, plus every
+request sent with an ``X-Profile: 1`` header. A profiled request records:
+
+- a cProfile of the event loop thread while the request runs,
+- the time spent in the framework phases (routing, validation, endpoint,
+  response serialization), read from that profile,
+- named spans for the phases of our own code, opened with ``span(name)``.
+
+Only the ``keep`` slowest traces are kept. ``/admin/profiles`` lists them and
+each one can be downloaded as a speedscope file or as collapsed stacks for
+flamegraph.pl.
+
+cProfile sees everything running on the thread, so work interleaved from
+other requests shows up too, and only one request is profiled with cProfile
+at a time (concurrent sampled requests still get their spans). Work done in
+threadpool workers appears in the spans but not in the profile.
+"""
+
+import cProfile
+import contextvars
+import heapq
+import itertools
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# (file suffix, function name) of the framework functions measured as phases
+FRAMEWORK_PHASES = {
+    "routing": (("starlette/routing.py", "matches"), ("fastapi/routing.py", "matches")),
+    "validation": (("fastapi/dependencies/utils.py", "solve_dependencies"),),
+    "endpoint": (("fastapi/routing.py", "run_endpoint_function"),),
+    "serialization": (("fastapi/routing.py", "serialize_response"),),
+}
+MAX_STACK_DEPTH = 64
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        ended = time.perf_counter()
+        self.trace.spans.append((self.name, self.started - self.trace.started,
+                                 ended - self.started))
+        return False
+
+
+def span(name):
+    """Time a phase of the current request if it is being profiled
+
+    Outside a profiled request this returns a shared no-op context manager.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name)
+
+
+class Trace:
+    """Timings and profile of one sampled request"""
+
+    def __init__(self, trace_id, method, path):
+        self.id = trace_id
+        self.method = method
+        self.path = path
+        self.status = None
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self.stats = None
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "timestamp": self.timestamp,
+            "duration_ms": self.duration * 1000,
+        }
+
+    def details(self, top=25):
+        result = self.summary()
+        result["spans"] = [
+            {"name": name, "start_ms": start * 1000, "duration_ms": duration * 1000}
+            for name, start, duration in self.spans
+        ]
+        result["phases_ms"] = self.framework_phases()
+        result["functions"] = self.top_functions(top)
+        return result
+
+    def framework_phases(self):
+        if self.stats is None:
+            return {}
+        phases = {}
+        for phase, functions in FRAMEWORK_PHASES.items():
+            total = 0.0
+            for (filename, _, name), (_, _, _, cumulative, _) in self.stats.items():
+                if any(filename.endswith(suffix) and name == function
+                       for suffix, function in functions):
+                    total += cumulative
+            phases[phase] = total * 1000
+        return phases
+
+    def top_functions(self, top):
+        if self.stats is None:
+            return []
+        rows = sorted(self.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        return [
+            {"function": _frame_name(func), "calls": calls,
+             "own_ms": own * 1000, "cumulative_ms": cumulative * 1000}
+            for func, (_, calls, own, cumulative, _) in rows
+        ]
+
+    def stacks(self):
+        """Return ``{stack: seconds}`` with the profile expanded into call stacks
+
+        cProfile keeps caller/callee totals rather than stacks, so the time of
+        a function reached from several callers is split between them in
+        proportion to the time each caller spent in it.
+        """
+        if self.stats is None:
+            return {}
+        children = {}
+        for func, (_, _, _, _, callers) in self.stats.items():
+            for caller, edge in callers.items():
+                children.setdefault(caller, []).append((func, edge[3]))
+
+        stacks = {}
+
+        def expand(func, budget, path):
+            _, _, own, cumulative, _ = self.stats[func]
+            scale = budget / cumulative if cumulative else 0.0
+            stack = path + (func,)
+            self_time = own * scale
+            for child, edge_time in children.get(func, ()):
+                child_budget = edge_time * scale
+                if child in stack or len(stack) >= MAX_STACK_DEPTH:
+                    self_time += child_budget
+                elif child_budget > 1e-7:
+                    expand(child, child_budget, stack)
+            if self_time > 0:
+                stacks[stack] = stacks.get(stack, 0.0) + self_time
+
+        for func, (_, _, _, cumulative, callers) in self.stats.items():
+            if not callers:
+                expand(func, cumulative, ())
+        return stacks
+
+    def collapsed(self):
+        """Collapsed stacks (``a;b;c microseconds``) for flamegraph.pl"""
+        lines = []
+        for stack, seconds in sorted(self.stacks().items()):
+            micros = round(seconds * 1e6)
+            if micros:
+                lines.append(";".join(_frame_name(func) for func in stack) + f" {micros}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self):
+        """The trace as a speedscope file: the sampled profile and the spans"""
+        frames = []
+        frame_ids = {}
+
+        def frame(key, name, file=None, line=None):
+            if key not in frame_ids:
+                frame_ids[key] = len(frames)
+                entry = {"name": name}
+                if file is not None:
+                    entry["file"] = file
+                    entry["line"] = line
+                frames.append(entry)
+            return frame_ids[key]
+
+        samples, weights = [], []
+        for stack, seconds in self.stacks().items():
+            samples.append([frame(func, _frame_name(func), func[0], func[1]) for func in stack])
+            weights.append(seconds * 1e6)
+
+        events = []
+        for name, start, duration in sorted(self.spans, key=lambda item: (item[1], -item[2])):
+            index = frame(("span", name), name)
+            events.append({"type": "O", "frame": index, "at": start * 1e6})
+            events.append({"type": "C", "frame": index, "at": (start + duration) * 1e6})
+        # Spans nest by time, so closing events must come in stack order
+        events.sort(key=lambda event: (event["at"], event["type"] == "O"))
+
+        title = f"{self.method} {self.path}"
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": title,
+            "exporter": "mergington-profiling",
+            "shared": {"frames": frames},
+            "profiles": [
+                {"type": "sampled", "name": f"{title} (cProfile)", "unit": "microseconds",
+                 "startValue": 0, "endValue": sum(weights), "samples": samples,
+                 "weights": weights},
+                {"type": "evented", "name": f"{title} (spans)", "unit": "microseconds",
+                 "startValue": 0, "endValue": self.duration * 1e6, "events": events},
+            ],
+        }
+
+
+def _frame_name(func):
+    filename, line, name = func
+    if filename == "~":
+        # Built-in function, e.g. "<method 'append' of 'list' objects>"
+        return name
+    return f"{name} ({filename.rsplit('/', 1)[-1]}:{line})"
+
+
+class Profiler:
+    """Sampling decision and the bounded set of the slowest traces"""
+
+    def __init__(self, sample_rate=None, keep=20):
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self._ids = itertools.count(1)
+        self._heap = []
+        self._traces = {}
+        self._lock = threading.Lock()
+        self._cprofile_busy = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.sample_rate is not None
+
+    def should_sample(self, forced):
+        return forced or random.random() < self.sample_rate
+
+    def new_trace(self, method, path):
+        """Start the trace of a request, with the next id"""
+        return Trace(next(self._ids), method, path)
+
+    @contextmanager
+    def cprofile_slot(self):
+        """Yield a ``cProfile.Profile`` to run, or None while another one runs
+
+        Only one profiler can be active in the interpreter at a time, so
+        requests sampled meanwhile get spans only.
+        """
+        if not self._cprofile_busy.acquire(blocking=False):
+            yield None
+            return
+        try:
+            yield cProfile.Profile()
+        finally:
+            self._cprofile_busy.release()
+
+    def record(self, trace):
+        """Keep ``trace`` if it is among the ``keep`` slowest seen so far"""
+        with self._lock:
+            entry = (trace.duration, trace.id)
+            if len(self._heap) < self.keep:
+                heapq.heappush(self._heap, entry)
+            elif entry > self._heap[0]:
+                _, dropped = heapq.heapreplace(self._heap, entry)
+                del self._traces[dropped]
+            else:
+                return False
+            self._traces[trace.id] = trace
+            return True
+
+    def traces(self):
+        """Kept traces, slowest first"""
+        with self._lock:
+            traces = list(self._traces.values())
+        return sorted(traces, key=lambda trace: trace.duration, reverse=True)
+
+    def get(self, trace_id):
+        return self._traces.get(trace_id)
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+            self._traces.clear()
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware profiling sampled requests"""
+
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        if scope["type"] != "http" or not profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+        forced = any(name == b"x-profile" and value == b"1" for name, value in scope["headers"])
+        if not profiler.should_sample(forced):
+            await self.app(scope, receive, send)
+            return
+
+        trace = profiler.new_trace(scope["method"], scope["path"])
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+            await send(message)
+
+        profile = None
+        try:
+            with profiler.cprofile_slot() as profile:
+                token = _current_trace.set(trace)
+                try:
+                    if profile is not None:
+                        profile.enable()
+                    await self.app(scope, receive, send_with_status)
+                finally:
+                    if profile is not None:
+                        profile.disable()
+                    _current_trace.reset(token)
+        finally:
+            trace.duration = time.perf_counter() - trace.started
+            if trace.status is None:
+                trace.status = 500
+            if profile is not None and profiler.record(trace):
+                # Only traces worth keeping pay for the stats conversion
+                trace.stats = pstats.Stats(profile).stats
+            elif profile is None:
+                profiler.record(trace)
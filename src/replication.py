@@ -0,0 +1,419 @@
+"""
+Replication of the activities to read-only nodes
+
+Any node can be a primary: ``ChangeFeed`` keeps its latest changes in
+order, numbered by store version, for ``GET /replication/changes``, and
+``GET /replication/snapshot`` returns every activity with its waitlist and
+the version it was read at. Changes use the write-ahead log's encoding,
+``[version, op, activity, email]`` (see ``src/durability.py``). The feed
+id is the store's ``data_id()``, the same for every worker sharing a
+SQLite database, so that versions of other data are never taken for ours;
+within it versions only grow, and a replica behind a reload finds the
+versions it needs gone from the feed.
+
+A node started with ``ACTIVITY_PRIMARY_URL`` is a replica. ``Replica``
+loads the primary's snapshot into its in-memory store, then tails the feed
+with long polls from a background thread and applies every change as is,
+so the replica's caches, indexes and event streams follow the primary. The
+snapshot is read while writes keep going, so changes it already contains
+are skipped. A replica further behind than the changes the primary keeps,
+or whose primary was reloaded or restarted, starts over from a snapshot.
+
+``ReplicaMiddleware`` answers reads locally (503 until the first snapshot
+is loaded) and forwards writes to the primary. ``VersionHeaderMiddleware``
+tags the response of every write with the store version after it
+(``X-Activity-Version``), and the replica answers a forwarded write once
+it has applied that version, so a client reading from the same replica
+after a write sees it.
+"""
+
+import asyncio
+import http.client
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import anyio.from_thread
+from starlette.concurrency import run_in_threadpool
+
+from .durability import OPS
+from .store import ActivityNotFoundError, ActivityStoreError
+
+KINDS = {op: kind for kind, op in OPS.items()}
+READ_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+MAX_WAIT = 60.0
+MAX_LIMIT = 10_000
+# Request headers passed on to the primary, and response headers passed back
+FORWARDED_REQUEST_HEADERS = ("content-type", "content-length", "accept", "idempotency-key",
+                             "x-forwarded-for")
+FORWARDED_RESPONSE_HEADERS = ("content-type", "retry-after", "idempotent-replayed",
+                              "x-activity-version")
+
+
+class ResyncRequiredError(ActivityStoreError):
+    status_code = 410
+    detail = "Changes no longer kept: load a new snapshot"
+
+
+class ReplicationError(Exception):
+    """The primary answered something a replica cannot use"""
+
+
+def read_snapshot(store):
+    """Return ``{"version": v, "activities": {...}}`` from ``store.snapshot()``"""
+    version, activities = store.snapshot()
+    return {"version": version, "activities": activities}
+
+
+class ChangeFeed:
+    """The latest ``keep`` changes of a store, in version order, with long polling"""
+
+    def __init__(self, store, keep=100_000):
+        self.store = store
+        self.keep = keep
+        self.id = store.data_id()
+        self._lock = threading.Lock()
+        # Versions of the kept changes follow each other from ``_first``
+        self._changes = []
+        self._loop = None
+        self._waiters = set()
+        with self._lock:
+            store.subscribe(self.append)
+            self._first = store.version() + 1
+
+    def append(self, mutation):
+        """Store listener: keep the change and wake the long polls"""
+        with self._lock:
+            if mutation.kind == "load" or mutation.version != self._first + len(self._changes):
+                # Replicas at an earlier version start over from a snapshot
+                self._changes = []
+                self._first = mutation.version + 1
+            else:
+                self._changes.append([mutation.version, OPS[mutation.kind], mutation.activity,
+                                      mutation.email])
+                if len(self._changes) >= 2 * self.keep:
+                    dropped = len(self._changes) - self.keep
+                    del self._changes[:dropped]
+                    self._first += dropped
+        loop = self._loop
+        if loop is not None and self._waiters:
+            try:
+                loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:
+                # The event loop is closed, e.g. after the test client shut down
+                self._loop = None
+
+    def _wake(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+
+    def snapshot(self):
+        """Return ``read_snapshot`` of the store with the id of the feed to follow it"""
+        # Data reloaded after the version was read is newer than the changes
+        # following it, which are then gone: the replica resyncs
+        return dict(read_snapshot(self.store), feed=self.id)
+
+    def read(self, after, limit=1000, feed=None):
+        """Return up to ``limit`` changes after version ``after``, and the latest version
+
+        ``feed`` is the id given with the snapshot the versions come from.
+        """
+        with self._lock:
+            version = self._first + len(self._changes) - 1
+            if (feed is not None and feed != self.id
+                    or not self._first - 1 <= after <= version):
+                # Pruned, reloaded since, or another primary
+                raise ResyncRequiredError()
+            start = after + 1 - self._first
+            return self._changes[start:start + limit], version
+
+    async def wait(self, after, timeout, limit=1000, feed=None):
+        """Like ``read``, but wait up to ``timeout`` seconds for a change if there is none"""
+        changes, version = self.read(after, limit, feed)
+        if changes or timeout <= 0:
+            return changes, version
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        waiter = loop.create_future()
+        self._waiters.add(waiter)
+        try:
+            # A change may have come in before the waiter was registered
+            changes, version = self.read(after, limit, feed)
+            if not changes:
+                await asyncio.wait((waiter,), timeout=timeout)
+                changes, version = self.read(after, limit, feed)
+        finally:
+            self._waiters.discard(waiter)
+        return changes, version
+
+
+class Replica:
+    """Keeps an in-memory store in step with a primary node"""
+
+    def __init__(self, store, primary_url, poll_wait=25.0, timeout=30.0, clock=time.monotonic):
+        self.store = store
+        self.primary_url = primary_url.rstrip("/")
+        self.poll_wait = poll_wait
+        self.timeout = timeout
+        self.clock = clock
+        self.state = "starting"
+        self.error = None
+        # Feed followed, and versions of the primary: applied here, and the
+        # latest it reported
+        self.feed = None
+        self.applied_version = None
+        self.primary_version = None
+        self.caught_up_at = None
+        # Whether a long poll sent while caught up is waiting for a change
+        self._listening = False
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.applied_version is not None
+
+    def fetch(self, path, timeout):
+        """GET ``path`` from the primary and return ``(status, decoded JSON body)``"""
+        try:
+            with urllib.request.urlopen(self.primary_url + path, timeout=timeout) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            with error:
+                return error.code, None
+
+    def forward(self, method, target, headers, body):
+        """Send a request to the primary and return ``(status, headers, body)``
+
+        ``body`` is bytes, or an iterable of bytes sent as it is consumed.
+        """
+        request = urllib.request.Request(self.primary_url + target, data=body or None,
+                                         headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as error:
+            with error:
+                return error.code, error.headers, error.read()
+
+    def _advance(self, applied, primary):
+        with self._cond:
+            self.applied_version = applied
+            self.primary_version = max(primary, applied)
+            if applied >= self.primary_version:
+                self.caught_up_at = self.clock()
+            self._cond.notify_all()
+
+    def bootstrap(self):
+        """Replace the local activities with a snapshot of the primary"""
+        status, snapshot = self.fetch("/replication/snapshot", self.timeout)
+        if status != 200:
+            raise ReplicationError(f"Snapshot answered {status}")
+        self.state = "bootstrapping"
+        self.store.load(snapshot["activities"])
+        self.feed = snapshot["feed"]
+        self._advance(snapshot["version"], snapshot["version"])
+
+    def poll(self, wait=0.0):
+        """Apply the changes of the primary since the last ones applied
+
+        Waits up to ``wait`` seconds for one when there is none.
+        """
+        with self._cond:
+            self._listening = wait > 0 and self.applied_version == self.primary_version
+        try:
+            status, body = self.fetch(
+                f"/replication/changes?feed={self.feed}&after={self.applied_version}"
+                f"&wait={wait}",
+                wait + self.timeout)
+        finally:
+            self._listening = False
+        if status == ResyncRequiredError.status_code:
+            self.bootstrap()
+            return
+        if status != 200:
+            raise ReplicationError(f"Changes answered {status}")
+        applied = self.applied_version
+        for version, op, activity_name, email in body["changes"]:
+            try:
+                self.store.apply_change(KINDS[op], activity_name, email)
+            except ActivityNotFoundError:
+                # Activities only come and go with a load, which resyncs
+                pass
+            applied = version
+        self._advance(applied, body["version"])
+
+    def _run(self):
+        delay = 0.5
+        while not self._stop.is_set():
+            try:
+                if self.applied_version is None:
+                    self.bootstrap()
+                self.state = "streaming"
+                self.poll(self.poll_wait)
+                self.error = None
+                delay = 0.5
+            except (OSError, http.client.HTTPException, ValueError, KeyError,
+                    ReplicationError) as error:
+                self.state = "disconnected"
+                self.error = str(error)
+                self._stop.wait(delay)
+                delay = min(delay * 2, 10.0)
+
+    def start(self):
+        """Bootstrap and tail the primary from a background thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="replica", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        # A long poll in progress is left to finish in its daemon thread
+        self._stop.set()
+
+    def wait_for(self, version, timeout):
+        """Wait until the primary's ``version`` is applied; return whether it was"""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self.applied_version is not None and self.applied_version >= version,
+                timeout)
+
+    def status(self):
+        """Replication state and lag, for ``GET /replication/status`` and metrics"""
+        with self._cond:
+            applied, primary = self.applied_version, self.primary_version
+            if applied is None:
+                lag = None
+            elif self._listening:
+                # The primary answers a long poll as soon as it has a change
+                lag = 0.0
+            else:
+                lag = round(self.clock() - self.caught_up_at, 3)
+        return {
+            "role": "replica",
+            "primary": self.primary_url,
+            "state": self.state,
+            "applied_version": applied,
+            "primary_version": primary,
+            "lag_versions": primary - applied if applied is not None else None,
+            "lag_seconds": lag,
+            "error": self.error,
+        }
+
+
+def _stream_body(first, receive):
+    """Yield a request body from a threadpool thread, receiving it from the event loop"""
+    if first:
+        yield first
+    while True:
+        message = anyio.from_thread.run(receive)
+        if message["type"] == "http.disconnect":
+            raise ConnectionAbortedError("Client disconnected")
+        if message.get("body"):
+            yield message["body"]
+        if not message.get("more_body"):
+            return
+
+
+def _reject(status, detail):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    return ({"type": "http.response.start", "status": status,
+             "headers": [(b"content-type", b"application/json"),
+                         (b"content-length", str(len(body)).encode("latin-1")),
+                         (b"retry-after", b"1")]},
+            {"type": "http.response.body", "body": body})
+
+
+class ReplicaMiddleware:
+    """Pure ASGI middleware of replicas: reads are served locally, writes by the primary
+
+    Reads wait for the first snapshot (503 until then), except for paths in
+    ``exempt``. Write bodies are streamed to the primary as they arrive, with
+    the client address added to ``X-Forwarded-For``. A forwarded write is
+    answered once the replica applied it, or after ``read_your_writes``
+    seconds; 503 when the primary cannot be reached, 502 when its answer
+    cannot be read.
+    """
+
+    def __init__(self, app, replica, read_your_writes=1.0, exempt=()):
+        self.app = app
+        self.replica = replica
+        self.read_your_writes = read_your_writes
+        self.exempt = frozenset(exempt)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt:
+            await self.app(scope, receive, send)
+            return
+        if scope["method"] in READ_METHODS:
+            if self.replica.ready:
+                await self.app(scope, receive, send)
+                return
+            for message in _reject(503, "Replica is loading the activities"):
+                await send(message)
+            return
+
+        # A body in one message is sent as is; longer ones, such as roster
+        # imports, are streamed without being held in memory
+        message = await receive()
+        body = message.get("body", b"")
+        if message.get("more_body"):
+            body = _stream_body(body, receive)
+        target = scope.get("raw_path") or scope["path"].encode("utf-8")
+        if scope["query_string"]:
+            target += b"?" + scope["query_string"]
+        headers = {name.decode("latin-1"): value.decode("latin-1")
+                   for name, value in scope["headers"]
+                   if name.decode("latin-1") in FORWARDED_REQUEST_HEADERS}
+        client = scope.get("client")
+        if client:
+            forwarded = headers.get("x-forwarded-for")
+            headers["x-forwarded-for"] = f"{forwarded}, {client[0]}" if forwarded else client[0]
+        try:
+            status, response_headers, content = await run_in_threadpool(
+                self.replica.forward, scope["method"], target.decode("latin-1"), headers, body)
+        except OSError:
+            for message in _reject(503, "Primary unavailable"):
+                await send(message)
+            return
+        except (http.client.HTTPException, ValueError):
+            for message in _reject(502, "Invalid answer from the primary"):
+                await send(message)
+            return
+        version = response_headers.get("x-activity-version")
+        if 200 <= status < 300 and version:
+            await run_in_threadpool(self.replica.wait_for, int(version), self.read_your_writes)
+        headers = [(name.encode("latin-1"), response_headers[name].encode("latin-1"))
+                   for name in FORWARDED_RESPONSE_HEADERS if name in response_headers]
+        headers.append((b"content-length", str(len(content)).encode("latin-1")))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": content})
+
+
+class VersionHeaderMiddleware:
+    """Pure ASGI middleware adding ``X-Activity-Version`` to the responses of writes"""
+
+    def __init__(self, app, store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in READ_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_version(message):
+            if message["type"] == "http.response.start":
+                if self.store.blocking:
+                    version = await run_in_threadpool(self.store.version)
+                else:
+                    version = self.store.version()
+                message["headers"] = list(message.get("headers", ())) + [
+                    (b"x-activity-version", str(version).encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_with_version)
@@ -0,0 +1,173 @@
+"""
+JSON encoding and response compression
+
+``encode_json`` uses orjson when it is installed and the standard library
+otherwise; both produce the same compact UTF-8 JSON as FastAPI's default
+``JSONResponse``, which ``FastJSONResponse`` replaces for every endpoint.
+
+``CompressionMiddleware`` compresses response bodies above a size threshold
+with the best encoding the client accepts: zstd when the ``zstandard``
+package is installed, gzip otherwise. Levels can be tuned per route.
+Streaming responses (events, exports) are passed through untouched.
+"""
+
+import gzip
+import json
+import re
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: the standard library encoder is used instead
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # optional: only gzip is offered without it
+    zstandard = None
+
+# Preferred first when the client accepts several with the same quality
+ENCODINGS = ("br", "zstd", "gzip")
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript",
+                      "text/")
+
+
+def encode_json(content):
+    """Encode ``content`` exactly like FastAPI's default JSONResponse"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """``JSONResponse`` rendered with ``encode_json``"""
+
+    def render(self, content):
+        return encode_json(content)
+
+
+def available_encodings():
+    """Encodings the API can compress responses with"""
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def compress(body, encoding, level=None):
+    if level is None:
+        level = DEFAULT_LEVELS[encoding]
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def choose_encoding(accept_encoding, available):
+    """Pick the best encoding among ``available`` for an ``Accept-Encoding`` header
+
+    Returns None for the identity encoding.
+    """
+    if not accept_encoding or not available:
+        return None
+    qualities = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    default = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in ENCODINGS:
+        if coding in available:
+            quality = qualities.get(coding, default)
+            if quality > best_quality:
+                best, best_quality = coding, quality
+    return best
+
+
+def variant_etag(etag, encoding):
+    """Strong ETag of the ``encoding`` variant of a representation"""
+    return etag if encoding is None else f'"{etag[1:-1]}-{encoding}"'
+
+
+def _header(headers, name):
+    for key, value in headers:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware compressing single-message responses
+
+    ``levels`` maps route templates to ``{encoding: level}`` overrides. A
+    strong ETag of a compressed response is replaced by its
+    ``variant_etag``, and ``Accept-Encoding`` is added to ``Vary`` unless it
+    is listed already.
+    """
+
+    def __init__(self, app, minimum_size=1024, levels=None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = levels or {}
+        self.encodings = available_encodings()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.minimum_size is None:
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(_header(scope["headers"], b"accept-encoding"), self.encodings)
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # Held back until the body shows whether to compress
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+            head, start = start, None
+            body = message.get("body", b"")
+            headers = head.get("headers", [])
+            content_type = _header(headers, b"content-type") or ""
+            if (message.get("more_body") or len(body) < self.minimum_size
+                    or _header(headers, b"content-encoding") is not None
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                await send(head)
+                await send(message)
+                return
+
+            vary = _header(headers, b"vary")
+            listed = {token.strip().lower() for token in (vary or "").split(",")}
+            if not listed & {"accept-encoding", "*"}:
+                headers = [(key, value) for key, value in headers if key != b"vary"]
+                headers.append((b"vary", (vary + ", Accept-Encoding" if vary else
+                                          "Accept-Encoding").encode("latin-1")))
+            if encoding is not None:
+                route = scope.get("route")
+                level = self.levels.get(getattr(route, "path", None), {}).get(encoding)
+                body = compress(body, encoding, level)
+                etag = _header(headers, b"etag")
+                headers = [(key, value) for key, value in headers
+                           if key not in (b"content-length", b"etag")]
+                headers.append((b"content-length", str(len(body)).encode("latin-1")))
+                headers.append((b"content-encoding", encoding.encode("latin-1")))
+                if etag is not None:
+                    # The compressed bytes differ: a strong ETag must too.
+                    # A weak one only promises equivalent content, and stays
+                    if not etag.startswith("W/"):
+                        etag = variant_etag(etag, encoding)
+                    headers.append((b"etag", etag.encode("latin-1")))
+            await send(dict(head, headers=headers))
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
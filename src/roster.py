@@ -0,0 +1,153 @@
+"""
+Streaming roster export and import
+
+A roster is a flat list of ``(activity, email)`` rows, as CSV (with an
+``activity,email`` header) or NDJSON (``{"activity": ..., "email": ...}``
+per line). Both directions work on bounded chunks, so memory use does not
+grow with the size of the roster.
+"""
+
+import codecs
+import csv
+import io
+import json
+
+from .store import ActivityStoreError
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+CSV_HEADER = ["activity", "email"]
+MAX_REPORTED_ERRORS = 100
+MAX_LINE_LENGTH = 64 * 1024
+
+
+class InvalidRosterError(ActivityStoreError):
+    status_code = 400
+    detail = "Invalid roster"
+
+
+def export_roster(store, fmt, chunk_size=64 * 1024):
+    """Yield the roster of ``store`` encoded as ``fmt``, in chunks of about ``chunk_size`` bytes"""
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(CSV_HEADER)
+        write = writer.writerow
+    else:
+        def write(row):
+            buffer.write(json.dumps({"activity": row[0], "email": row[1]}, ensure_ascii=False))
+            buffer.write("\n")
+    for row in store.iter_roster():
+        write(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class RosterImporter:
+    """Parses a roster fed in arbitrary byte chunks and signs up its rows
+
+    Rows are collected into batches and handed to ``store.signup_many``, which
+    checks membership and capacity like single signups but not schedule
+    conflicts. Call ``feed`` for every chunk
+    and ``close`` at the end; both return the batches that are ready, which
+    the caller passes to ``apply`` (or signs up itself and passes to
+    ``record`` with the results).
+    """
+
+    def __init__(self, store, fmt, batch_size=1000):
+        if fmt not in FORMATS:
+            raise InvalidRosterError("Unsupported format")
+        self.store = store
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._partial = ""
+        self._batch = []
+        self._line = 0
+        self._header_seen = fmt != "csv"
+        self.applied = 0
+        self.failed = 0
+        self.errors = []
+
+    def feed(self, chunk):
+        text = self._partial + self._decoder.decode(chunk)
+        lines = text.split("\n")
+        self._partial = lines.pop()
+        if len(self._partial) > MAX_LINE_LENGTH:
+            raise InvalidRosterError("Roster line too long")
+        return self._parse(lines)
+
+    def close(self):
+        lines = [self._partial + self._decoder.decode(b"", final=True)]
+        self._partial = ""
+        ready = self._parse(lines)
+        if self._batch:
+            ready.append(self._batch)
+            self._batch = []
+        return ready
+
+    def _parse(self, lines):
+        ready = []
+        for line in lines:
+            self._line += 1
+            line = line.rstrip("\r")
+            if not line.strip():
+                continue
+            row = self._parse_line(line)
+            if row is None:
+                continue
+            self._batch.append(row)
+            if len(self._batch) >= self.batch_size:
+                ready.append(self._batch)
+                self._batch = []
+        return ready
+
+    def _parse_line(self, line):
+        try:
+            if self.fmt == "csv":
+                fields = next(csv.reader([line]))
+                if not self._header_seen:
+                    self._header_seen = True
+                    if [field.strip().lower() for field in fields] != CSV_HEADER:
+                        raise InvalidRosterError("CSV roster must start with an activity,email header")
+                    return None
+                activity, email = fields
+            else:
+                record = json.loads(line)
+                activity, email = record["activity"], record["email"]
+            if not isinstance(activity, str) or not isinstance(email, str):
+                raise ValueError
+        except InvalidRosterError:
+            raise
+        except (ValueError, KeyError, TypeError):
+            self._record_error(self._line, "Malformed row")
+            return None
+        return self._line, activity, email
+
+    def _record_error(self, line, detail):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "detail": detail})
+
+    def apply(self, batch):
+        """Sign up one batch of parsed rows"""
+        self.record(batch, self.store.signup_many(self.items(batch)))
+
+    @staticmethod
+    def items(batch):
+        """Return the ``(activity, email)`` pairs of a batch, as taken by ``signup_many``"""
+        return [(activity, email) for _, activity, email in batch]
+
+    def record(self, batch, results):
+        """Count the ``signup_many`` results of a batch applied by the caller"""
+        for (line, _, _), result in zip(batch, results):
+            if result.error is None:
+                self.applied += 1
+            else:
+                self._record_error(line, result.error.detail)
+
+    def summary(self):
+        return {"applied": self.applied, "failed": self.failed, "errors": self.errors}
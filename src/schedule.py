@@ -0,0 +1,127 @@
+"""
+Helpers for the free-text ``schedule`` field of activities
+
+Schedules look like "Tuesdays and Thursdays, 3:30 PM - 4:30 PM".
+``parse_meetings`` turns them into weekly meetings, ``(start, end)`` in
+minutes since Monday 00:00, and ``parse_slot`` reads the times of
+``GET /activities?free_at=``.
+"""
+
+import re
+
+DAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+_DAY_GROUPS = {"daily": DAYS, "every day": DAYS, "weekday": DAYS[:5], "weekend": DAYS[5:]}
+_ANY_DAY_PATTERN = re.compile(r"\b(" + "|".join(DAYS + tuple(_DAY_GROUPS)) + r")s?\b",
+                              re.IGNORECASE)
+_TIME = r"(\d{1,2})(?::(\d{2}))?\s*([ap])?\.?\s*(?:m\b\.?)?"
+_TIME_PATTERN = re.compile(r"\b" + _TIME, re.IGNORECASE)
+_RANGE_PATTERN = re.compile(r"\b" + _TIME + r"\s*(?:-|–|to)\s*" + _TIME, re.IGNORECASE)
+
+
+def parse_days(text):
+    """Return the lower-case day names of ``text``, in order
+
+    "Daily", "weekdays" and "weekends" stand for the days they cover.
+    """
+    days = []
+    for match in _ANY_DAY_PATTERN.finditer(text):
+        name = match.group(1).lower()
+        for day in _DAY_GROUPS.get(name, (name,)):
+            if day not in days:
+                days.append(day)
+    return days
+
+
+def normalize_day(value):
+    """Return the day named by ``value`` ("monday", "Mondays"), or None"""
+    day = value.lower()
+    if day.endswith("s") and day[:-1] in DAYS:
+        day = day[:-1]
+    return day if day in DAYS else None
+
+
+def _minutes(hour, minute, meridiem):
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            raise ValueError(f"Invalid hour: {hour}")
+        hour = hour % 12 + (12 if meridiem.lower() == "p" else 0)
+    if hour > 24 or minute > 59 or hour * 60 + minute > MINUTES_PER_DAY:
+        raise ValueError(f"Invalid time: {hour}:{minute:02d}")
+    return hour * 60 + minute
+
+
+def _range(match):
+    start_hour, start_minute, start_meridiem, end_hour, end_minute, end_meridiem = match.groups()
+    # "3:30 - 4:30 PM": the start shares the end's AM/PM, unless that puts it after the end
+    end = _minutes(end_hour, end_minute, end_meridiem)
+    start = _minutes(start_hour, start_minute, start_meridiem or end_meridiem)
+    if start_meridiem is None and end_meridiem is not None and start > end:
+        start = _minutes(start_hour, start_minute, "a" if end_meridiem.lower() == "p" else "p")
+    return start, end
+
+
+def _weekly(day, start, end):
+    """Yield the meeting on ``day`` from ``start`` to ``end``, split at the end of the week"""
+    if end <= start:
+        # Runs past midnight
+        end += MINUTES_PER_DAY
+    offset = DAYS.index(day) * MINUTES_PER_DAY
+    start, end = offset + start, offset + end
+    if end <= MINUTES_PER_WEEK:
+        yield start, end
+    else:
+        yield start, MINUTES_PER_WEEK
+        yield 0, end - MINUTES_PER_WEEK
+
+
+def parse_meetings(schedule):
+    """Return the weekly meetings of ``schedule`` as sorted ``(start, end)`` minutes
+
+    Minutes count from Monday 00:00. Each time range applies to the days
+    named since the previous range or, when there are none, to the days
+    named right after it: "Mondays 3-4 PM, Fridays 2-3 PM" and "3:30 PM -
+    5:00 PM on Fridays" both work. "Daily", "weekdays" and "weekends" are
+    understood. Unparseable schedules have no meetings.
+    """
+    ranges = list(_RANGE_PATTERN.finditer(schedule))
+    meetings = set()
+    previous = 0
+    for position, match in enumerate(ranges):
+        days = parse_days(schedule[previous:match.start()])
+        if not days:
+            following = ranges[position + 1].start() if position + 1 < len(ranges) else None
+            days = parse_days(schedule[match.end():following])
+        previous = match.end()
+        try:
+            start, end = _range(match)
+        except ValueError:
+            continue
+        for day in days:
+            meetings.update(_weekly(day, start, end))
+    return sorted(meetings)
+
+
+def parse_slot(text):
+    """Parse a ``free_at`` value into ``(start, end)`` minutes since Monday 00:00
+
+    Either a moment, "Tuesday 4:00 PM" (then ``start == end``), or a window,
+    "Tuesday 3:30 PM - 5:00 PM". Raises ValueError when it is neither.
+    """
+    days = parse_days(text)
+    if len(days) != 1:
+        raise ValueError("Expected a single day")
+    window = _RANGE_PATTERN.search(text)
+    if window is not None:
+        meetings = list(_weekly(days[0], *_range(window)))
+        if len(meetings) != 1:
+            raise ValueError("Windows cannot span the end of the week")
+        return meetings[0]
+    moment = _TIME_PATTERN.search(text)
+    if moment is None:
+        raise ValueError("Expected a time")
+    start = DAYS.index(days[0]) * MINUTES_PER_DAY + _minutes(*moment.groups())
+    return start, start
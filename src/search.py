@@ -0,0 +1,312 @@
+"""
+Keyword search over activities and participant emails
+
+``SearchIndex`` keeps an inverted index from the case-folded words of
+activity names and descriptions to the activities containing them, a
+sorted vocabulary for prefix matching ("chem" finds "chemistry") and a
+trigram index of the vocabulary for fuzzy matching ("chemsitry"). Every
+query word must match each result, exactly, as a prefix or fuzzily, and
+results are ranked by how well and how rare the matched words are, with
+words of the name counting more than words of the description.
+
+Participant emails are kept sorted, case-folded, for prefix search. They
+are updated from signup, removal and promotion mutations; names and
+descriptions only change when the store is reloaded, which rebuilds the
+index.
+
+Results are found best first: the activities of the rarest query word are
+kept per field, sorted by name, and scanned from the best possible score
+down, stopping once ``limit`` results beat anything left to scan. Queries
+whose best results are rare are narrowed down first, by intersecting the
+activities of their words as sets. A query word expands to at most
+``MAX_EXPANSIONS`` vocabulary words. Queries stay under a millisecond at
+100k activities.
+"""
+
+import bisect
+import functools
+import heapq
+import math
+import operator
+import re
+from collections import Counter
+
+from .indexes import DerivedIndex
+from .listing import InvalidQueryError
+from .profiling import span
+
+TOKEN = re.compile(r"\w+")
+EMPTY = frozenset()
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+# Match quality of a vocabulary word for a query word
+EXACT = 1.0
+PREFIX = 0.8
+FUZZY = 0.6
+MIN_SIMILARITY = 0.5
+MIN_FUZZY_LENGTH = 4
+# Rounded so that equal scores summed in another order tie, and rank by name
+SCORE_DIGITS = 6
+MAX_EXPANSIONS = 50
+# Candidate sets up to this size are scored outright rather than scanned
+MAX_SCORED = 1000
+# Activities scored best first before narrowing the candidates down
+SCAN_BUDGET = 200
+MAX_LIMIT = 50
+
+
+def tokenize(text):
+    return TOKEN.findall(text.casefold())
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex(DerivedIndex):
+    """Inverted, prefix and trigram indexes over activities, plus sorted emails"""
+
+    def rebuild(self, activities):
+        # activity -> {word: field weight}
+        self.terms = {}
+        # word -> set of activities, and the same split per field as sorted lists
+        self.postings = {}
+        in_names, in_descriptions = {}, {}
+        # In name order, so that the per-field lists come out sorted
+        for name in sorted(activities):
+            details = activities[name]
+            weights = dict.fromkeys(tokenize(details["description"]), DESCRIPTION_WEIGHT)
+            weights.update(dict.fromkeys(tokenize(name), NAME_WEIGHT))
+            self.terms[name] = weights
+            for word, weight in weights.items():
+                self.postings.setdefault(word, set()).add(name)
+                field = in_names if weight == NAME_WEIGHT else in_descriptions
+                field.setdefault(word, []).append(name)
+        self.fields = {word: ((NAME_WEIGHT, in_names.get(word, ())),
+                              (DESCRIPTION_WEIGHT, in_descriptions.get(word, ())))
+                       for word in self.postings}
+        self.named = {word: set(names) for word, names in in_names.items()}
+        self.vocabulary = sorted(self.postings)
+        self.trigrams = {}
+        for word in self.vocabulary:
+            if len(word) >= MIN_FUZZY_LENGTH - 1 and not word.isdigit():
+                for trigram in trigrams(word):
+                    self.trigrams.setdefault(trigram, []).append(word)
+
+        # case-folded email -> [email, number of activities]
+        self.emails = {}
+        for details in activities.values():
+            for email in details["participants"]:
+                self._add_email(email)
+        self.sorted_emails = sorted(self.emails)
+
+    def _add_email(self, email):
+        key = email.casefold()
+        entry = self.emails.get(key)
+        if entry is None:
+            self.emails[key] = [email, 1]
+            return key
+        entry[1] += 1
+        return None
+
+    def apply(self, mutation):
+        if mutation.kind in ("signup", "promote"):
+            key = self._add_email(mutation.email)
+            if key is not None:
+                bisect.insort(self.sorted_emails, key)
+        elif mutation.kind == "remove":
+            key = mutation.email.casefold()
+            entry = self.emails.get(key)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.emails[key]
+                    del self.sorted_emails[bisect.bisect_left(self.sorted_emails, key)]
+
+    def _expand(self, word):
+        """Return ``{vocabulary word: match quality}`` for a query word"""
+        expansions = {}
+        if word in self.postings:
+            expansions[word] = EXACT
+        start = bisect.bisect_left(self.vocabulary, word)
+        for candidate in self.vocabulary[start:start + MAX_EXPANSIONS]:
+            if not candidate.startswith(word):
+                break
+            if candidate != word:
+                # "chem" is a better match for "chemistry" than "c" is
+                expansions[candidate] = PREFIX * len(word) / len(candidate)
+        if not expansions and len(word) >= MIN_FUZZY_LENGTH:
+            expansions = self._fuzzy(word)
+        return expansions
+
+    def _fuzzy(self, word):
+        wanted = trigrams(word)
+        shared = Counter()
+        for trigram in wanted:
+            shared.update(self.trigrams.get(trigram, ()))
+        matches = {}
+        for candidate, count in shared.most_common(MAX_EXPANSIONS):
+            # Dice coefficient of the trigram sets
+            similarity = 2 * count / (len(wanted) + len(trigrams(candidate)))
+            if similarity >= MIN_SIMILARITY:
+                matches[candidate] = FUZZY * similarity
+        return matches
+
+    @staticmethod
+    def _score(weights, scored):
+        """Best contribution of one query word, given as ``scored``, to an activity"""
+        if len(scored) == 1:
+            for match, value in scored.items():
+                return value * weights.get(match, 0.0)
+        if len(scored) < len(weights):
+            return max((value * weights[match] for match, value in scored.items()
+                        if match in weights), default=0.0)
+        return max((weight * scored[word] for word, weight in weights.items()
+                    if word in scored), default=0.0)
+
+    def search(self, query, limit=10):
+        """Return up to ``limit`` ``(activity, score)`` pairs, best first"""
+        self.ensure_current()
+        with self._lock:
+            words = list(dict.fromkeys(tokenize(query)))
+            if not words or limit < 1:
+                return []
+            expanded = []
+            idf = len(self.terms) + 1
+            for word in words:
+                expansions = self._expand(word)
+                if not expansions:
+                    return []
+                scored = {match: quality * math.log(idf / len(self.postings[match]))
+                          for match, quality in expansions.items()}
+                size = sum(len(self.postings[match]) for match in expansions)
+                expanded.append((size, scored))
+            # Rarest word first: its activities are the ones scanned
+            expanded = [scored for _, scored in sorted(expanded, key=lambda item: item[0])]
+            if len(expanded) > 1 and all(len(scored) == 1 for scored in expanded):
+                named = self._named(expanded, limit)
+                if named is not None:
+                    return named
+                results = None
+            else:
+                # Most queries find their best results among the first activities
+                # scanned, others are better narrowed down first
+                results = self._scan(expanded[0], expanded[1:], None, limit, SCAN_BUDGET)
+            if results is None:
+                results = self._narrow(expanded, limit)
+            top = heapq.nsmallest(limit, results, key=lambda item: (-item[0], item[1]))
+            return [(name, score) for score, name in top]
+
+    def _named(self, expanded, limit):
+        """Return the best results if ``limit`` activities have every word in their name
+
+        Only for queries of exact words: those activities then share the best
+        possible score, and are ranked by name.
+        """
+        named = sorted((self.named.get(next(iter(scored)), EMPTY) for scored in expanded),
+                       key=len)
+        found = functools.reduce(operator.and_, named[1:], named[0])
+        if len(found) < limit:
+            return None
+        score = round(sum(next(iter(scored.values())) * NAME_WEIGHT for scored in expanded),
+                      SCORE_DIGITS)
+        return [(name, score) for name in heapq.nsmallest(limit, found)]
+
+    def _narrow(self, expanded, limit):
+        # Activities of the words matching a single vocabulary word are intersected in C
+        exact = sorted((self.postings[next(iter(scored))] for scored in expanded
+                        if len(scored) == 1), key=len)
+        candidates = functools.reduce(operator.and_, exact[1:], exact[0]) if exact else None
+        if candidates is None or len(candidates) > MAX_SCORED:
+            return self._scan(expanded[0], expanded[1:], candidates, limit)
+        results = []
+        for name in candidates:
+            score = self._total(self.terms[name], expanded)
+            if score:
+                results.append((round(score, SCORE_DIGITS), name))
+        return results
+
+    def _total(self, weights, expanded):
+        score = 0.0
+        for scored in expanded:
+            value = self._score(weights, scored)
+            if not value:
+                return 0.0
+            score += value
+        return score
+
+    def _scan(self, driver, others, candidates, limit, budget=None):
+        """Score the activities matching ``driver`` best first, until ``limit`` are found
+
+        The driver's activities are grouped by contribution, and the scan stops
+        once ``limit`` results beat what the next activity could still score.
+        Returns None when more than ``budget`` activities would be scored.
+        """
+        rest = sum(max(scored.values()) * NAME_WEIGHT for scored in others)
+        groups = sorted(((value * weight, names) for match, value in driver.items()
+                         for weight, names in self.fields[match] if names),
+                        key=lambda group: group[0], reverse=True)
+        best, results, seen = [], [], set()
+        for contribution, names in groups:
+            bound = round(contribution + rest, SCORE_DIGITS)
+            for name in names:
+                if len(best) == limit and best[0] >= bound:
+                    break
+                if name in seen or (candidates is not None and name not in candidates):
+                    continue
+                # Activities come first in the group of their best match
+                seen.add(name)
+                if budget is not None and len(seen) > budget:
+                    return None
+                score = self._total(self.terms[name], others)
+                if score or not others:
+                    score = round(score + contribution, SCORE_DIGITS)
+                    results.append((score, name))
+                    if len(best) < limit:
+                        heapq.heappush(best, score)
+                    elif score > best[0]:
+                        heapq.heapreplace(best, score)
+            else:
+                continue
+            break
+        return results
+
+    def search_emails(self, prefix, limit=10):
+        """Return up to ``limit`` participant emails starting with ``prefix``, ignoring case"""
+        self.ensure_current()
+        key = prefix.casefold()
+        with self._lock:
+            start = bisect.bisect_left(self.sorted_emails, key)
+            found = []
+            for candidate in self.sorted_emails[start:start + limit]:
+                if not candidate.startswith(key):
+                    break
+                found.append(self.emails[candidate][0])
+            return found
+
+
+def search_activities(store, index, students, query, limit=10):
+    """Return ``{"activities": ..., "students": ...}`` for a search query
+
+    Activities are ranked best first, each with its score and details but
+    without participants; students are the participants whose email starts
+    with the query, with their activities (from the ``StudentIndex``).
+    """
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidQueryError(f"limit must be between 1 and {MAX_LIMIT}")
+    query = query.strip()
+    if not query:
+        raise InvalidQueryError("Empty query")
+
+    with span("search"):
+        ranked = index.search(query, limit)
+        emails = index.search_emails(query, limit)
+    with span("fetch"):
+        details = store.get_many([name for name, _ in ranked], include_participants=False)
+        return {
+            "activities": [dict(details[name], name=name, score=score)
+                           for name, score in ranked if name in details],
+            "students": [{"email": email, "activities": students.lookup(email)[0]}
+                         for email in emails],
+        }
@@ -0,0 +1,81 @@
+"""
+Pre-serialized snapshots of the activity list
+
+Serializing every activity and participant on each ``GET /activities`` is
+wasted work when nothing changed since the previous request. The cache keeps
+the encoded JSON together with the store version it was built from, and only
+rebuilds it once a signup or removal bumps that version.
+"""
+
+import hashlib
+import threading
+from dataclasses import dataclass, field
+
+from .profiling import span
+from .responses import compress, encode_json
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: int
+    body: bytes
+    etag: str
+    # Compressed bodies by encoding, built on first request
+    compressed: dict = field(default_factory=dict, compare=False, repr=False)
+
+    def encoded(self, encoding, level=None):
+        """Return the body compressed with ``encoding``, or as is for None"""
+        if encoding is None:
+            return self.body
+        body = self.compressed.get(encoding)
+        if body is None:
+            with span("compress"):
+                body = self.compressed[encoding] = compress(self.body, encoding, level)
+        return body
+
+
+class SnapshotCache:
+    """Keeps the serialized ``GET /activities`` payload for the current store version"""
+
+    def __init__(self, store):
+        self.store = store
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        snapshot = self._snapshot
+        version = self.store.version()
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            # Another thread may have rebuilt it while we were waiting
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = self._build(version)
+                self._snapshot = snapshot
+        return snapshot
+
+    def _build(self, version):
+        # The version is read before the data, so the body is never older
+        # than the version it is labelled with
+        with span("fetch"):
+            activities = self.store.get_all()
+        with span("encode_json"):
+            body = encode_json(activities)
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        return Snapshot(version, body, etag)
+
+
+def etag_matches(if_none_match, etag):
+    """Return True when an ``If-None-Match`` header matches ``etag``"""
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
@@ -1,31 +1,25 @@
+// Current activities, kept up to date by fetchActivities and by live events
+let activitiesState = {};
+
+// True while the live event stream is connected
+let liveUpdates = false;
+
 // Function to fetch activities from API
 async function fetchActivities() {
   const activitiesList = document.getElementById("activities-list");
   const activitySelect = document.getElementById("activity");
-  const participantsList = document.getElementById("participants-list");
 
   try {
     const response = await fetch("/activities");
-    const activities = await response.json();
+    activitiesState = await response.json();
 
-    // Clear loading message
+    // Clear loading message and previously loaded options
     activitiesList.innerHTML = "";
+    activitySelect.querySelectorAll("option:not([value=''])").forEach((option) => option.remove());
 
     // Populate activities list
-    Object.entries(activities).forEach(([name, details]) => {
-      const activityCard = document.createElement("div");
-      activityCard.className = "activity-card";
-
-      const spotsLeft = details.max_participants - details.participants.length;
-
-      activityCard.innerHTML = `
-        <h4>${name}</h4>
-        <p>${details.description}</p>
-        <p><strong>Schedule:</strong> ${details.schedule}</p>
-        <p><strong>Availability:</strong> ${spotsLeft} spots left</p>
-      `;
-
-      activitiesList.appendChild(activityCard);
+    Object.entries(activitiesState).forEach(([name, details]) => {
+      activitiesList.appendChild(createActivityCard(name, details));
 
       // Add option to select dropdown
       const option = document.createElement("option");
@@ -35,126 +29,128 @@ async function fetchActivities() {
     });
 
     // Populate participants section
-    populateParticipants(activities);
+    populateParticipants(activitiesState);
   } catch (error) {
     activitiesList.innerHTML = "<p>Failed to load activities. Please try again later.</p>";
     console.error("Error fetching activities:", error);
   }
 }
 
+// Function to build the card shown in the activities list
+function createActivityCard(name, details) {
+  const activityCard = document.createElement("div");
+  activityCard.className = "activity-card";
+  activityCard.dataset.activity = name;
+
+  const spotsLeft = details.max_participants - details.participants.length;
+
+  activityCard.innerHTML = `
+    <h4>${name}</h4>
+    <p>${details.description}</p>
+    <p><strong>Schedule:</strong> ${details.schedule}</p>
+    <p><strong>Availability:</strong> ${spotsLeft} spots left</p>
+  `;
+
+  return activityCard;
+}
+
+// Function to build the card listing the participants of an activity
+function createParticipantCard(name, details) {
+  const participantCard = document.createElement("div");
+  participantCard.className = "activity-participant-card";
+  participantCard.dataset.activity = name;
+
+  const participantsHtml = details.participants.length > 0
+    ? `<ul class="participants-list">
+         ${details.participants.map(email => `
+           <li>
+             <span>${email}</span>
+             <button class="delete-participant-btn" onclick="removeParticipant('${name}', '${email}')" title="Rimuovi partecipante">
+               ✖
+             </button>
+           </li>
+         `).join('')}
+       </ul>`
+    : `<p class="no-participants">No participants yet.</p>`;
+
+  participantCard.innerHTML = `
+    <h4 class="activity-name">${name}</h4>
+    <div class="participants-section">
+      <h5>Current Participants:</h5>
+      ${participantsHtml}
+    </div>
+  `;
+
+  return participantCard;
+}
+
 // Function to populate participants section
 function populateParticipants(activities) {
   const participantsList = document.getElementById("participants-list");
   participantsList.innerHTML = "";
 
   Object.entries(activities).forEach(([name, details]) => {
-    const participantCard = document.createElement("div");
-    participantCard.className = "activity-participant-card";
-
-    const participantsHtml = details.participants.length > 0 
-      ? `<ul class="participants-list">
-           ${details.participants.map(email => `
-             <li>
-               <span>${email}</span>
-               <button class="delete-participant-btn" onclick="removeParticipant('${name}', '${email}')" title="Rimuovi partecipante">
-                 ✖
-               </button>
-             </li>
-           `).join('')}
-         </ul>`
-      : `<p class="no-participants">No participants yet.</p>`;
-
-    participantCard.innerHTML = `
-      <h4 class="activity-name">${name}</h4>
-      <div class="participants-section">
-        <h5>Current Participants:</h5>
-        ${participantsHtml}
-      </div>
-    `;
-
-    participantsList.appendChild(participantCard);
+    participantsList.appendChild(createParticipantCard(name, details));
   });
 }
 
-document.addEventListener("DOMContentLoaded", () => {
-  const activitiesList = document.getElementById("activities-list");
-  const activitySelect = document.getElementById("activity");
-  const signupForm = document.getElementById("signup-form");
-  const messageDiv = document.getElementById("message");
-  const participantsList = document.getElementById("participants-list");
-
-  // Function to fetch activities from API
-  async function fetchActivities() {
-    try {
-      const response = await fetch("/activities");
-      const activities = await response.json();
-
-      // Clear loading message
-      activitiesList.innerHTML = "";
-
-      // Populate activities list
-      Object.entries(activities).forEach(([name, details]) => {
-        const activityCard = document.createElement("div");
-        activityCard.className = "activity-card";
+// Function to apply a signup, promotion or removal event to a single activity
+function applyActivityEvent(type, data) {
+  const details = activitiesState[data.activity];
+  if (!details) {
+    fetchActivities();
+    return;
+  }
 
-        const spotsLeft = details.max_participants - details.participants.length;
+  if ((type === "signup" || type === "promoted") && !details.participants.includes(data.email)) {
+    details.participants.push(data.email);
+  } else if (type === "removed") {
+    details.participants = details.participants.filter((email) => email !== data.email);
+  }
 
-        activityCard.innerHTML = `
-          <h4>${name}</h4>
-          <p>${details.description}</p>
-          <p><strong>Schedule:</strong> ${details.schedule}</p>
-          <p><strong>Availability:</strong> ${spotsLeft} spots left</p>
-        `;
+  // Re-render only the two cards of this activity
+  const selector = `[data-activity="${CSS.escape(data.activity)}"]`;
+  const activityCard = document.querySelector(`.activity-card${selector}`);
+  if (activityCard) {
+    activityCard.replaceWith(createActivityCard(data.activity, details));
+  }
+  const participantCard = document.querySelector(`.activity-participant-card${selector}`);
+  if (participantCard) {
+    participantCard.replaceWith(createParticipantCard(data.activity, details));
+  }
+}
 
-        activitiesList.appendChild(activityCard);
+// Function to subscribe to live roster changes pushed by the server
+function subscribeToActivityEvents() {
+  if (!window.EventSource) {
+    return;
+  }
 
-        // Add option to select dropdown
-        const option = document.createElement("option");
-        option.value = name;
-        option.textContent = name;
-        activitySelect.appendChild(option);
-      });
+  const source = new EventSource("/activities/events");
+  let disconnected = false;
 
-      // Populate participants section
-      populateParticipants(activities);
-    } catch (error) {
-      activitiesList.innerHTML = "<p>Failed to load activities. Please try again later.</p>";
-      console.error("Error fetching activities:", error);
+  source.onopen = () => {
+    liveUpdates = true;
+    // Changes made while we were disconnected were missed
+    if (disconnected) {
+      fetchActivities();
     }
-  }
+  };
+  source.onerror = () => {
+    // EventSource reconnects by itself
+    liveUpdates = false;
+    disconnected = true;
+  };
+
+  source.addEventListener("signup", (event) => applyActivityEvent("signup", JSON.parse(event.data)));
+  source.addEventListener("promoted", (event) => applyActivityEvent("promoted", JSON.parse(event.data)));
+  source.addEventListener("removed", (event) => applyActivityEvent("removed", JSON.parse(event.data)));
+  source.addEventListener("reset", () => fetchActivities());
+}
 
-  // Function to populate participants section
-  function populateParticipants(activities) {
-    participantsList.innerHTML = "";
-
-    Object.entries(activities).forEach(([name, details]) => {
-      const participantCard = document.createElement("div");
-      participantCard.className = "activity-participant-card";
-
-      const participantsHtml = details.participants.length > 0 
-        ? `<ul class="participants-list">
-             ${details.participants.map(email => `
-               <li>
-                 <span>${email}</span>
-                 <button class="delete-participant-btn" onclick="removeParticipant('${name}', '${email}')" title="Rimuovi partecipante">
-                   ✖
-                 </button>
-               </li>
-             `).join('')}
-           </ul>`
-        : `<p class="no-participants">No participants yet.</p>`;
-
-      participantCard.innerHTML = `
-        <h4 class="activity-name">${name}</h4>
-        <div class="participants-section">
-          <h5>Current Participants:</h5>
-          ${participantsHtml}
-        </div>
-      `;
-
-      participantsList.appendChild(participantCard);
-    });
-  }
+document.addEventListener("DOMContentLoaded", () => {
+  const signupForm = document.getElementById("signup-form");
+  const messageDiv = document.getElementById("message");
 
   // Handle form submission
   signupForm.addEventListener("submit", async (event) => {
@@ -164,22 +160,29 @@ document.addEventListener("DOMContentLoaded", () => {
     const activity = document.getElementById("activity").value;
 
     try {
-      const response = await fetch(
-        `/activities/${encodeURIComponent(activity)}/signup?email=${encodeURIComponent(email)}`,
-        {
-          method: "POST",
-        }
-      );
+      const query = `email=${encodeURIComponent(email)}`;
+      let response = await fetch(`/activities/${encodeURIComponent(activity)}/signup?${query}`, {
+        method: "POST",
+      });
+      let result = await response.json();
 
-      const result = await response.json();
+      // Queue for a full activity instead of asking the student to retry
+      if (response.status === 400 && result.detail === "Activity is full") {
+        response = await fetch(`/activities/${encodeURIComponent(activity)}/waitlist?${query}`, {
+          method: "POST",
+        });
+        result = await response.json();
+      }
 
       if (response.ok) {
         messageDiv.textContent = result.message;
         messageDiv.className = "success";
         signupForm.reset();
-        
-        // Refresh activities to show updated participants
-        fetchActivities();
+
+        // Live events update the lists, refresh only without them
+        if (!liveUpdates) {
+          fetchActivities();
+        }
       } else {
         messageDiv.textContent = result.detail || "An error occurred";
         messageDiv.className = "error";
@@ -201,6 +204,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
   // Initialize app
   fetchActivities();
+  subscribeToActivityEvents();
 });
 
 // Function to remove participant (global scope for onclick)
@@ -225,10 +229,12 @@ async function removeParticipant(activityName, email) {
       messageDiv.textContent = result.message;
       messageDiv.className = "success";
       messageDiv.classList.remove("hidden");
-      
-      // Refresh activities to show updated participants
-      fetchActivities();
-      
+
+      // Live events update the lists, refresh only without them
+      if (!liveUpdates) {
+        fetchActivities();
+      }
+
       // Hide message after 3 seconds
       setTimeout(() => {
         messageDiv.classList.add("hidden");
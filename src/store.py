@@ -0,0 +1,1055 @@
+"""
+Storage engines for the Mergington High School API
+
+The API talks to an ``ActivityStore`` instead of touching the activity data
+directly. Two implementations are provided:
+
+- ``InMemoryActivityStore`` keeps ``Activity`` records, copied from the
+  seed catalog on first use (the default, data is lost when the server
+  restarts)
+- ``SQLiteActivityStore`` persists activities in a SQLite database in WAL
+  mode, so several uvicorn workers can share the same file
+"""
+
+import asyncio
+import queue
+import sqlite3
+import threading
+import uuid
+import weakref
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from starlette.concurrency import run_in_threadpool
+
+from .models import ActivityTable
+from .profiling import span
+
+
+class ActivityStoreError(Exception):
+    """Base class for errors raised by a store, mapped to HTTP errors by the API"""
+    status_code = 400
+    detail = "Invalid request"
+
+    def __init__(self, detail=None):
+        super().__init__(detail or self.detail)
+        if detail is not None:
+            self.detail = detail
+
+
+class ActivityNotFoundError(ActivityStoreError):
+    status_code = 404
+    detail = "Activity not found"
+
+
+class AlreadySignedUpError(ActivityStoreError):
+    status_code = 400
+    detail = "Student already signed up for this activity"
+
+
+class ActivityFullError(ActivityStoreError):
+    status_code = 400
+    detail = "Activity is full"
+
+
+class ParticipantNotFoundError(ActivityStoreError):
+    status_code = 404
+    detail = "Student not found in this activity"
+
+
+class AlreadyWaitlistedError(ActivityStoreError):
+    status_code = 400
+    detail = "Student already on the waitlist for this activity"
+
+
+class NotWaitlistedError(ActivityStoreError):
+    status_code = 404
+    detail = "Student not on the waitlist for this activity"
+
+
+class ScheduleConflictError(ActivityStoreError):
+    status_code = 409
+    detail = "Activity meets at the same time as another activity of the student"
+
+
+class BatchRejectedError(ActivityStoreError):
+    status_code = 409
+    detail = "Not applied because another item in the batch failed"
+
+
+@dataclass(frozen=True)
+class BatchItemResult:
+    """Outcome of one item of a batch signup or removal"""
+    activity: str
+    email: str
+    error: ActivityStoreError = None
+    total: int = None
+
+
+@dataclass(frozen=True)
+class Mutation:
+    """A change applied to a store, passed to its listeners
+
+    ``kind`` is ``signup``, ``remove``, ``waitlist`` (joined the waitlist),
+    ``unwaitlist`` (left it), ``promote`` (moved from the waitlist to the
+    participants when a seat freed up) or ``load``. ``version`` is the store
+    version right after the change; ``total`` and ``max_participants``
+    describe the activity once the change has been applied.
+    """
+    kind: str
+    version: int
+    activity: str = None
+    email: str = None
+    total: int = 0
+    max_participants: int = 0
+
+
+class ActivityStore(ABC):
+    """Interface shared by every storage engine
+
+    Listeners registered with ``subscribe`` are called with a ``Mutation``
+    after every change. They run while the store holds its locks, so they
+    must be quick and must not call back into the store.
+    """
+
+    # Whether calls may block on I/O; blocking stores are kept off the event loop
+    blocking = True
+
+    def __init__(self):
+        self._listeners = []
+        # (version, activities) of the latest load made by this process
+        self._loaded = None
+        self._data_id = uuid.uuid4().hex
+
+    def subscribe(self, listener):
+        """Call ``listener(mutation)`` after every change to the store"""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self._listeners.remove(listener)
+
+    def _notify(self, mutation):
+        for listener in self._listeners:
+            listener(mutation)
+
+    @abstractmethod
+    def get_all(self):
+        """Return every activity as a JSON-ready dict keyed by activity name
+
+        The result may share lists with the store's seed: treat it as read-only.
+        """
+
+    @abstractmethod
+    def get_many(self, names, include_participants=True):
+        """Return the named activities as JSON-ready dicts, skipping unknown names
+
+        Without ``include_participants`` the participant lists are left out
+        and a ``participant_count`` is returned instead.
+        """
+
+    @abstractmethod
+    def iter_roster(self):
+        """Yield ``(activity_name, email)`` for every participant, without loading them all"""
+
+    @abstractmethod
+    def signup(self, activity_name, email):
+        """Add a student to an activity and return the new participant count"""
+
+    @abstractmethod
+    def remove(self, activity_name, email):
+        """Remove a student from an activity and return the new participant count
+
+        The head of the activity's waitlist, if any, is promoted to the freed
+        seat in the same step, and counted.
+        """
+
+    @abstractmethod
+    def join_waitlist(self, activity_name, email):
+        """Queue a student for a full activity and return their position
+
+        When the activity has a free seat the student is signed up instead
+        and 0 is returned.
+        """
+
+    @abstractmethod
+    def leave_waitlist(self, activity_name, email):
+        """Take a student off an activity's waitlist and return its new length"""
+
+    @abstractmethod
+    def waitlist_position(self, activity_name, email=None):
+        """Return ``(position, length)`` of an activity's waitlist
+
+        ``position`` is that of ``email`` (1 for the head), or None without
+        an email.
+        """
+
+    @abstractmethod
+    def get_waitlists(self):
+        """Return ``{activity_name: [email, ...]}`` for every non-empty waitlist"""
+
+    @abstractmethod
+    def signup_many(self, items, atomic=False):
+        """Sign up every ``(activity_name, email)`` pair in one pass
+
+        Returns a ``BatchItemResult`` per item. With ``atomic`` nothing is
+        applied unless every item succeeds.
+        """
+
+    @abstractmethod
+    def remove_many(self, items, atomic=False):
+        """Remove every ``(activity_name, email)`` pair in one pass, like ``signup_many``"""
+
+    @abstractmethod
+    def load(self, activities):
+        """Replace the stored activities with the given dict"""
+
+    @abstractmethod
+    def version(self):
+        """Return a number that changes every time the stored data changes"""
+
+    def data_id(self):
+        """Return an id shared by every process using the same data
+
+        Versions only grow within one id: a new in-memory store, or a new
+        database, numbers its versions again from the start.
+        """
+        return self._data_id
+
+    def load_if_empty(self, activities):
+        """Seed the store with the given activities unless it already has data"""
+        if not self.get_all():
+            self.load(activities)
+
+    def snapshot(self):
+        """Return ``(version, activities)`` with each activity's waitlist merged in
+
+        Activities with a waitlist have it under a ``"waitlist"`` key. The
+        version is read before the data, so the data is never older than it:
+        it may already hold changes made after that version, and whoever
+        applies the following changes on top of it must do so idempotently.
+        """
+        version = self.version()
+        activities = self.get_all()
+        for name, emails in self.get_waitlists().items():
+            if name in activities:
+                activities[name] = dict(activities[name], waitlist=emails)
+        return version, activities
+
+    def loaded_activities(self, version):
+        """Return the activities loaded by the ``load`` change ``version``, if still known
+
+        Only the latest load made by this process is remembered. This takes
+        no lock, so listeners may call it.
+        """
+        loaded = self._loaded
+        if loaded is not None and loaded[0] == version:
+            return loaded[1]
+        return None
+
+    def catch_up(self):
+        """Notify listeners of changes made by other processes sharing the store"""
+
+    def watch(self, interval=0.05):
+        """Keep calling ``catch_up`` in the background, every ``interval`` seconds"""
+
+    def close(self):
+        """Release any resource held by the store"""
+
+
+class InMemoryActivityStore(ActivityStore):
+    """Store keeping ``Activity`` records in an ``ActivityTable``"""
+
+    blocking = False
+
+    def __init__(self, activities=None):
+        super().__init__()
+        self.activities = ActivityTable()
+        self._version = 0
+        self._version_lock = threading.Lock()
+        if activities:
+            self.load(activities)
+
+    def _commit(self, kind, activity_name=None, email=None, activity=None):
+        # Versions are handed out and listeners notified under one lock, so
+        # listeners see mutations in version order
+        with self._version_lock:
+            self._version += 1
+            if activity is None:
+                mutation = Mutation(kind, self._version)
+                if kind == "load":
+                    self._loaded = (self._version, self.activities.catalog)
+            else:
+                mutation = Mutation(kind, self._version, activity_name, email,
+                                    len(activity.participants), activity.max_participants)
+            self._notify(mutation)
+
+    def _promote(self, activity_name, activity):
+        # Called with the activity lock held, right after a seat freed up
+        if activity.waitlist and not activity.is_full:
+            email = activity.waitlist.popleft()
+            activity.participants.add(email)
+            self._commit("promote", activity_name, email, activity)
+
+    def version(self):
+        return self._version
+
+    def _get(self, activity_name):
+        try:
+            return self.activities[activity_name]
+        except KeyError:
+            raise ActivityNotFoundError() from None
+
+    def get_all(self):
+        activities = self.activities
+        return {name: activities.details(name) for name in list(activities)}
+
+    def get_many(self, names, include_participants=True):
+        activities = self.activities
+        return {name: activities.details(name, include_participants)
+                for name in names if name in activities}
+
+    def iter_roster(self):
+        activities = self.activities
+        for name in list(activities):
+            # Copy one activity at a time so the lock is not held while the caller works
+            for email in activities.details(name)["participants"]:
+                yield name, email
+
+    def signup(self, activity_name, email):
+        activity = self._get(activity_name)
+        with activity.lock:
+            if email in activity.participants:
+                raise AlreadySignedUpError()
+            if activity.is_full:
+                raise ActivityFullError()
+            activity.participants.add(email)
+            self._commit("signup", activity_name, email, activity)
+            return len(activity.participants)
+
+    def remove(self, activity_name, email):
+        activity = self._get(activity_name)
+        with activity.lock:
+            if email not in activity.participants:
+                raise ParticipantNotFoundError()
+            activity.participants.remove(email)
+            self._commit("remove", activity_name, email, activity)
+            self._promote(activity_name, activity)
+            # Counted after the promotion, which may have refilled the seat
+            return len(activity.participants)
+
+    def join_waitlist(self, activity_name, email):
+        activity = self._get(activity_name)
+        with activity.lock:
+            if email in activity.participants:
+                raise AlreadySignedUpError()
+            if email in activity.waitlist:
+                raise AlreadyWaitlistedError()
+            if not activity.is_full:
+                activity.participants.add(email)
+                self._commit("signup", activity_name, email, activity)
+                return 0
+            position = activity.waitlist.append(email)
+            self._commit("waitlist", activity_name, email, activity)
+            return position
+
+    def leave_waitlist(self, activity_name, email):
+        activity = self._get(activity_name)
+        with activity.lock:
+            if email not in activity.waitlist:
+                raise NotWaitlistedError()
+            activity.waitlist.remove(email)
+            self._commit("unwaitlist", activity_name, email, activity)
+            return len(activity.waitlist)
+
+    def apply_change(self, kind, activity_name, email):
+        """Apply a change made by another store as is, and return whether it changed anything
+
+        Used by replicas: capacity is not checked and removals promote
+        nobody (the primary sends its promotions as changes of their own),
+        and changes already applied are skipped.
+        """
+        activity = self._get(activity_name)
+        with activity.lock:
+            if kind in ("signup", "promote"):
+                if email in activity.participants:
+                    return False
+                if email in activity.waitlist:
+                    activity.waitlist.remove(email)
+                activity.participants.add(email)
+            elif kind == "remove":
+                if email not in activity.participants:
+                    return False
+                activity.participants.remove(email)
+            elif kind == "waitlist":
+                if email in activity.waitlist or email in activity.participants:
+                    return False
+                activity.waitlist.append(email)
+            elif kind == "unwaitlist":
+                if email not in activity.waitlist:
+                    return False
+                activity.waitlist.remove(email)
+            else:
+                raise ValueError(f"Unknown change: {kind}")
+            self._commit(kind, activity_name, email, activity)
+            return True
+
+    def waitlist_position(self, activity_name, email=None):
+        activity = self._get(activity_name)
+        with activity.lock:
+            position = None
+            if email is not None:
+                position = activity.waitlist.position(email)
+                if position is None:
+                    raise NotWaitlistedError()
+            return position, len(activity.waitlist)
+
+    def get_waitlists(self):
+        activities = self.activities
+        result = {}
+        for name in list(activities):
+            waitlist = activities.waitlist(name)
+            if waitlist:
+                result[name] = waitlist
+        return result
+
+    def _batch(self, kind, items, atomic):
+        items = list(items)
+        # Lock every activity involved, in name order so batches cannot deadlock
+        involved = sorted({name for name, _ in items if name in self.activities})
+        locked = [self.activities[name] for name in involved]
+        for activity in locked:
+            activity.lock.acquire()
+        try:
+            activities = dict(zip(involved, locked))
+            pending = {name: set() for name in involved}
+            counts = {name: len(activity.participants) for name, activity in activities.items()}
+            results = []
+            for name, email in items:
+                activity = activities.get(name)
+                error = None
+                if activity is None:
+                    error = ActivityNotFoundError()
+                elif kind == "signup":
+                    if email in activity.participants or email in pending[name]:
+                        error = AlreadySignedUpError()
+                    elif counts[name] >= activity.max_participants:
+                        error = ActivityFullError()
+                elif email not in activity.participants or email in pending[name]:
+                    error = ParticipantNotFoundError()
+                if error is None:
+                    pending[name].add(email)
+                    counts[name] += 1 if kind == "signup" else -1
+                    results.append(BatchItemResult(name, email, total=counts[name]))
+                else:
+                    results.append(BatchItemResult(name, email, error))
+
+            if atomic and any(result.error for result in results):
+                return [result if result.error else
+                        BatchItemResult(result.activity, result.email, BatchRejectedError())
+                        for result in results]
+            for position, result in enumerate(results):
+                if result.error:
+                    continue
+                activity = activities[result.activity]
+                if kind == "signup":
+                    activity.participants.add(result.email)
+                    self._commit(kind, result.activity, result.email, activity)
+                else:
+                    activity.participants.remove(result.email)
+                    self._commit(kind, result.activity, result.email, activity)
+                    self._promote(result.activity, activity)
+                    # Promotions refill seats the counts above left empty
+                    results[position] = BatchItemResult(result.activity, result.email,
+                                                        total=len(activity.participants))
+            return results
+        finally:
+            for activity in reversed(locked):
+                activity.lock.release()
+
+    def signup_many(self, items, atomic=False):
+        return self._batch("signup", items, atomic)
+
+    def remove_many(self, items, atomic=False):
+        return self._batch("remove", items, atomic)
+
+    def load(self, activities):
+        # Copy-on-write: records are only built for the activities used, and
+        # the catalog itself is never changed, so it can be loaded again
+        self.activities = ActivityTable(activities)
+        self._commit("load")
+
+    def restore(self, activities, version):
+        """Load recovered activities and continue numbering versions after ``version``"""
+        with self._version_lock:
+            self._version = max(self._version, version - 1)
+        self.load(activities)
+
+
+class SQLiteActivityStore(ActivityStore):
+    """Store backed by a SQLite database in WAL mode
+
+    Connections are kept in a small pool and every statement is a constant
+    string, so sqlite3 reuses its prepared statements. Membership is enforced
+    by a unique index on ``(activity, email)`` and the participant count is
+    kept up to date by triggers, which makes signup and removal a single
+    indexed write each.
+
+    Waitlists are rows ordered by their id, so promoting the head is an
+    indexed lookup of the smallest id of the activity.
+
+    The triggers also append every change to a ``changes`` table, so each
+    process sharing the database can notify its listeners of the changes
+    made by the others: listeners are always fed from that table, in version
+    order, after local writes and whenever ``catch_up`` runs.
+    """
+
+    # Only the latest changes are kept; a process further behind starts over
+    CHANGES_KEPT = 10_000
+    PRUNE_EVERY = 1000
+
+    SCHEMA = """
+        BEGIN IMMEDIATE;
+        CREATE TABLE IF NOT EXISTS activities (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            description TEXT NOT NULL,
+            schedule TEXT NOT NULL,
+            max_participants INTEGER NOT NULL,
+            participant_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS participants (
+            id INTEGER PRIMARY KEY,
+            activity TEXT NOT NULL REFERENCES activities(name) ON DELETE CASCADE,
+            email TEXT NOT NULL,
+            UNIQUE (activity, email)
+        );
+        CREATE TABLE IF NOT EXISTS store_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO store_version (id, version) VALUES (1, 0);
+        CREATE TABLE IF NOT EXISTS store_id (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value TEXT NOT NULL
+        );
+        INSERT OR IGNORE INTO store_id (id, value) VALUES (1, lower(hex(randomblob(16))));
+        CREATE TABLE IF NOT EXISTS changes (
+            version INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            activity TEXT,
+            email TEXT,
+            total INTEGER,
+            max_participants INTEGER
+        );
+        -- Replaced by the triggers below, which also record the change
+        DROP TRIGGER IF EXISTS participants_insert;
+        DROP TRIGGER IF EXISTS participants_delete;
+        CREATE TRIGGER IF NOT EXISTS participant_added AFTER INSERT ON participants
+        BEGIN
+            UPDATE activities SET participant_count = participant_count + 1
+            WHERE name = NEW.activity;
+            UPDATE store_version SET version = version + 1 WHERE id = 1;
+            INSERT INTO changes (version, kind, activity, email, total, max_participants)
+            SELECT (SELECT version FROM store_version WHERE id = 1), 'signup', name,
+                   NEW.email, participant_count, max_participants
+            FROM activities WHERE name = NEW.activity;
+        END;
+        CREATE TRIGGER IF NOT EXISTS participant_removed AFTER DELETE ON participants
+        BEGIN
+            UPDATE activities SET participant_count = participant_count - 1
+            WHERE name = OLD.activity;
+            UPDATE store_version SET version = version + 1 WHERE id = 1;
+            INSERT INTO changes (version, kind, activity, email, total, max_participants)
+            SELECT (SELECT version FROM store_version WHERE id = 1), 'remove', name,
+                   OLD.email, participant_count, max_participants
+            FROM activities WHERE name = OLD.activity;
+        END;
+        CREATE TABLE IF NOT EXISTS waitlist (
+            id INTEGER PRIMARY KEY,
+            activity TEXT NOT NULL REFERENCES activities(name) ON DELETE CASCADE,
+            email TEXT NOT NULL,
+            UNIQUE (activity, email)
+        );
+        CREATE INDEX IF NOT EXISTS waitlist_order ON waitlist (activity, id);
+        CREATE TRIGGER IF NOT EXISTS waitlist_joined AFTER INSERT ON waitlist
+        BEGIN
+            UPDATE store_version SET version = version + 1 WHERE id = 1;
+            INSERT INTO changes (version, kind, activity, email, total, max_participants)
+            SELECT (SELECT version FROM store_version WHERE id = 1), 'waitlist', name,
+                   NEW.email, participant_count, max_participants
+            FROM activities WHERE name = NEW.activity;
+        END;
+        -- A promotion signs the student up first and is recorded as one change
+        CREATE TRIGGER IF NOT EXISTS waitlist_left AFTER DELETE ON waitlist
+        WHEN NOT EXISTS (SELECT 1 FROM participants
+                         WHERE activity = OLD.activity AND email = OLD.email)
+        BEGIN
+            UPDATE store_version SET version = version + 1 WHERE id = 1;
+            INSERT INTO changes (version, kind, activity, email, total, max_participants)
+            SELECT (SELECT version FROM store_version WHERE id = 1), 'unwaitlist', name,
+                   OLD.email, participant_count, max_participants
+            FROM activities WHERE name = OLD.activity;
+        END;
+        COMMIT;
+    """
+
+    SIGNUP_SQL = """
+        INSERT INTO participants (activity, email)
+        SELECT name, ?2 FROM activities
+        WHERE name = ?1 AND participant_count < max_participants
+        ON CONFLICT (activity, email) DO NOTHING
+    """
+    REMOVE_SQL = "DELETE FROM participants WHERE activity = ?1 AND email = ?2"
+    COUNT_SQL = "SELECT participant_count, max_participants FROM activities WHERE name = ?1"
+    MEMBER_SQL = "SELECT 1 FROM participants WHERE activity = ?1 AND email = ?2"
+    VERSION_SQL = "SELECT version FROM store_version WHERE id = 1"
+    CHANGES_SQL = """
+        SELECT version, kind, activity, email, total, max_participants FROM changes
+        WHERE version > ?1 ORDER BY version LIMIT 1000
+    """
+    PRUNE_SQL = "DELETE FROM changes WHERE version <= ?1"
+    WAITLIST_JOIN_SQL = """
+        INSERT INTO waitlist (activity, email) VALUES (?1, ?2)
+        ON CONFLICT (activity, email) DO NOTHING
+    """
+    WAITLIST_LEAVE_SQL = "DELETE FROM waitlist WHERE activity = ?1 AND email = ?2"
+    WAITLIST_HEAD_SQL = "SELECT id, email FROM waitlist WHERE activity = ?1 ORDER BY id LIMIT 1"
+    WAITLIST_LENGTH_SQL = "SELECT COUNT(*) FROM waitlist WHERE activity = ?1"
+    WAITLIST_POSITION_SQL = """
+        SELECT COUNT(*) FROM waitlist WHERE activity = ?1
+        AND id <= (SELECT id FROM waitlist WHERE activity = ?1 AND email = ?2)
+    """
+    PROMOTED_SQL = """
+        UPDATE changes SET kind = 'promote'
+        WHERE version = (SELECT version FROM store_version WHERE id = 1)
+    """
+
+    def __init__(self, path, pool_size=4, timeout=30.0):
+        super().__init__()
+        self.path = path
+        self.timeout = timeout
+        self._pool = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        with self._connection() as conn:
+            conn.executescript(self.SCHEMA)
+            # Kept with the data, so every worker opening it has the same id
+            self._data_id = conn.execute("SELECT value FROM store_id WHERE id = 1").fetchone()[0]
+        self._notify_lock = threading.Lock()
+        self._notified_version = self.version()
+        self._watcher = None
+        self._stop_watching = threading.Event()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                               check_same_thread=False, cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _transaction(self):
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def get_all(self):
+        with self._connection() as conn:
+            conn.execute("BEGIN")
+            try:
+                rows = conn.execute(
+                    "SELECT name, description, schedule, max_participants "
+                    "FROM activities ORDER BY id").fetchall()
+                members = conn.execute(
+                    "SELECT activity, email FROM participants ORDER BY id").fetchall()
+            finally:
+                conn.execute("COMMIT")
+        result = {
+            name: {
+                "description": description,
+                "schedule": schedule,
+                "max_participants": max_participants,
+                "participants": [],
+            }
+            for name, description, schedule, max_participants in rows
+        }
+        for activity_name, email in members:
+            result[activity_name]["participants"].append(email)
+        return result
+
+    def version(self):
+        with self._connection() as conn:
+            return conn.execute(self.VERSION_SQL).fetchone()[0]
+
+    def _raise_signup_error(self, conn, activity_name, email):
+        row = conn.execute(self.COUNT_SQL, (activity_name,)).fetchone()
+        if row is None:
+            raise ActivityNotFoundError()
+        if conn.execute(self.MEMBER_SQL, (activity_name, email)).fetchone():
+            raise AlreadySignedUpError()
+        raise ActivityFullError()
+
+    def get_many(self, names, include_participants=True):
+        names = list(names)
+        if not names:
+            return {}
+        placeholders = ", ".join("?" * len(names))
+        with self._connection() as conn:
+            conn.execute("BEGIN")
+            try:
+                rows = conn.execute(
+                    "SELECT name, description, schedule, max_participants, participant_count "
+                    f"FROM activities WHERE name IN ({placeholders})", names).fetchall()
+                members = []
+                if include_participants:
+                    members = conn.execute(
+                        "SELECT activity, email FROM participants "
+                        f"WHERE activity IN ({placeholders}) ORDER BY id", names).fetchall()
+            finally:
+                conn.execute("COMMIT")
+        found = {row[0]: row for row in rows}
+        result = {}
+        for name in names:
+            if name not in found:
+                continue
+            _, description, schedule, max_participants, count = found[name]
+            result[name] = {
+                "description": description,
+                "schedule": schedule,
+                "max_participants": max_participants,
+            }
+            if include_participants:
+                result[name]["participants"] = []
+            else:
+                result[name]["participant_count"] = count
+        for activity_name, email in members:
+            result[activity_name]["participants"].append(email)
+        return result
+
+    def iter_roster(self, batch_size=1000):
+        # A connection is taken per page and given back before the rows are
+        # yielded: a slow export must not hold one of the pooled connections
+        last_id = 0
+        while True:
+            with self._connection() as conn:
+                rows = conn.execute(
+                    "SELECT id, activity, email FROM participants"
+                    " WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size),
+                ).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            for _, activity_name, email in rows:
+                yield activity_name, email
+
+    def _finish(self, conn, kind, activity_name, email):
+        total, max_participants = conn.execute(self.COUNT_SQL, (activity_name,)).fetchone()
+        version = conn.execute(self.VERSION_SQL).fetchone()[0]
+        if version % self.PRUNE_EVERY == 0:
+            conn.execute(self.PRUNE_SQL, (version - self.CHANGES_KEPT,))
+        return Mutation(kind, version, activity_name, email, total, max_participants)
+
+    def catch_up(self):
+        with self._notify_lock:
+            while True:
+                with self._connection() as conn:
+                    rows = conn.execute(self.CHANGES_SQL, (self._notified_version,)).fetchall()
+                for version, kind, activity_name, email, total, max_participants in rows:
+                    if version != self._notified_version + 1 and kind != "load":
+                        # The changes in between were pruned before we read them
+                        self._notify(Mutation("load", version - 1))
+                    self._notify(Mutation(kind, version, activity_name, email, total,
+                                          max_participants))
+                    self._notified_version = version
+                if len(rows) < 1000:
+                    return
+
+    def watch(self, interval=0.05):
+        if self._watcher is not None:
+            return
+
+        def run():
+            while not self._stop_watching.wait(interval):
+                self.catch_up()
+
+        self._watcher = threading.Thread(target=run, name="sqlite-changes", daemon=True)
+        self._watcher.start()
+
+    def _promote(self, conn, activity_name, total):
+        # Returns the participant count once the head, if any, took the seat
+        head = conn.execute(self.WAITLIST_HEAD_SQL, (activity_name,)).fetchone()
+        if head is None:
+            return total
+        if conn.execute(self.SIGNUP_SQL, (activity_name, head[1])).rowcount:
+            conn.execute("DELETE FROM waitlist WHERE id = ?1", (head[0],))
+            conn.execute(self.PROMOTED_SQL)
+            return total + 1
+        return total
+
+    def signup(self, activity_name, email):
+        with self._transaction() as conn:
+            if conn.execute(self.SIGNUP_SQL, (activity_name, email)).rowcount == 0:
+                self._raise_signup_error(conn, activity_name, email)
+            mutation = self._finish(conn, "signup", activity_name, email)
+        self.catch_up()
+        return mutation.total
+
+    def remove(self, activity_name, email):
+        with self._transaction() as conn:
+            if conn.execute(self.REMOVE_SQL, (activity_name, email)).rowcount == 0:
+                if conn.execute(self.COUNT_SQL, (activity_name,)).fetchone() is None:
+                    raise ActivityNotFoundError()
+                raise ParticipantNotFoundError()
+            mutation = self._finish(conn, "remove", activity_name, email)
+            total = self._promote(conn, activity_name, mutation.total)
+        self.catch_up()
+        return total
+
+    def join_waitlist(self, activity_name, email):
+        with self._transaction() as conn:
+            row = conn.execute(self.COUNT_SQL, (activity_name,)).fetchone()
+            if row is None:
+                raise ActivityNotFoundError()
+            if conn.execute(self.MEMBER_SQL, (activity_name, email)).fetchone():
+                raise AlreadySignedUpError()
+            if conn.execute(self.SIGNUP_SQL, (activity_name, email)).rowcount:
+                position = 0
+            elif conn.execute(self.WAITLIST_JOIN_SQL, (activity_name, email)).rowcount:
+                position = conn.execute(self.WAITLIST_LENGTH_SQL, (activity_name,)).fetchone()[0]
+            else:
+                raise AlreadyWaitlistedError()
+        self.catch_up()
+        return position
+
+    def leave_waitlist(self, activity_name, email):
+        with self._transaction() as conn:
+            if conn.execute(self.WAITLIST_LEAVE_SQL, (activity_name, email)).rowcount == 0:
+                if conn.execute(self.COUNT_SQL, (activity_name,)).fetchone() is None:
+                    raise ActivityNotFoundError()
+                raise NotWaitlistedError()
+            length = conn.execute(self.WAITLIST_LENGTH_SQL, (activity_name,)).fetchone()[0]
+        self.catch_up()
+        return length
+
+    def waitlist_position(self, activity_name, email=None):
+        with self._connection() as conn:
+            conn.execute("BEGIN")
+            try:
+                if conn.execute(self.COUNT_SQL, (activity_name,)).fetchone() is None:
+                    raise ActivityNotFoundError()
+                length = conn.execute(self.WAITLIST_LENGTH_SQL, (activity_name,)).fetchone()[0]
+                position = None
+                if email is not None:
+                    position = conn.execute(self.WAITLIST_POSITION_SQL,
+                                            (activity_name, email)).fetchone()[0]
+                    if not position:
+                        raise NotWaitlistedError()
+            finally:
+                conn.execute("COMMIT")
+        return position, length
+
+    def get_waitlists(self):
+        result = {}
+        with self._connection() as conn:
+            for activity_name, email in conn.execute(
+                    "SELECT activity, email FROM waitlist ORDER BY id"):
+                result.setdefault(activity_name, []).append(email)
+        return result
+
+    def _batch(self, kind, items, atomic):
+        results = []
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for name, email in items:
+                    try:
+                        if kind == "signup":
+                            if conn.execute(self.SIGNUP_SQL, (name, email)).rowcount == 0:
+                                self._raise_signup_error(conn, name, email)
+                        elif conn.execute(self.REMOVE_SQL, (name, email)).rowcount == 0:
+                            if conn.execute(self.COUNT_SQL, (name,)).fetchone() is None:
+                                raise ActivityNotFoundError()
+                            raise ParticipantNotFoundError()
+                    except ActivityStoreError as error:
+                        results.append(BatchItemResult(name, email, error))
+                        continue
+                    mutation = self._finish(conn, kind, name, email)
+                    total = mutation.total
+                    if kind == "remove":
+                        total = self._promote(conn, name, total)
+                    results.append(BatchItemResult(name, email, total=total))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if atomic and any(result.error for result in results):
+                conn.execute("ROLLBACK")
+                return [result if result.error else
+                        BatchItemResult(result.activity, result.email, BatchRejectedError())
+                        for result in results]
+            conn.execute("COMMIT")
+        self.catch_up()
+        return results
+
+    def signup_many(self, items, atomic=False):
+        return self._batch("signup", items, atomic)
+
+    def remove_many(self, items, atomic=False):
+        return self._batch("remove", items, atomic)
+
+    def _load(self, conn, activities):
+        conn.execute("DELETE FROM waitlist")
+        conn.execute("DELETE FROM participants")
+        conn.execute("DELETE FROM activities")
+        for name, details in activities.items():
+            conn.execute(
+                "INSERT INTO activities (name, description, schedule, max_participants) "
+                "VALUES (?, ?, ?, ?)",
+                (name, details["description"], details["schedule"],
+                 details["max_participants"]))
+            conn.executemany(
+                "INSERT INTO participants (activity, email) VALUES (?, ?)",
+                [(name, email) for email in details["participants"]])
+            conn.executemany(
+                "INSERT INTO waitlist (activity, email) VALUES (?, ?)",
+                [(name, email) for email in details.get("waitlist", ())])
+        conn.execute("UPDATE store_version SET version = version + 1 WHERE id = 1")
+        # The per-participant changes are superseded by a single load
+        conn.execute("DELETE FROM changes")
+        conn.execute("INSERT INTO changes (version, kind) SELECT version, 'load' "
+                     "FROM store_version WHERE id = 1")
+        # Set before the commit, so that listeners notified of the load find it
+        self._loaded = (conn.execute(self.VERSION_SQL).fetchone()[0], activities)
+
+    def load(self, activities):
+        with self._transaction() as conn:
+            self._load(conn, activities)
+        self.catch_up()
+
+    def load_if_empty(self, activities):
+        # Checked inside the write transaction so concurrent workers seed once
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM activities LIMIT 1").fetchone() is not None:
+                return
+            self._load(conn, activities)
+        self.catch_up()
+
+    def close(self):
+        if self._watcher is not None:
+            self._stop_watching.set()
+            self._watcher.join()
+            self._watcher = None
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class AsyncActivityStore:
+    """Async interface over an ``ActivityStore``
+
+    Calls to a non-blocking store run directly on the event loop, so pure
+    in-memory operations never pay for a thread hand-off; calls to a
+    blocking store (SQLite) run in the threadpool. Signups and removals for
+    the same activity are serialized with a per-activity ``asyncio.Lock``
+    (the store's own thread locks still protect it from threadpool work
+    such as batches and imports).
+
+    With a ``MutationLog``, mutations are only reported once they are on disk.
+    """
+
+    def __init__(self, store, log=None):
+        self.store = store
+        self.log = log
+        # Locks disappear once nobody holds or waits for them
+        self._locks = weakref.WeakValueDictionary()
+
+    def _lock(self, activity_name):
+        lock = self._locks.get(activity_name)
+        if lock is None:
+            lock = self._locks[activity_name] = asyncio.Lock()
+        return lock
+
+    def student_lock(self, email):
+        """Lock serializing checks across the activities of one student
+
+        Taken before the activity lock by the endpoints that need it.
+        """
+        return self._lock(("student", email))
+
+    async def run(self, func, *args, **kwargs):
+        """Call ``func`` inline for a non-blocking store, in the threadpool otherwise"""
+        if self.store.blocking:
+            return await run_in_threadpool(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    async def _durable(self, result):
+        if self.log is not None:
+            # The version now covers our own mutation (and maybe later ones)
+            with span("durability_wait"):
+                await self.log.wait_durable_async(self.store.version())
+        return result
+
+    async def signup(self, activity_name, email):
+        async with self._lock(activity_name):
+            with span("store.signup"):
+                total = await self.run(self.store.signup, activity_name, email)
+        return await self._durable(total)
+
+    async def remove(self, activity_name, email):
+        async with self._lock(activity_name):
+            with span("store.remove"):
+                total = await self.run(self.store.remove, activity_name, email)
+        return await self._durable(total)
+
+    async def join_waitlist(self, activity_name, email):
+        async with self._lock(activity_name):
+            position = await self.run(self.store.join_waitlist, activity_name, email)
+        return await self._durable(position)
+
+    async def leave_waitlist(self, activity_name, email):
+        async with self._lock(activity_name):
+            length = await self.run(self.store.leave_waitlist, activity_name, email)
+        return await self._durable(length)
+
+    async def signup_many(self, items, atomic=False):
+        # Large batches would stall the event loop, so they always use a thread
+        results = await run_in_threadpool(self.store.signup_many, items, atomic)
+        return await self._durable(results)
+
+    async def remove_many(self, items, atomic=False):
+        results = await run_in_threadpool(self.store.remove_many, items, atomic)
+        return await self._durable(results)
+
+    async def get_many(self, names, include_participants=True):
+        return await self.run(self.store.get_many, names, include_participants)
+
+
+def create_store(url, activities):
+    """Build the store described by ``url`` and seed it with ``activities``
+
+    ``url`` is either ``memory`` or ``sqlite:///path/to/file.db``.
+    """
+    if url in ("", "memory"):
+        return InMemoryActivityStore(activities)
+    if url.startswith("sqlite:///"):
+        store = SQLiteActivityStore(url[len("sqlite:///"):])
+        store.load_if_empty(activities)
+        return store
+    raise ValueError(f"Unsupported activity store: {url}")
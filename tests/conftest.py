@@ -3,7 +3,7 @@ Test configuration for the Mergington High School API
 """
 import pytest
 from fastapi.testclient import TestClient
-from src.app import app, activities
+from src.app import activities, app, store
 
 
 @pytest.fixture
@@ -15,70 +15,11 @@ def client():
 @pytest.fixture(autouse=True)
 def reset_activities():
     """Reset activities data before each test"""
-    # Store original activities data
-    original_activities = {
-        "Chess Club": {
-            "description": "Learn strategies and compete in chess tournaments",
-            "schedule": "Fridays, 3:30 PM - 5:00 PM",
-            "max_participants": 12,
-            "participants": ["michael@mergington.edu", "daniel@mergington.edu"]
-        },
-        "Programming Class": {
-            "description": "Learn programming fundamentals and build software projects",
-            "schedule": "Tuesdays and Thursdays, 3:30 PM - 4:30 PM",
-            "max_participants": 20,
-            "participants": ["emma@mergington.edu", "sophia@mergington.edu"]
-        },
-        "Gym Class": {
-            "description": "Physical education and sports activities",
-            "schedule": "Mondays, Wednesdays, Fridays, 2:00 PM - 3:00 PM",
-            "max_participants": 30,
-            "participants": ["john@mergington.edu", "olivia@mergington.edu"]
-        },
-        "Basketball Team": {
-            "description": "Competitive basketball with practices and inter-school games",
-            "schedule": "Mondays and Wednesdays, 4:00 PM - 6:00 PM",
-            "max_participants": 15,
-            "participants": ["alex@mergington.edu", "sarah@mergington.edu"]
-        },
-        "Soccer Club": {
-            "description": "Soccer training and friendly matches with other schools",
-            "schedule": "Tuesdays and Thursdays, 4:00 PM - 5:30 PM",
-            "max_participants": 25,
-            "participants": ["carlos@mergington.edu", "maya@mergington.edu"]
-        },
-        "Art Club": {
-            "description": "Explore various art mediums including painting, drawing, and sculpture",
-            "schedule": "Thursdays, 3:30 PM - 5:30 PM",
-            "max_participants": 18,
-            "participants": ["luna@mergington.edu", "jacob@mergington.edu"]
-        },
-        "Drama Club": {
-            "description": "Acting, script reading, and theatrical performances",
-            "schedule": "Wednesdays and Fridays, 3:30 PM - 5:00 PM",
-            "max_participants": 22,
-            "participants": ["grace@mergington.edu", "ethan@mergington.edu"]
-        },
-        "Debate Team": {
-            "description": "Develop critical thinking and public speaking through competitive debates",
-            "schedule": "Tuesdays, 3:30 PM - 5:00 PM",
-            "max_participants": 16,
-            "participants": ["ava@mergington.edu", "noah@mergington.edu"]
-        },
-        "Science Olympiad": {
-            "description": "Competitive science team covering biology, chemistry, physics, and engineering",
-            "schedule": "Saturdays, 9:00 AM - 12:00 PM",
-            "max_participants": 14,
-            "participants": ["zoe@mergington.edu", "liam@mergington.edu"]
-        }
-    }
-    
-    # Reset activities to original state before each test
-    activities.clear()
-    activities.update(original_activities)
-    
+    # The store copies an activity on its first change and never changes the
+    # seed, so loading it again undoes every change without copying anything
+    store.load(activities)
+
     yield
-    
+
     # Cleanup after test (reset again)
-    activities.clear()
-    activities.update(original_activities)
\ No newline at end of file
+    store.load(activities)
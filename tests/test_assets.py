@@ -0,0 +1,99 @@
+"""
+Tests for the static asset pipeline
+"""
+import re
+
+import pytest
+
+from src.assets import minify_css, minify_js
+from src.responses import choose_encoding
+
+
+def test_minify_js_keeps_strings_and_templates():
+    """Test that comments and whitespace go but string contents stay"""
+    source = """
+    // Build the card
+    const url = "http://example.com"; /* block */
+    const html = `
+      <p>${items.map(item => `<b>${item}</b>`).join('')}</p>
+    `;
+    let total = a
+    + b
+    """
+    minified = minify_js(source)
+    assert "Build the card" not in minified and "block" not in minified
+    assert 'const url="http://example.com";' in minified
+    assert "`\n      <p>${items.map(item => `<b>${item}</b>`).join('')}</p>\n    `" in minified
+    # Line breaks that automatic semicolon insertion may rely on are kept
+    assert "let total=a\n+ b" in minified
+
+
+def test_minify_js_keeps_regular_expressions():
+    """Test that slashes and spaces inside regex literals are kept, and divisions still minify"""
+    assert minify_js("const r = /\\/\\//g; y=1") == "const r=/\\/\\//g;y=1"
+    assert minify_js("if (/[/ ]x/.test(s)) return / a/i") == "if(/[/ ]x/.test(s))return/ a/i"
+    assert minify_js("half = total / 2 // of the seats") == "half=total/2"
+
+
+def test_minify_css():
+    """Test that CSS loses comments and whitespace but keeps descendant selectors"""
+    css = "/* main */\n.form-group label {\n  display: block;\n  margin: 0 auto;\n}\na :hover { color: red; }"
+    assert minify_css(css) == ".form-group label{display:block;margin:0 auto}a :hover{color:red}"
+
+
+@pytest.mark.parametrize("header,expected", [
+    (None, None),
+    ("identity", None),
+    ("gzip, deflate", "gzip"),
+    ("gzip;q=0, deflate", None),
+    ("*", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("gzip, br", "br"),
+])
+def test_choose_encoding(header, expected):
+    """Test Accept-Encoding negotiation"""
+    assert choose_encoding(header, {"gzip": b"", "br": b""}) == expected
+
+
+def asset_urls(client):
+    html = client.get("/").text
+    return re.findall(r'(?:src|href)="(/static/[^"]+)"', html)
+
+
+def test_root_references_fingerprinted_assets(client):
+    """Test that the page links to content-hashed file names"""
+    urls = asset_urls(client)
+    assert len(urls) == 2
+    for url in urls:
+        assert re.fullmatch(r"/static/(app|styles)\.[0-9a-f]{16}\.(js|css)", url)
+
+
+def test_fingerprinted_assets_are_immutable_and_precompressed(client):
+    """Test caching headers and gzip negotiation of fingerprinted files"""
+    for url in asset_urls(client):
+        response = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+
+        raw = client.get(url, headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in raw.headers
+        # httpx decodes the body, so compare the bytes on the wire
+        assert response.content == raw.content
+        assert response.num_bytes_downloaded < raw.num_bytes_downloaded
+
+
+def test_original_names_revalidate_with_etag(client):
+    """Test that unfingerprinted names are served with no-cache and answer 304"""
+    response = client.get("/static/app.js")
+    assert response.headers["cache-control"] == "no-cache"
+    etag = response.headers["etag"]
+    revalidated = client.get("/static/app.js", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+
+
+def test_unknown_static_file_is_404(client):
+    """Test that files outside the pipeline are not found"""
+    assert client.get("/static/missing.js").status_code == 404
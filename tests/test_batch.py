@@ -0,0 +1,76 @@
+"""
+Tests for the batch signup and removal endpoints
+"""
+
+
+def test_batch_signup_best_effort(client):
+    """Test that valid items are applied and invalid ones reported"""
+    response = client.post("/activities/Chess%20Club/signups:batch", json={
+        "emails": ["a@mergington.edu", "michael@mergington.edu", "a@mergington.edu",
+                   "b@mergington.edu"],
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["applied"] == 2
+    assert [item["status"] for item in data["results"]] == [200, 400, 400, 200]
+    assert data["results"][1]["detail"] == "Student already signed up for this activity"
+    assert data["results"][3]["total_participants"] == 4
+
+    participants = client.get("/activities").json()["Chess Club"]["participants"]
+    assert participants[-2:] == ["a@mergington.edu", "b@mergington.edu"]
+
+
+def test_batch_signup_respects_capacity(client):
+    """Test that a batch cannot overbook an activity"""
+    emails = [f"student{i}@mergington.edu" for i in range(15)]
+    data = client.post("/activities/Chess%20Club/signups:batch",
+                       json={"emails": emails}).json()
+    assert data["applied"] == 10
+    assert data["results"][-1]["detail"] == "Activity is full"
+    assert len(client.get("/activities").json()["Chess Club"]["participants"]) == 12
+
+
+def test_batch_signup_all_or_nothing(client):
+    """Test that an all-or-nothing batch is rejected as a whole"""
+    response = client.post("/activities/Chess%20Club/signups:batch", json={
+        "emails": ["a@mergington.edu", "michael@mergington.edu"],
+        "mode": "all_or_nothing",
+    })
+    data = response.json()
+    assert data["applied"] == 0
+    assert [item["status"] for item in data["results"]] == [409, 400]
+    participants = client.get("/activities").json()["Chess Club"]["participants"]
+    assert "a@mergington.edu" not in participants
+
+
+def test_cross_activity_batch(client):
+    """Test signing up and removing across several activities at once"""
+    items = [
+        {"activity": "Chess Club", "email": "multi@mergington.edu"},
+        {"activity": "Art Club", "email": "multi@mergington.edu"},
+        {"activity": "Nonexistent", "email": "multi@mergington.edu"},
+    ]
+    data = client.post("/activities/signups:batch", json={"items": items}).json()
+    assert [item["status"] for item in data["results"]] == [200, 200, 404]
+
+    data = client.post("/activities/removals:batch", json={"items": items[:2]}).json()
+    assert data["applied"] == 2
+    all_activities = client.get("/activities").json()
+    assert "multi@mergington.edu" not in all_activities["Chess Club"]["participants"]
+    assert "multi@mergington.edu" not in all_activities["Art Club"]["participants"]
+
+
+def test_batch_remove_for_activity(client):
+    """Test removing several students from one activity"""
+    data = client.post("/activities/Chess%20Club/removals:batch", json={
+        "emails": ["michael@mergington.edu", "unknown@mergington.edu"],
+    }).json()
+    assert [item["status"] for item in data["results"]] == [200, 404]
+    assert data["results"][0]["total_participants"] == 1
+
+
+def test_batch_rejects_unknown_mode(client):
+    """Test that the batch mode is validated"""
+    response = client.post("/activities/Chess%20Club/signups:batch",
+                           json={"emails": [], "mode": "sometimes"})
+    assert response.status_code == 422
@@ -0,0 +1,46 @@
+"""
+Tests for packed activity catalogs and copy-on-write seeding
+"""
+import copy
+
+import pytest
+
+from src.app import activities
+from src.catalog import PackedCatalog, load_catalog, write_catalog
+from src.store import InMemoryActivityStore
+
+
+def test_packed_catalog_round_trip(tmp_path):
+    """Test that a packed catalog reads back the activities it was written from"""
+    path = tmp_path / "activities.catalog"
+    write_catalog(activities, path)
+    catalog = load_catalog(path)
+    assert isinstance(catalog, PackedCatalog)
+    assert list(catalog) == list(activities)
+    assert len(catalog) == len(activities)
+    assert "Chess Club" in catalog and "Knitting" not in catalog
+    assert dict(catalog.items()) == activities
+    with pytest.raises(KeyError):
+        catalog["Knitting"]
+
+
+def test_load_catalog_rejects_other_files(tmp_path):
+    """Test that a .catalog file without the magic line is refused"""
+    path = tmp_path / "activities.catalog"
+    path.write_bytes(b"{}")
+    with pytest.raises(ValueError):
+        load_catalog(path)
+
+
+def test_store_never_changes_its_seed(tmp_path):
+    """Test that signups copy activities out of the seed instead of changing it"""
+    seed = copy.deepcopy(activities)
+    path = tmp_path / "activities.catalog"
+    write_catalog(seed, path)
+    for catalog in (seed, load_catalog(path)):
+        store = InMemoryActivityStore(catalog)
+        store.signup("Chess Club", "new@mergington.edu")
+        assert "new@mergington.edu" in store.get_all()["Chess Club"]["participants"]
+        store.load(catalog)
+        assert store.get_all()["Chess Club"] == activities["Chess Club"]
+    assert seed == activities
@@ -0,0 +1,187 @@
+"""
+Tests for the write-ahead log of the in-memory store
+"""
+import asyncio
+import copy
+import os
+
+import pytest
+
+import src.app
+from src.app import activities
+from src.durability import MutationLog
+from src.store import AsyncActivityStore, InMemoryActivityStore, SQLiteActivityStore
+
+
+def open_store(directory, **options):
+    """Recover a store from ``directory`` and start logging its mutations"""
+    store = InMemoryActivityStore(copy.deepcopy(activities))
+    log = MutationLog(str(directory), **options)
+    replayed = log.recover(store)
+    log.start(store)
+    return store, log, replayed
+
+
+@pytest.mark.parametrize("group_commit", [True, False])
+def test_mutations_survive_restart(tmp_path, group_commit):
+    """Test that signups and removals are replayed after a restart"""
+    store, log, _ = open_store(tmp_path, group_commit=group_commit)
+    store.signup("Chess Club", "durable@mergington.edu")
+    store.remove("Chess Club", "michael@mergington.edu")
+    assert log.wait_durable(store.version(), timeout=5)
+    log.close()
+
+    recovered, log, replayed = open_store(tmp_path)
+    assert replayed == 2
+    assert recovered.get_all()["Chess Club"]["participants"] == [
+        "daniel@mergington.edu", "durable@mergington.edu"]
+    # Versions keep increasing after recovery
+    assert recovered.version() >= store.version()
+    log.close()
+
+
+def test_waitlist_survives_restart(tmp_path):
+    """Test that waitlists are replayed and snapshotted with the roster"""
+    store, log, _ = open_store(tmp_path)
+    for i in range(10):
+        store.signup("Chess Club", f"student{i}@mergington.edu")
+    store.join_waitlist("Chess Club", "first@mergington.edu")
+    store.join_waitlist("Chess Club", "second@mergington.edu")
+    store.join_waitlist("Chess Club", "third@mergington.edu")
+    store.leave_waitlist("Chess Club", "third@mergington.edu")
+    store.remove("Chess Club", "michael@mergington.edu")
+    assert log.wait_durable(store.version(), timeout=5)
+    log.close()
+
+    recovered, log, _ = open_store(tmp_path)
+    assert recovered.get_all() == store.get_all()
+    assert recovered.get_waitlists() == {"Chess Club": ["second@mergington.edu"]}
+    log.close()
+
+    # The snapshot written at startup carries the waitlist too
+    recovered, log, replayed = open_store(tmp_path)
+    assert replayed == 0
+    assert recovered.get_waitlists() == {"Chess Club": ["second@mergington.edu"]}
+    log.close()
+
+
+def test_async_store_waits_for_durability(tmp_path):
+    """Test that async mutations return once their record is on disk"""
+    store, log, _ = open_store(tmp_path)
+    async_store = AsyncActivityStore(store, log=log)
+
+    async def scenario():
+        await asyncio.gather(*(async_store.signup("Gym Class", f"s{i}@mergington.edu")
+                               for i in range(20)))
+
+    asyncio.run(scenario())
+    segment = max(name for name in os.listdir(tmp_path) if name.startswith("log-"))
+    with open(tmp_path / segment) as log_file:
+        assert len(log_file.readlines()) == 20
+    log.close()
+
+
+def test_snapshot_compacts_log(tmp_path):
+    """Test that a snapshot replaces the segments it covers"""
+    store, log, _ = open_store(tmp_path, snapshot_every=5)
+    for i in range(12):
+        store.signup("Gym Class", f"s{i}@mergington.edu")
+    log.close()
+
+    segments = [name for name in os.listdir(tmp_path) if name.startswith("log-")]
+    assert len(segments) == 1
+    recovered, log, replayed = open_store(tmp_path)
+    assert replayed < 12
+    assert len(recovered.get_all()["Gym Class"]["participants"]) == 14
+    log.close()
+
+
+def test_load_is_recorded_with_a_snapshot(tmp_path):
+    """Test that replacing all activities survives a restart"""
+    store, log, _ = open_store(tmp_path)
+    store.load({"Robotics": {"description": "Build robots", "schedule": "Mondays, 3:00 PM - 4:00 PM",
+                             "max_participants": 5, "participants": []}})
+    store.signup("Robotics", "robot@mergington.edu")
+    log.close()
+
+    recovered, log, _ = open_store(tmp_path)
+    assert recovered.get_all() == {"Robotics": {
+        "description": "Build robots", "schedule": "Mondays, 3:00 PM - 4:00 PM",
+        "max_participants": 5, "participants": ["robot@mergington.edu"]}}
+    log.close()
+
+
+def test_torn_last_record_is_ignored(tmp_path):
+    """Test that a partially written record at the end of the log is skipped"""
+    store, log, _ = open_store(tmp_path)
+    store.signup("Art Club", "complete@mergington.edu")
+    log.close()
+    segment = max(name for name in os.listdir(tmp_path) if name.startswith("log-"))
+    with open(tmp_path / segment, "a") as log_file:
+        log_file.write('[999, "s", "Art Cl')
+
+    recovered, log, replayed = open_store(tmp_path)
+    assert replayed == 1
+    assert "complete@mergington.edu" in recovered.get_all()["Art Club"]["participants"]
+    log.close()
+
+
+def test_import_waits_for_durability(client, monkeypatch, tmp_path):
+    """Test that a roster import answers once its rows are on disk"""
+    log = MutationLog(str(tmp_path))
+    log.start(src.app.store)
+    waited = []
+    wait_durable_async = log.wait_durable_async
+
+    async def wait(version):
+        waited.append(version)
+        return await wait_durable_async(version)
+
+    log.wait_durable_async = wait
+    monkeypatch.setattr(src.app, "async_store", AsyncActivityStore(src.app.store, log=log))
+    try:
+        response = client.post("/activities/import?format=csv",
+                               content="activity,email\nChess Club,new@mergington.edu\n")
+        assert response.json()["applied"] == 1
+        assert waited == [src.app.store.version()]
+    finally:
+        log.close()
+
+
+def test_recover_requires_a_restorable_store(tmp_path):
+    """Test that SQLite, durable on its own, is not rebuilt from a log"""
+    store = SQLiteActivityStore(str(tmp_path / "activities.db"))
+    with pytest.raises(TypeError):
+        MutationLog(str(tmp_path / "log")).recover(store)
+    store.close()
+
+
+class FailingSegment:
+    """A log segment on a full disk"""
+
+    def write(self, data):
+        raise OSError(28, "No space left on device")
+
+    def close(self):
+        pass
+
+
+def test_write_error_fails_requests_with_503(client, monkeypatch, tmp_path):
+    """Test that a failing log answers 503 to current and later changes and shows on /metrics"""
+    log = MutationLog(str(tmp_path))
+    log.start(src.app.store)
+    log._segment = FailingSegment()
+    monkeypatch.setattr(src.app, "async_store", AsyncActivityStore(src.app.store, log=log))
+    monkeypatch.setattr(src.app.metrics, "log", log)
+    try:
+        response = client.post("/activities/Chess Club/signup?email=a@mergington.edu")
+        assert response.status_code == 503
+        assert response.json()["detail"] == "Changes can no longer be written to the write-ahead log"
+        assert isinstance(log.error, OSError)
+
+        response = client.post("/activities/Chess Club/signups:batch",
+                               json={"emails": ["b@mergington.edu"]})
+        assert response.status_code == 503
+        assert "mutation_log_failed 1" in client.get("/metrics").text
+    finally:
+        log.close()
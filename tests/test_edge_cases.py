@@ -1,9 +1,16 @@
 """
 Tests for edge cases and error handling
 """
-import pytest
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 
+import pytest
+
+from src.app import store
+from src.store import ActivityFullError
+
 
 def test_special_characters_in_email(client):
     """Test handling emails with special characters"""
@@ -172,4 +179,68 @@ def test_data_consistency_after_operations(client):
     
     # Verify specific changes
     assert test_email not in final_data["Chess Club"]["participants"]
-    assert test_email in final_data["Programming Class"]["participants"]
\ No newline at end of file
+    assert test_email in final_data["Programming Class"]["participants"]
+
+
+@pytest.fixture
+def frequent_thread_switches():
+    """Make the interpreter switch threads as often as possible"""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_threaded_signups_never_overbook(frequent_thread_switches):
+    """Test thousands of concurrent signups racing for the last seats"""
+    activity = "Chess Club"  # Max 12 participants, currently 2
+    for i in range(9):
+        store.signup(activity, f"early{i}@mergington.edu")
+    barrier = threading.Barrier(32)
+
+    def signup(i):
+        if i < 32:
+            barrier.wait()
+        try:
+            return store.signup(activity, f"racer{i}@mergington.edu")
+        except ActivityFullError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        results = list(executor.map(signup, range(3000)))
+
+    accepted = [result for result in results if result is not None]
+    assert len(accepted) == 1
+    assert len(store.get_all()[activity]["participants"]) == 12
+
+
+def test_concurrent_http_signups_never_overbook(client):
+    """Test concurrent signups through the API for a nearly full activity"""
+    activity = "Science Olympiad"  # Max 14 participants, currently 2
+    for i in range(10):
+        client.post(f"/activities/{activity}/signup?email=early{i}@mergington.edu")
+
+    def signup(i):
+        return client.post(
+            f"/activities/{activity}/signup?email=racer{i}@mergington.edu"
+        ).status_code
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        statuses = list(executor.map(signup, range(200)))
+
+    assert statuses.count(200) == 2
+    assert statuses.count(400) == 198
+    participants = client.get("/activities").json()[activity]["participants"]
+    assert len(participants) == 14
+
+
+def test_activity_locks_are_independent():
+    """Test that a busy activity does not block signups to another one"""
+    chess = store.activities["Chess Club"]
+    with chess.lock:
+        worker = threading.Thread(
+            target=store.signup, args=("Art Club", "parallel@mergington.edu"))
+        worker.start()
+        worker.join(timeout=5)
+        assert not worker.is_alive()
+    assert "parallel@mergington.edu" in store.get_all()["Art Club"]["participants"]
@@ -0,0 +1,101 @@
+"""
+Tests for the Server-Sent Events broker
+"""
+import asyncio
+import json
+
+from src.events import EventBroker, format_event
+from src.store import InMemoryActivityStore, Mutation
+
+
+def make_store():
+    return InMemoryActivityStore({
+        "Chess Club": {
+            "description": "Learn strategies and compete in chess tournaments",
+            "schedule": "Fridays, 3:30 PM - 5:00 PM",
+            "max_participants": 12,
+            "participants": ["michael@mergington.edu"],
+        }
+    })
+
+
+def parse(message):
+    fields = dict(line.split(": ", 1) for line in message.strip().splitlines())
+    return fields["event"], json.loads(fields["data"])
+
+
+def test_format_event():
+    """Test the SSE encoding of a signup"""
+    message = format_event(Mutation("signup", 7, "Chess Club", "a@mergington.edu", 3, 12))
+    assert message.startswith("id: 7\nevent: signup\n")
+    assert message.endswith("\n\n")
+    assert parse(message)[1] == {
+        "activity": "Chess Club",
+        "email": "a@mergington.edu",
+        "participant_count": 3,
+        "spots_left": 9,
+    }
+
+
+def test_format_promotion():
+    """Test that a promotion from the waitlist is announced like a signup"""
+    message = format_event(Mutation("promote", 8, "Chess Club", "a@mergington.edu", 12, 12))
+    assert parse(message) == ("promoted", {"activity": "Chess Club", "email": "a@mergington.edu",
+                                           "participant_count": 12, "spots_left": 0})
+
+
+def test_stream_receives_deltas():
+    """Test that subscribed clients receive signup and removal deltas"""
+    store = make_store()
+    broker = EventBroker(store)
+
+    async def scenario():
+        stream = broker.stream()
+        assert await stream.__anext__() == "retry: 3000\n\n"
+        next_message = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        # Mutations come from worker threads in the real server
+        await asyncio.to_thread(store.signup, "Chess Club", "a@mergington.edu")
+        await asyncio.to_thread(store.remove, "Chess Club", "michael@mergington.edu")
+        first = await next_message
+        second = await stream.__anext__()
+        await stream.aclose()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert parse(first) == ("signup", {"activity": "Chess Club", "email": "a@mergington.edu",
+                                       "participant_count": 2, "spots_left": 10})
+    assert parse(second)[0] == "removed"
+    assert broker.clients == set()
+
+
+def test_slow_consumer_is_dropped():
+    """Test that a client whose queue is full is dropped and told to reset"""
+    store = make_store()
+    broker = EventBroker(store, max_queue=2)
+
+    async def scenario():
+        stream = broker.stream()
+        await stream.__anext__()
+        next_message = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        # Three events are queued before the client gets a chance to read
+        for i in range(3):
+            store.signup("Chess Club", f"student{i}@mergington.edu")
+        await asyncio.sleep(0)
+        messages = [await next_message]
+        async for message in stream:
+            messages.append(message)
+        return messages
+
+    messages = asyncio.run(scenario())
+    assert [parse(message)[0] for message in messages] == ["signup", "signup", "reset"]
+    assert broker.clients == set()
+
+
+def test_publish_without_clients_is_a_no_op():
+    """Test that mutations are cheap when nobody listens"""
+    store = make_store()
+    broker = EventBroker(store)
+    store.signup("Chess Club", "a@mergington.edu")
+    assert broker.clients == set()
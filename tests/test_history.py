@@ -0,0 +1,107 @@
+"""
+Tests for the audit log and point-in-time rosters
+"""
+import copy
+from datetime import datetime, timezone
+
+import pytest
+
+from src.app import activities, store
+from src.history import AuditLog, HistoryUnavailableError
+from src.store import InMemoryActivityStore
+
+
+class FakeClock:
+    def __init__(self, start=1_800_000_000.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+def test_history_lists_changes_with_client(client):
+    """Test that every change of an activity is listed oldest first"""
+    email = "newstudent@mergington.edu"
+    client.post(f"/activities/Chess Club/signup?email={email}")
+    client.delete("/activities/Chess Club/remove?email=michael@mergington.edu")
+
+    history = client.get("/activities/Chess Club/history").json()
+    events = [(event["event"], event["email"], event["client"]) for event in history["events"]]
+    assert events[-2:] == [("signup", email, "testclient"),
+                           ("remove", "michael@mergington.edu", "testclient")]
+    assert history["next_after"] is None
+
+    first = history["events"][-2]["version"]
+    page = client.get(f"/activities/Chess Club/history?after={first - 1}&limit=1").json()
+    assert [event["email"] for event in page["events"]] == [email]
+    assert page["next_after"] == first
+
+    assert client.get("/activities/Knitting/history").status_code == 404
+
+
+def test_history_as_of_version(client):
+    """Test that past rosters are rebuilt from the seed and the events since"""
+    before = store.version()
+    client.delete("/activities/Chess Club/remove?email=michael@mergington.edu")
+    client.post("/activities/Chess Club/signup?email=new@mergington.edu")
+
+    past = client.get(f"/activities/Chess Club/history?as_of={before}").json()
+    assert past["participants"] == activities["Chess Club"]["participants"]
+    assert past["version"] == before
+    now = client.get(f"/activities/Chess Club/history?as_of={store.version()}").json()
+    assert now["participants"] == ["daniel@mergington.edu", "new@mergington.edu"]
+
+    response = client.get("/activities/Chess Club/history?as_of=last tuesday")
+    assert response.status_code == 400
+    response = client.get(f"/activities/Chess Club/history?as_of={store.version() + 1}")
+    assert response.status_code == 400
+    assert client.get("/activities/Knitting/history?as_of=1").status_code == 404
+
+
+def test_roster_as_of_time_with_checkpoints():
+    """Test time lookups, loads and that checkpoints give the same rosters as full replays"""
+    clock = FakeClock()
+    store = InMemoryActivityStore(copy.deepcopy(activities))
+    log = AuditLog(store, checkpoint_every=2, clock=clock)
+    emails = [f"student{number}@mergington.edu" for number in range(6)]
+    versions = []
+    for email in emails:
+        clock.now += 60
+        store.signup("Chess Club", email)
+        versions.append(store.version())
+    clock.now += 60
+    store.remove("Chess Club", emails[0])
+    removed = store.version()
+    seed = activities["Chess Club"]["participants"]
+
+    # Each read goes through the checkpoints left by the previous ones
+    for count in (6, 3, 5, 1):
+        participants, waitlist = log.roster("Chess Club", versions[count - 1])
+        assert participants == seed + emails[:count]
+        assert waitlist == []
+    assert [position for position, _, _ in log._checkpoints[0]] == [2, 4, 6]
+
+    moment = datetime.fromtimestamp(clock.now - 150, timezone.utc)
+    assert log.version_at(moment) == versions[3]
+    with pytest.raises(HistoryUnavailableError):
+        log.version_at(datetime(2000, 1, 1, tzinfo=timezone.utc))
+
+    # A load starts over from the activities it was given
+    clock.now += 60
+    store.load(copy.deepcopy(activities))
+    assert log.roster("Chess Club", store.version())[0] == seed
+    assert log.roster("Chess Club", removed)[0] == seed + emails[1:]
+
+
+def test_roster_without_known_load():
+    """Test a log started after changes: it reads the store and replays later events"""
+    store = InMemoryActivityStore(copy.deepcopy(activities))
+    store.signup("Chess Club", "early@mergington.edu")
+    log = AuditLog(store)
+    started = log.epochs[0].base_version
+    store.signup("Chess Club", "late@mergington.edu")
+
+    assert log.roster("Chess Club", started)[0][-1] == "early@mergington.edu"
+    assert log.roster("Chess Club", store.version())[0][-1] == "late@mergington.edu"
+    with pytest.raises(HistoryUnavailableError):
+        log.roster("Chess Club", started - 2)
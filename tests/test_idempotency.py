@@ -0,0 +1,110 @@
+"""
+Tests for Idempotency-Key handling on signup and removal
+"""
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from src.app import store
+from src.idempotency import IdempotencyCache
+
+SIGNUP = "/activities/Chess Club/signup?email=retry@mergington.edu"
+
+
+def key_header():
+    return {"Idempotency-Key": str(uuid.uuid4())}
+
+
+def test_retried_signup_replays_the_first_response(client):
+    """Test that a retry gets the original 200 instead of "already signed up\""""
+    headers = key_header()
+    first = client.post(SIGNUP, headers=headers)
+    version = store.version()
+    retry = client.post(SIGNUP, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert store.version() == version
+    # Without a key the duplicate still fails as before
+    assert client.post(SIGNUP).status_code == 400
+
+
+def test_errors_are_replayed_too(client):
+    """Test that a domain error is stored and replayed like a success"""
+    headers = key_header()
+    first = client.delete("/activities/Chess Club/remove?email=nobody@mergington.edu",
+                          headers=headers)
+    store.signup("Chess Club", "nobody@mergington.edu")
+    retry = client.delete("/activities/Chess Club/remove?email=nobody@mergington.edu",
+                          headers=headers)
+    assert first.status_code == retry.status_code == 404
+    assert retry.json() == first.json()
+
+
+def test_key_reused_for_another_request_is_rejected(client):
+    """Test that a key cannot be replayed against a different request"""
+    headers = key_header()
+    assert client.post(SIGNUP, headers=headers).status_code == 200
+    response = client.post("/activities/Art Club/signup?email=retry@mergington.edu",
+                           headers=headers)
+    assert response.status_code == 422
+    assert client.post(SIGNUP, headers={"Idempotency-Key": "x" * 256}).status_code == 400
+
+
+def test_concurrent_duplicates_run_once():
+    """Test that attempts arriving while the first runs wait for its outcome"""
+    cache = IdempotencyCache()
+    calls = []
+
+    async def signup():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"total_participants": 3}
+
+    async def main():
+        return await asyncio.gather(*(cache.run("key", ("signup",), signup) for _ in range(5)))
+
+    responses = asyncio.run(main())
+    assert len(calls) == 1
+    assert {response.body for response in responses} == {b'{"total_participants":3}'}
+    assert cache.coalesced == 4
+
+
+def test_failed_attempt_is_not_stored():
+    """Test that an unexpected error lets the next attempt run again"""
+    cache = IdempotencyCache()
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("connection lost")
+        raise HTTPException(status_code=404, detail="Activity not found")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.run("key", ("signup",), flaky))
+    response = asyncio.run(cache.run("key", ("signup",), flaky))
+    assert response.status_code == 404
+    assert len(attempts) == 2
+
+
+def test_outcomes_expire_and_stay_bounded():
+    """Test the TTL and that the oldest outcome is evicted at capacity"""
+    now = [0.0]
+    cache = IdempotencyCache(max_entries=3, ttl=60, clock=lambda: now[0])
+
+    async def ok():
+        return {}
+
+    for number in range(5):
+        asyncio.run(cache.run(f"key-{number}", (), ok))
+    assert len(cache) == 3
+    assert list(cache._outcomes) == ["key-2", "key-3", "key-4"]
+
+    now[0] = 61
+    asyncio.run(cache.run("key-5", (), ok))
+    assert list(cache._outcomes) == ["key-5"]
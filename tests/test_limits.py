@@ -0,0 +1,131 @@
+"""
+Tests for rate limiting and admission control
+"""
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.limits import AdmissionMiddleware, RateLimitMiddleware, TokenBuckets, parse_limit
+
+
+def limited_app(clock, **limits):
+    app = FastAPI()
+
+    @app.get("/items")
+    async def items():
+        return []
+
+    @app.post("/items/signup")
+    async def signup(email: str):
+        return {"email": email}
+
+    @app.get("/metrics")
+    async def metrics():
+        return {}
+
+    app.add_middleware(RateLimitMiddleware, clock=lambda: clock[0], exempt=("/metrics",), **limits)
+    return app
+
+
+def test_token_bucket_refills_at_the_rate():
+    """Test the burst, the refill and the wait reported when empty"""
+    now = [0.0]
+    buckets = TokenBuckets(rate=2, burst=3, clock=lambda: now[0])
+    assert [buckets.take("a") for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("a") == 0.5
+    now[0] = 0.5
+    assert buckets.take("a") == 0
+    assert buckets.take("b") == 0
+    assert parse_limit("20") == (20.0, 40.0)
+    assert parse_limit("5:8") == (5.0, 8.0)
+    assert parse_limit(None) is None
+
+
+def test_reads_are_limited_per_client_ip():
+    """Test that one client is answered 429 while others are served"""
+    clock = [0.0]
+    app = limited_app(clock, read=(1, 2))
+    noisy = TestClient(app, client=("10.0.0.1", 1000))
+    quiet = TestClient(app, client=("10.0.0.2", 1000))
+
+    assert [noisy.get("/items").status_code for _ in range(3)] == [200, 200, 429]
+    rejected = noisy.get("/items")
+    assert rejected.headers["retry-after"] == "1"
+    assert rejected.json() == {"detail": "Too many requests"}
+    assert quiet.get("/items").status_code == 200
+    assert noisy.get("/metrics").status_code == 200
+    clock[0] = 1.0
+    assert noisy.get("/items").status_code == 200
+
+
+def test_writes_are_limited_per_student():
+    """Test that writes for one email are limited across client addresses"""
+    clock = [0.0]
+    app = limited_app(clock, write=(1, 1))
+    first = TestClient(app, client=("10.0.0.1", 1000))
+    second = TestClient(app, client=("10.0.0.2", 1000))
+
+    assert first.post("/items/signup?email=a@mergington.edu").status_code == 200
+    assert second.post("/items/signup?email=A@mergington.edu").status_code == 429
+    assert first.get("/items").status_code == 200
+
+
+def test_admission_sheds_requests_over_the_limit():
+    """Test that excess requests queue, then are shed with 503 and Retry-After"""
+    release = asyncio.Event()
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        await release.wait()
+        return {}
+
+    app.add_middleware(AdmissionMiddleware, max_in_flight=1, max_queue=1, max_wait=0.05)
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = asyncio.create_task(client.get("/slow"))
+            await asyncio.sleep(0.01)
+            queued = asyncio.create_task(client.get("/slow"))
+            await asyncio.sleep(0.01)
+            overflow = await client.get("/slow")
+            timed_out = await queued
+
+            waiting = asyncio.create_task(client.get("/slow"))
+            await asyncio.sleep(0.01)
+            release.set()
+            return overflow, timed_out, await first, await waiting
+
+    overflow, timed_out, first, waiting = asyncio.run(main())
+    assert overflow.status_code == timed_out.status_code == 503
+    assert overflow.headers["retry-after"] == "1"
+    assert first.status_code == waiting.status_code == 200
+
+
+def test_admission_sheds_while_the_event_loop_lags():
+    """Test that requests are shed while the loop is far behind"""
+    app = FastAPI()
+
+    @app.get("/items")
+    async def items():
+        return []
+
+    admission = AdmissionMiddleware(app, max_lag=0.05)
+
+    async def main():
+        transport = httpx.ASGITransport(app=admission)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            served = await client.get("/items")
+            admission.lag = 1.0
+            shed = await client.get("/items")
+            # The probe measures the lag again once the loop catches up
+            await asyncio.sleep(0.05)
+            return served, shed, await client.get("/items")
+
+    served, shed, recovered = asyncio.run(main())
+    assert served.status_code == recovered.status_code == 200
+    assert shed.status_code == 503
+    assert admission.shed == 1
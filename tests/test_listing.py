@@ -0,0 +1,111 @@
+"""
+Tests for paginated, filtered and projected activity listings
+"""
+import pytest
+
+from src.indexes import ActivityIndex
+from src.store import InMemoryActivityStore
+
+
+def test_listing_without_parameters_is_unchanged(client):
+    """Test that GET /activities without parameters returns every activity"""
+    data = client.get("/activities").json()
+    assert "Chess Club" in data
+    assert "next_cursor" not in data
+
+
+def test_pagination_walks_all_activities(client):
+    """Test that following next_cursor visits every activity once, in name order"""
+    seen = []
+    cursor = None
+    while True:
+        url = "/activities?limit=4" + (f"&cursor={cursor}" if cursor else "")
+        page = client.get(url).json()
+        assert len(page["activities"]) <= 4
+        seen.extend(page["activities"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    all_activities = client.get("/activities").json()
+    assert seen == sorted(all_activities)
+
+
+def test_filter_by_day(client):
+    """Test filtering activities by day of week parsed from the schedule"""
+    page = client.get("/activities?day=friday").json()
+    assert set(page["activities"]) == {"Chess Club", "Gym Class", "Drama Club"}
+
+    page = client.get("/activities?day=Saturdays").json()
+    assert list(page["activities"]) == ["Science Olympiad"]
+
+
+def test_filter_by_day_expands_daily_and_weekdays():
+    """Test that "daily" and "weekdays" schedules are found on each day they cover"""
+    def activity(schedule):
+        return {"description": "", "schedule": schedule, "max_participants": 5,
+                "participants": []}
+
+    index = ActivityIndex(InMemoryActivityStore({
+        "Choir": activity("Daily, 7:00 - 7:45 AM"),
+        "Homework Club": activity("Weekdays, 3:30 PM - 5:00 PM"),
+        "Hiking": activity("Weekends, 9 AM - 12 PM"),
+    }))
+    assert index.query(10, day="monday") == (["Choir", "Homework Club"], False)
+    assert index.query(10, day="sunday") == (["Choir", "Hiking"], False)
+
+
+def test_filter_by_free_seats(client):
+    """Test that full activities are excluded by has_free_seats=true"""
+    for i in range(10):
+        client.post(f"/activities/Chess%20Club/signup?email=student{i}@mergington.edu")
+
+    free = client.get("/activities?has_free_seats=true").json()["activities"]
+    assert "Chess Club" not in free
+    assert "Art Club" in free
+
+    full = client.get("/activities?has_free_seats=false").json()["activities"]
+    assert list(full) == ["Chess Club"]
+
+    client.delete("/activities/Chess%20Club/remove?email=student0@mergington.edu")
+    free = client.get("/activities?has_free_seats=true").json()["activities"]
+    assert "Chess Club" in free
+
+
+def test_filter_by_prefix(client):
+    """Test filtering activities by name prefix"""
+    page = client.get("/activities?prefix=D").json()
+    assert list(page["activities"]) == ["Debate Team", "Drama Club"]
+    assert page["next_cursor"] is None
+
+
+def test_combined_filters(client):
+    """Test that filters combine with each other and with pagination"""
+    page = client.get("/activities?day=tuesday&has_free_seats=true&limit=1").json()
+    assert list(page["activities"]) == ["Debate Team"]
+    cursor = page["next_cursor"]
+    page = client.get(f"/activities?day=tuesday&has_free_seats=true&limit=1&cursor={cursor}").json()
+    assert list(page["activities"]) == ["Programming Class"]
+
+
+def test_field_projection(client):
+    """Test that fields selects what is returned for each activity"""
+    page = client.get("/activities?prefix=Chess&fields=schedule,counts").json()
+    assert page["activities"]["Chess Club"] == {
+        "schedule": "Fridays, 3:30 PM - 5:00 PM",
+        "participant_count": 2,
+        "spots_left": 10,
+    }
+
+
+@pytest.mark.parametrize("query,detail", [
+    ("limit=0", "limit must be between 1 and 500"),
+    ("cursor=not-a-cursor!", "Invalid cursor"),
+    ("day=someday", "Invalid day"),
+    ("day=mondayss", "Invalid day"),
+    ("fields=secret", "Unknown field: secret"),
+])
+def test_invalid_listing_queries(client, query, detail):
+    """Test that invalid listing parameters are rejected with 400"""
+    response = client.get(f"/activities?{query}")
+    assert response.status_code == 400
+    assert response.json()["detail"] == detail
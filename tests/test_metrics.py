@@ -0,0 +1,122 @@
+"""
+Tests for the Prometheus metrics middleware and endpoint
+"""
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.limits import RateLimitMiddleware
+from src.metrics import Metrics, MetricsMiddleware
+from src.store import InMemoryActivityStore
+
+
+def scrape(client):
+    """Return the samples of GET /metrics as a {series: value} dict"""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = {}
+    for line in response.text.splitlines():
+        if line and not line.startswith("#"):
+            series, value = line.rsplit(" ", 1)
+            samples[series] = float(value)
+    return samples
+
+
+SIGNUP_OK = ('http_requests_total{method="POST",route="/activities/{activity_name}/signup",'
+             'status="200"}')
+SIGNUP_NOT_FOUND = ('http_requests_total{method="POST",route="/activities/{activity_name}/signup",'
+                    'status="404"}')
+
+
+def test_requests_are_counted_by_route_template(client):
+    """Test that requests are labelled with the route template and status"""
+    before = scrape(client)
+    client.post("/activities/Chess Club/signup?email=metrics@mergington.edu")
+    client.post("/activities/Nope/signup?email=metrics@mergington.edu")
+    after = scrape(client)
+
+    assert after[SIGNUP_OK] - before.get(SIGNUP_OK, 0) == 1
+    assert after[SIGNUP_NOT_FOUND] - before.get(SIGNUP_NOT_FOUND, 0) == 1
+    error = 'activity_errors_total{error="ActivityNotFoundError"}'
+    assert after[error] - before.get(error, 0) == 1
+    # Paths are never used as labels
+    assert not any("Chess Club" in series for series in after)
+
+
+def test_unmatched_requests_share_one_label(client):
+    """Test that unknown paths do not create new series"""
+    client.get("/no/such/path")
+    client.get("/another/missing/path")
+    samples = scrape(client)
+    assert samples['http_requests_total{method="GET",route="unmatched",status="404"}'] >= 2
+
+
+def test_shed_requests_are_counted_by_route_template():
+    """Test that requests refused before routing are labelled with their route"""
+    app = FastAPI()
+
+    @app.get("/items/{name}")
+    async def item(name: str):
+        return {}
+
+    metrics = Metrics(InMemoryActivityStore({}))
+    app.add_middleware(RateLimitMiddleware, read=(1, 1))
+    app.add_middleware(MetricsMiddleware, metrics=metrics, routes=app.router.routes)
+    client = TestClient(app)
+    assert [client.get(f"/items/{name}").status_code for name in "ab"] == [200, 429]
+    assert client.get("/missing").status_code == 429
+
+    text = metrics.render()
+    assert 'http_requests_total{method="GET",route="/items/{name}",status="429"} 1' in text
+    assert 'http_requests_total{method="GET",route="unmatched",status="429"} 1' in text
+
+
+def test_latency_histogram_is_cumulative(client):
+    """Test that histogram buckets are cumulative and end with +Inf equal to the count"""
+    client.get("/activities")
+    samples = scrape(client)
+    prefix = 'http_request_duration_seconds_bucket{method="GET",route="/activities",le='
+    buckets = [value for series, value in samples.items() if series.startswith(prefix)]
+    assert buckets == sorted(buckets)
+    count = samples['http_request_duration_seconds_count{method="GET",route="/activities"}']
+    assert samples[prefix + '"+Inf"}'] == count >= 1
+
+
+def test_domain_gauges_follow_mutations(client):
+    """Test the total participants and activities at capacity gauges"""
+    samples = scrape(client)
+    assert samples["activity_participants"] == 18
+    assert samples["activities_at_capacity"] == 0
+
+    for number in range(10):
+        client.post(f"/activities/Chess Club/signup?email=full{number}@mergington.edu")
+    samples = scrape(client)
+    assert samples["activity_participants"] == 28
+    assert samples["activities_at_capacity"] == 1
+
+    client.delete("/activities/Chess Club/remove?email=full0@mergington.edu")
+    samples = scrape(client)
+    assert samples["activity_participants"] == 27
+    assert samples["activities_at_capacity"] == 0
+
+
+def test_shards_are_aggregated_across_threads():
+    """Test that counts recorded by different threads are summed on scrape"""
+    metrics = Metrics(InMemoryActivityStore({}))
+
+    def record():
+        for _ in range(1000):
+            metrics.shard().observe("GET", "/activities", 200, 0.002)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    text = metrics.render()
+    assert 'http_requests_total{method="GET",route="/activities",status="200"} 4000' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/activities",le="0.001"} 0' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/activities",le="0.0025"} 4000' in text
@@ -0,0 +1,63 @@
+"""
+Tests for the in-memory activity records
+"""
+import json
+
+import pytest
+
+from src.app import activities
+from src.models import Activity, ParticipantSet, Waitlist
+
+
+def test_participant_set_keeps_insertion_order():
+    """Test that participants are listed in signup order"""
+    participants = ParticipantSet(["b@mergington.edu", "a@mergington.edu"])
+    participants.add("c@mergington.edu")
+    participants.remove("b@mergington.edu")
+    participants.add("b@mergington.edu")
+    assert participants.to_list() == [
+        "a@mergington.edu", "c@mergington.edu", "b@mergington.edu"]
+    assert len(participants) == 3
+    assert "a@mergington.edu" in participants
+    assert "z@mergington.edu" not in participants
+
+
+def test_participant_set_remove_missing():
+    """Test that removing an unknown email raises KeyError"""
+    with pytest.raises(KeyError):
+        ParticipantSet().remove("missing@mergington.edu")
+
+
+def test_waitlist_positions_follow_departures():
+    """Test positions as students are promoted or leave from anywhere in the queue"""
+    waitlist = Waitlist(["a", "b", "c", "d", "e"])
+    waitlist.remove("c")
+    assert [waitlist.position(email) for email in "abde"] == [1, 2, 3, 4]
+    assert waitlist.popleft() == "a"
+    waitlist.remove("b")
+    assert waitlist.append("f") == 3
+    assert [waitlist.position(email) for email in "def"] == [1, 2, 3]
+    assert waitlist.position("a") is None
+    assert waitlist.to_list() == ["d", "e", "f"]
+
+
+def test_activity_uses_slots():
+    """Test that activity records do not carry a per-instance __dict__"""
+    activity = Activity.from_dict(activities["Chess Club"])
+    assert not hasattr(activity, "__dict__")
+    with pytest.raises(AttributeError):
+        activity.unknown = True
+
+
+def test_activity_round_trip_is_byte_identical():
+    """Test that Activity.to_dict serializes exactly like the original dicts"""
+    for details in activities.values():
+        activity = Activity.from_dict(details)
+        assert json.dumps(activity.to_dict()) == json.dumps(details)
+
+
+def test_get_activities_payload_unchanged(client):
+    """Test that GET /activities still serves the seed data byte for byte"""
+    response = client.get("/activities")
+    expected = json.dumps(activities, separators=(",", ":"), ensure_ascii=False)
+    assert response.content == expected.encode("utf-8")
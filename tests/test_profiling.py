@@ -0,0 +1,91 @@
+"""
+Tests for opt-in request profiling and the slow-trace buffer
+"""
+import pytest
+
+from src.app import profiler
+from src.profiling import Profiler, Trace
+
+
+@pytest.fixture
+def profiling():
+    """Enable header-triggered profiling for one test"""
+    profiler.sample_rate = 0.0
+    profiler.clear()
+    yield profiler
+    profiler.sample_rate = None
+    profiler.clear()
+
+
+def test_admin_endpoints_are_hidden_when_disabled(client):
+    """Test that the profile endpoints answer 404 unless profiling is enabled"""
+    assert client.get("/admin/profiles").status_code == 404
+    assert client.get("/admin/profiles/1").status_code == 404
+
+
+def test_only_requests_with_header_are_profiled_at_rate_zero(client, profiling):
+    """Test that the X-Profile header forces profiling"""
+    client.get("/activities")
+    assert client.get("/admin/profiles").json()["traces"] == []
+
+    client.get("/activities", headers={"X-Profile": "1"})
+    traces = client.get("/admin/profiles").json()["traces"]
+    assert len(traces) == 1
+    assert traces[0]["method"] == "GET"
+    assert traces[0]["path"] == "/activities"
+    assert traces[0]["status"] == 200
+
+
+def test_trace_details_have_spans_and_phases(client, profiling):
+    """Test that a trace records our spans, framework phases and top functions"""
+    client.post("/activities/Chess Club/signup?email=profile@mergington.edu",
+                headers={"X-Profile": "1"})
+    trace_id = client.get("/admin/profiles").json()["traces"][0]["id"]
+
+    details = client.get(f"/admin/profiles/{trace_id}").json()
+    assert [span["name"] for span in details["spans"]] == ["store.signup"]
+    assert set(details["phases_ms"]) == {"routing", "validation", "endpoint", "serialization"}
+    assert details["phases_ms"]["validation"] > 0
+    assert details["functions"]
+
+
+def test_speedscope_and_flamegraph_exports(client, profiling):
+    """Test the speedscope file and the collapsed stacks of a trace"""
+    client.get("/activities?limit=5", headers={"X-Profile": "1"})
+    trace_id = client.get("/admin/profiles").json()["traces"][0]["id"]
+
+    speedscope = client.get(f"/admin/profiles/{trace_id}/speedscope.json").json()
+    sampled, evented = speedscope["profiles"]
+    assert sampled["type"] == "sampled"
+    assert len(sampled["samples"]) == len(sampled["weights"]) > 0
+    frames = speedscope["shared"]["frames"]
+    assert all(0 <= index < len(frames) for sample in sampled["samples"] for index in sample)
+    span_names = {frames[event["frame"]]["name"] for event in evented["events"]}
+    assert span_names == {"index_query", "fetch"}
+
+    flamegraph = client.get(f"/admin/profiles/{trace_id}/flamegraph.txt").text
+    for line in flamegraph.strip().splitlines():
+        stack, micros = line.rsplit(" ", 1)
+        assert stack and int(micros) > 0
+
+
+def test_profiler_keeps_only_the_slowest_traces():
+    """Test that the buffer keeps the N slowest traces"""
+    profiler = Profiler(sample_rate=1.0, keep=3)
+    for trace_id, duration in enumerate([5, 1, 9, 3, 7, 2], start=1):
+        trace = Trace(trace_id, "GET", "/activities")
+        trace.duration = duration
+        profiler.record(trace)
+    assert [trace.duration for trace in profiler.traces()] == [9, 7, 5]
+    assert profiler.get(2) is None
+
+
+def test_one_request_at_a_time_gets_cprofile():
+    """Test that a second concurrent slot is empty and the slot frees once left"""
+    profiler = Profiler(sample_rate=1.0)
+    assert [profiler.new_trace("GET", "/").id for _ in range(2)] == [1, 2]
+    with profiler.cprofile_slot() as first:
+        with profiler.cprofile_slot() as second:
+            assert first is not None and second is None
+    with profiler.cprofile_slot() as again:
+        assert again is not None
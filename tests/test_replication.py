@@ -0,0 +1,184 @@
+"""
+Tests for the change feed, replicas and write forwarding
+"""
+import asyncio
+import http.client
+
+from fastapi.testclient import TestClient
+
+from src.app import activities, app, store
+from src.replication import ChangeFeed, Replica, ReplicaMiddleware
+from src.store import InMemoryActivityStore, SQLiteActivityStore
+
+EMAIL = "new@mergington.edu"
+
+
+def make_replica(client):
+    """A replica of the app's store reaching it through the test client"""
+    replica = Replica(InMemoryActivityStore(), "http://primary")
+
+    def fetch(path, timeout):
+        response = client.get(path)
+        return response.status_code, response.json() if response.status_code == 200 else None
+
+    replica.fetch = fetch
+    return replica
+
+
+def roster(store):
+    return store.get_all(), store.get_waitlists()
+
+
+def test_change_feed(client):
+    """Test that changes are listed after a version of the feed's snapshot"""
+    snapshot = client.get("/replication/snapshot").json()
+    version = snapshot["version"]
+    assert list(snapshot["activities"]) == list(activities)
+    client.post(f"/activities/Chess Club/signup?email={EMAIL}")
+
+    response = client.get(f"/replication/changes?feed={snapshot['feed']}&after={version}")
+    assert response.json() == {"version": version + 1,
+                               "changes": [[version + 1, "s", "Chess Club", EMAIL]]}
+    # Versions from before the last load, or of another feed, need a new snapshot
+    assert client.get(f"/replication/changes?after={version - 1}").status_code == 410
+    response = client.get(f"/replication/changes?feed=other&after={version}")
+    assert response.status_code == 410
+
+
+def test_replica_follows_primary(client):
+    """Test that a replica applies signups, waitlists and promotions as the primary did"""
+    replica = make_replica(client)
+    replica.bootstrap()
+    assert roster(replica.store) == roster(store)
+
+    store.signup_many([("Chess Club", f"student{number}@mergington.edu")
+                       for number in range(10)])
+    store.join_waitlist("Chess Club", EMAIL)
+    store.remove("Chess Club", "michael@mergington.edu")
+    replica.poll()
+    assert roster(replica.store) == roster(store)
+    assert EMAIL in replica.store.get_all()["Chess Club"]["participants"]
+    status = replica.status()
+    assert status["applied_version"] == store.version()
+    assert status["lag_versions"] == 0
+
+    # A reload of the primary makes the replica start over from a snapshot
+    store.load(activities)
+    replica.poll()
+    assert roster(replica.store) == roster(store)
+
+
+def test_change_feed_long_poll():
+    """Test that a long poll returns as soon as a change comes in"""
+    primary = InMemoryActivityStore(activities)
+    feed = ChangeFeed(primary)
+    version = primary.version()
+
+    async def scenario():
+        waiting = asyncio.ensure_future(feed.wait(version, timeout=5))
+        await asyncio.sleep(0)
+        primary.signup("Chess Club", EMAIL)
+        changes, _ = await asyncio.wait_for(waiting, 1)
+        idle, _ = await feed.wait(version + 1, timeout=0.01)
+        return changes, idle
+
+    changes, idle = asyncio.run(scenario())
+    assert changes == [[version + 1, "s", "Chess Club", EMAIL]]
+    assert idle == []
+
+
+def test_replica_forwards_writes(client):
+    """Test that writes to a replica are made by the primary and seen by the replica"""
+    replica = make_replica(client)
+
+    def forward(method, target, headers, body):
+        response = client.request(method, target, headers=headers, content=body)
+        # What the replica's tailing thread would do
+        replica.poll()
+        return response.status_code, response.headers, response.content
+
+    replica.forward = forward
+    replica_client = TestClient(ReplicaMiddleware(app, replica, read_your_writes=0.1))
+    assert replica_client.get("/activities").status_code == 503
+
+    replica.bootstrap()
+    response = replica_client.post(f"/activities/Chess Club/signup?email={EMAIL}")
+    assert response.status_code == 200
+    assert response.json()["total_participants"] == 3
+    assert int(response.headers["x-activity-version"]) == replica.applied_version
+    assert EMAIL in replica.store.get_all()["Chess Club"]["participants"]
+
+    response = replica_client.post(f"/activities/Chess Club/signup?email={EMAIL}")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Student already signed up for this activity"
+
+
+def test_replica_streams_write_bodies_with_client_address(client):
+    """Test that bodies reach the primary in chunks, with the client in X-Forwarded-For"""
+    replica = make_replica(client)
+    replica.bootstrap()
+    forwarded = []
+
+    def forward(method, target, headers, body):
+        chunks = [body] if isinstance(body, bytes) else list(body)
+        forwarded.append((headers, chunks))
+        response = client.request(method, target, headers=headers, content=b"".join(chunks))
+        replica.poll()
+        return response.status_code, response.headers, response.content
+
+    replica.forward = forward
+    rows = [f'{{"activity": "Art Club", "email": "s{number}@mergington.edu"}}\n'.encode()
+            for number in range(3)]
+    messages = [{"type": "http.request", "body": row, "more_body": True} for row in rows]
+    messages.append({"type": "http.request", "body": b""})
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/activities/import",
+             "raw_path": b"/activities/import", "query_string": b"",
+             "headers": [(b"x-forwarded-for", b"10.0.0.1")], "client": ("192.0.2.7", 50000)}
+    asyncio.run(ReplicaMiddleware(app, replica, read_your_writes=0.1)(scope, receive, send))
+    assert sent[0]["status"] == 200
+    headers, chunks = forwarded[0]
+    assert chunks == rows
+    assert headers["x-forwarded-for"] == "10.0.0.1, 192.0.2.7"
+    assert len(store.get_all()["Art Club"]["participants"]) == 5
+
+
+def test_replica_maps_primary_failures(client):
+    """Test that unreachable primaries answer 503 and unreadable answers 502"""
+    replica = make_replica(client)
+    replica.bootstrap()
+    replica_client = TestClient(ReplicaMiddleware(app, replica))
+    url = f"/activities/Chess Club/signup?email={EMAIL}"
+    for error, status in ((ConnectionRefusedError(), 503), (http.client.BadStatusLine(""), 502)):
+        def forward(method, target, headers, body, error=error):
+            raise error
+
+        replica.forward = forward
+        assert replica_client.post(url).status_code == status
+
+
+def test_change_feed_is_shared_by_workers(tmp_path):
+    """Test that workers on one SQLite database serve the same feed, and another database does not"""
+    path = str(tmp_path / "activities.db")
+    first, second = SQLiteActivityStore(path), SQLiteActivityStore(path)
+    first.load(activities)
+    first_feed, second_feed = ChangeFeed(first), ChangeFeed(second)
+    assert first_feed.id == second_feed.id
+    version = first.version()
+
+    first.signup("Chess Club", EMAIL)
+    second.catch_up()
+    changes, _ = second_feed.read(version, feed=first_feed.id)
+    assert changes == [[version + 1, "s", "Chess Club", EMAIL]]
+
+    other = SQLiteActivityStore(str(tmp_path / "other.db"))
+    assert ChangeFeed(other).id != first_feed.id
+    for sqlite_store in (first, second, other):
+        sqlite_store.close()
@@ -0,0 +1,88 @@
+"""
+Tests for JSON encoding and response compression
+"""
+import gzip
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import responses
+from src.app import activities_cache
+from src.responses import CompressionMiddleware, encode_json
+
+
+def test_encode_json_matches_the_standard_library(monkeypatch):
+    """Test that both encoders produce FastAPI's compact UTF-8 JSON"""
+    content = {"Café Club": {"participants": ["zoë@mergington.edu"], "max_participants": 3}}
+    expected = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    assert encode_json(content) == expected
+    monkeypatch.setattr(responses, "orjson", None)
+    assert encode_json(content) == expected
+
+
+def test_activities_snapshot_is_compressed_and_cached(client):
+    """Test that the full list is gzipped once per version, with a variant ETag"""
+    response = client.get("/activities", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"].endswith('-gzip"')
+    assert "Chess Club" in response.json()
+
+    snapshot = activities_cache.get()
+    assert gzip.decompress(snapshot.compressed["gzip"]) == snapshot.body
+
+    revalidated = client.get("/activities", headers={
+        "Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]})
+    assert revalidated.status_code == 304
+
+
+def test_identity_when_compression_is_not_accepted(client):
+    """Test that clients without Accept-Encoding get plain JSON"""
+    response = client.get("/activities", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert not response.headers["etag"].endswith('-gzip"')
+
+
+def test_listing_pages_are_compressed_by_the_middleware(client):
+    """Test that large dynamic responses are compressed on the way out"""
+    response = client.get("/activities?limit=100", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert len(response.json()["activities"]) == 9
+
+
+def test_small_and_streaming_responses_are_not_compressed(client):
+    """Test the size threshold and that streams pass through untouched"""
+    response = client.post("/activities/Chess Club/signup?email=small@mergington.edu",
+                           headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+    response = client.get("/activities/export?format=csv", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.text.startswith("activity,email\n")
+
+
+def test_zstd_is_preferred_when_available(client, monkeypatch):
+    """Test that zstd is negotiated when the zstandard package is installed"""
+    pytest.importorskip("zstandard")
+    response = client.get("/activities?limit=100", headers={"Accept-Encoding": "gzip, zstd"})
+    assert response.headers["content-encoding"] == "zstd"
+
+
+def test_middleware_gives_compressed_responses_a_variant_etag():
+    """Test that a compressed response gets its own ETag and a single Accept-Encoding in Vary"""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"application/json"), (b"etag", b'"abc"'),
+            (b"vary", b"Origin, accept-encoding")]})
+        await send({"type": "http.response.body", "body": b"[" + b"1," * 1000 + b"1]"})
+
+    client = TestClient(CompressionMiddleware(app))
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == '"abc-gzip"'
+    assert response.headers["vary"] == "Origin, accept-encoding"
+
+    response = client.get("/", headers={"Accept-Encoding": "identity"})
+    assert response.headers["etag"] == '"abc"'
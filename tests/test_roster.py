@@ -0,0 +1,82 @@
+"""
+Tests for streaming roster export and import
+"""
+import json
+
+from src.app import store
+from src.roster import RosterImporter, export_roster
+
+
+def test_export_ndjson(client):
+    """Test exporting the roster as NDJSON"""
+    response = client.get("/activities/export?format=ndjson")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows[0] == {"activity": "Chess Club", "email": "michael@mergington.edu"}
+    assert len(rows) == 18
+
+
+def test_export_csv(client):
+    """Test exporting the roster as CSV with a header"""
+    response = client.get("/activities/export?format=csv")
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert lines[0] == "activity,email"
+    assert lines[1] == "Chess Club,michael@mergington.edu"
+    assert len(lines) == 19
+
+
+def test_export_is_chunked():
+    """Test that the export is produced in bounded chunks"""
+    store.signup_many([("Gym Class", f"student{i}@mergington.edu") for i in range(28)])
+    chunks = list(export_roster(store, "ndjson", chunk_size=256))
+    assert len(chunks) > 1
+    assert all(len(chunk) < 512 for chunk in chunks)
+
+
+def test_import_csv(client):
+    """Test importing a CSV roster"""
+    body = "activity,email\nChess Club,new@mergington.edu\nChess Club,michael@mergington.edu\n"
+    response = client.post("/activities/import?format=csv", content=body)
+    assert response.status_code == 200
+    assert response.json() == {
+        "applied": 1,
+        "failed": 1,
+        "errors": [{"line": 3, "detail": "Student already signed up for this activity"}],
+    }
+    assert "new@mergington.edu" in client.get("/activities").json()["Chess Club"]["participants"]
+
+
+def test_import_ndjson_reports_malformed_rows(client):
+    """Test that malformed NDJSON rows are reported with their line number"""
+    body = ('{"activity": "Art Club", "email": "x@mergington.edu"}\n'
+            'not json\n'
+            '{"activity": "Nonexistent", "email": "x@mergington.edu"}')
+    data = client.post("/activities/import", content=body).json()
+    assert data["applied"] == 1
+    assert data["errors"] == [
+        {"line": 2, "detail": "Malformed row"},
+        {"line": 3, "detail": "Activity not found"},
+    ]
+
+
+def test_import_requires_csv_header(client):
+    """Test that a CSV roster without header is rejected"""
+    response = client.post("/activities/import?format=csv",
+                           content="Chess Club,new@mergington.edu\n")
+    assert response.status_code == 400
+
+
+def test_importer_handles_split_chunks():
+    """Test that rows and multi-byte characters split across chunks are parsed"""
+    importer = RosterImporter(store, "csv", batch_size=2)
+    data = "activity,email\nArt Club,josé@mergington.edu\nArt Club,b@mergington.edu\n".encode()
+    batches = []
+    for i in range(0, len(data), 5):
+        batches.extend(importer.feed(data[i:i + 5]))
+    batches.extend(importer.close())
+    for batch in batches:
+        importer.apply(batch)
+    assert importer.applied == 2
+    assert "josé@mergington.edu" in store.get_all()["Art Club"]["participants"]
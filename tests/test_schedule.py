@@ -0,0 +1,120 @@
+"""
+Tests for schedule parsing, signup conflicts and free_at listings
+"""
+import pytest
+
+from src.app import schedule_index
+from src.schedule import MINUTES_PER_DAY, parse_meetings, parse_slot
+
+TUESDAY = MINUTES_PER_DAY
+
+
+@pytest.mark.parametrize("schedule,meetings", [
+    ("Tuesdays and Thursdays, 3:30 PM - 4:30 PM",
+     [(TUESDAY + 930, TUESDAY + 990), (3 * MINUTES_PER_DAY + 930, 3 * MINUTES_PER_DAY + 990)]),
+    ("Mondays 3-4 PM, Fridays 2-3 PM", [(900, 960), (4 * MINUTES_PER_DAY + 840,
+                                                     4 * MINUTES_PER_DAY + 900)]),
+    ("11:30 - 1:00 PM on Tuesdays", [(TUESDAY + 690, TUESDAY + 780)]),
+    ("Daily 16:00-17:30", [(day * MINUTES_PER_DAY + 960, day * MINUTES_PER_DAY + 1050)
+                           for day in range(7)]),
+    # Past midnight on Sunday wraps to Monday
+    ("Sundays, 9 PM - 1 AM", [(0, 60), (6 * MINUTES_PER_DAY + 1260, 7 * MINUTES_PER_DAY)]),
+    ("By appointment", []),
+])
+def test_parse_meetings(schedule, meetings):
+    """Test that schedules are parsed into weekly meetings"""
+    assert parse_meetings(schedule) == meetings
+
+
+def test_parse_slot():
+    """Test that free_at accepts a moment or a window on one day"""
+    assert parse_slot("Tuesday 4:00 PM") == (TUESDAY + 960, TUESDAY + 960)
+    assert parse_slot("tuesday 16:00") == (TUESDAY + 960, TUESDAY + 960)
+    assert parse_slot("Tuesday 3:30 PM - 5:00 PM") == (TUESDAY + 930, TUESDAY + 1020)
+    with pytest.raises(ValueError):
+        parse_slot("4:00 PM")
+
+
+def test_signup_rejects_schedule_conflicts(client):
+    """Test that overlapping activities of a student are refused with 409"""
+    email = "michael@mergington.edu"
+    # Drama Club meets on Fridays at 3:30 PM, like Chess Club
+    response = client.post(f"/activities/Drama Club/signup?email={email}")
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Schedule conflicts with Chess Club"
+    response = client.post(f"/activities/Drama Club/waitlist?email={email}")
+    assert response.status_code == 409
+
+    # Gym Class ends at 3:00 PM on Fridays
+    assert client.post(f"/activities/Gym Class/signup?email={email}").status_code == 200
+    client.delete(f"/activities/Chess Club/remove?email={email}")
+    version = schedule_index.version
+    assert client.post(f"/activities/Drama Club/signup?email={email}").status_code == 200
+    # Applied from mutations, not rebuilt
+    assert schedule_index.version == version + 1
+
+
+def test_waitlists_count_as_schedule_conflicts(client):
+    """Test that a waitlisted student cannot take a seat that would clash once promoted"""
+    email = "x@mergington.edu"
+    client.post("/activities/Debate Team/signups:batch",
+                json={"emails": [f"debater{number}@mergington.edu" for number in range(14)]})
+    assert client.post(f"/activities/Debate Team/waitlist?email={email}").json()["position"] == 1
+
+    # Programming Class meets on Tuesdays at 3:30 PM, like Debate Team
+    response = client.post(f"/activities/Programming Class/signup?email={email}")
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Schedule conflicts with Debate Team"
+    client.delete("/activities/Debate Team/remove?email=ava@mergington.edu")
+    activities = client.get(f"/students/{email}/activities").json()
+    assert activities["activities"] == ["Debate Team"]
+
+    # Leaving the activity frees the time again
+    client.delete(f"/activities/Debate Team/remove?email={email}")
+    assert client.post(f"/activities/Programming Class/signup?email={email}").status_code == 200
+    response = client.post(f"/activities/Debate Team/waitlist?email={email}")
+    assert response.status_code == 409
+
+
+def test_batch_signups_check_schedule_conflicts(client):
+    """Test that batch items clashing with the student's activities or earlier items get 409"""
+    items = [
+        # Chess Club already meets at that time
+        {"activity": "Drama Club", "email": "michael@mergington.edu"},
+        {"activity": "Debate Team", "email": "new@mergington.edu"},
+        # Same time as the item above
+        {"activity": "Programming Class", "email": "new@mergington.edu"},
+        {"activity": "Art Club", "email": "new@mergington.edu"},
+    ]
+    response = client.post("/activities/signups:batch", json={"items": items,
+                                                              "mode": "all_or_nothing"})
+    assert response.json()["applied"] == 0
+    assert [item["status"] for item in response.json()["results"]] == [409, 409, 409, 409]
+    assert response.json()["results"][2]["detail"] == "Schedule conflicts with Debate Team"
+    assert client.get("/students/new@mergington.edu/activities").json()["activities"] == []
+
+    results = client.post("/activities/signups:batch", json={"items": items}).json()["results"]
+    assert [item["status"] for item in results] == [409, 200, 409, 200]
+    assert results[0]["detail"] == "Schedule conflicts with Chess Club"
+    activities = client.get("/students/new@mergington.edu/activities").json()["activities"]
+    assert activities == ["Art Club", "Debate Team"]
+
+    response = client.post("/activities/Drama Club/signups:batch",
+                           json={"emails": ["michael@mergington.edu", "new@mergington.edu"]})
+    assert [item["status"] for item in response.json()["results"]] == [409, 200]
+
+
+def test_list_activities_free_at(client):
+    """Test free_at moments and windows"""
+    page = client.get("/activities?free_at=Tuesday 4:15 PM").json()
+    assert list(page["activities"]) == ["Debate Team", "Programming Class", "Soccer Club"]
+    page = client.get("/activities?free_at=Tuesday 3:00 PM - 5:00 PM&fields=schedule").json()
+    assert list(page["activities"]) == ["Debate Team", "Programming Class"]
+    page = client.get("/activities?free_at=Sunday 10:00 AM").json()
+    assert page["activities"] == {}
+
+    response = client.get("/activities?free_at=someday")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid free_at: Expected a single day"
+    response = client.get("/activities?free_at=Tuesday 4:00 PM&day=tuesday")
+    assert response.status_code == 400
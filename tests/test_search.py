@@ -0,0 +1,77 @@
+"""
+Tests for activity and student search
+"""
+from src.app import search_index
+from src.search import SearchIndex
+from src.store import InMemoryActivityStore
+
+
+def names(response):
+    return [activity["name"] for activity in response.json()["activities"]]
+
+
+def test_search_ranks_name_matches_first(client):
+    """Test that every word must match and that matches in the name rank first"""
+    assert names(client.get("/activities/search?q=Competitive")) == [
+        "Basketball Team", "Debate Team", "Science Olympiad"]
+    assert names(client.get("/activities/search?q=team")) == [
+        "Basketball Team", "Debate Team", "Science Olympiad"]
+    assert names(client.get("/activities/search?q=competitive team")) == [
+        "Basketball Team", "Debate Team", "Science Olympiad"]
+    assert names(client.get("/activities/search?q=chess club")) == ["Chess Club"]
+    activity = client.get("/activities/search?q=chess").json()["activities"][0]
+    assert activity["schedule"] == "Fridays, 3:30 PM - 5:00 PM"
+    assert activity["participant_count"] == 2
+    assert activity["score"] > 0
+
+
+def test_search_matches_prefixes_and_typos(client):
+    """Test prefix and trigram fuzzy matching of query words"""
+    assert names(client.get("/activities/search?q=progr")) == ["Programming Class"]
+    assert names(client.get("/activities/search?q=chemsitry")) == ["Science Olympiad"]
+    assert names(client.get("/activities/search?q=basketbal")) == ["Basketball Team"]
+    assert names(client.get("/activities/search?q=xylophone")) == []
+
+
+def test_search_students_by_email_prefix(client):
+    """Test that participant emails are searched and follow signups and removals"""
+    assert len(client.get("/activities/search?q=michael").json()["students"]) == 1
+    client.post("/activities/Art Club/signup?email=Michaela@mergington.edu")
+    students = client.get("/activities/search?q=michael").json()["students"]
+    assert students == [
+        {"email": "michael@mergington.edu", "activities": ["Chess Club"]},
+        {"email": "Michaela@mergington.edu", "activities": ["Art Club"]},
+    ]
+    client.delete("/activities/Chess Club/remove?email=michael@mergington.edu")
+    version = search_index.version
+    students = client.get("/activities/search?q=michael").json()["students"]
+    assert [student["email"] for student in students] == ["Michaela@mergington.edu"]
+    # Applied from mutations, not rebuilt
+    assert search_index.version == version
+
+
+def test_search_validates_query(client):
+    """Test that empty queries and out of range limits are rejected"""
+    assert client.get("/activities/search?q=%20").status_code == 400
+    assert client.get("/activities/search?q=club&limit=0").status_code == 400
+    assert client.get("/activities/search").status_code == 422
+    assert len(names(client.get("/activities/search?q=club&limit=2"))) == 2
+
+
+def test_search_matches_full_scoring_on_larger_catalog():
+    """Test that the early-stopping search returns what scoring everything would"""
+    words = ["chess", "robotics", "chemistry", "club", "team", "lab", "art", "artist"]
+    activities = {}
+    for number in range(2000):
+        name = f"{words[number % 8]} {words[number * 7 % 5]} {words[number % 3 + 5]} {number}"
+        description = " ".join(words[(number + offset) % 8] for offset in range(0, 9, 3))
+        activities[name] = {"description": description, "schedule": "Fridays",
+                            "max_participants": 10, "participants": []}
+    index = SearchIndex(InMemoryActivityStore(activities))
+    for query in ("club", "chess club", "art", "robotics team lab", "chemistry art club"):
+        results = index.search(query, limit=5)
+        assert len(results) == 5
+        everything = index.search(query, limit=len(activities))
+        assert results == everything[:5]
+        expected = sorted(everything, key=lambda result: (-result[1], result[0]))
+        assert everything == expected
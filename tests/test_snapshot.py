@@ -0,0 +1,65 @@
+"""
+Tests for the cached GET /activities snapshot and its ETag support
+"""
+import pytest
+
+from src.app import activities_cache, store
+from src.snapshot import etag_matches
+
+
+def test_activities_response_has_etag(client):
+    """Test that the activity list is served with a strong ETag"""
+    response = client.get("/activities")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    etag = response.headers["etag"]
+    assert etag.startswith('"') and not etag.startswith("W/")
+    assert response.headers["cache-control"] == "no-cache"
+
+
+def test_if_none_match_returns_304(client):
+    """Test that a matching If-None-Match returns 304 with no body"""
+    etag = client.get("/activities").headers["etag"]
+    response = client.get("/activities", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_etag_changes_after_signup_and_remove(client):
+    """Test that mutations invalidate the cached snapshot"""
+    first = client.get("/activities").headers["etag"]
+    client.post("/activities/Chess%20Club/signup?email=etag@mergington.edu")
+
+    response = client.get("/activities", headers={"If-None-Match": first})
+    assert response.status_code == 200
+    assert "etag@mergington.edu" in response.json()["Chess Club"]["participants"]
+    second = response.headers["etag"]
+    assert second != first
+
+    client.delete("/activities/Chess%20Club/remove?email=etag@mergington.edu")
+    # Same content as before the signup, so the same strong ETag
+    assert client.get("/activities").headers["etag"] == first
+
+
+def test_snapshot_is_reused_until_version_changes():
+    """Test that the serialized body is only rebuilt after a mutation"""
+    snapshot = activities_cache.get()
+    assert activities_cache.get() is snapshot
+    store.signup("Art Club", "rebuild@mergington.edu")
+    rebuilt = activities_cache.get()
+    assert rebuilt is not snapshot
+    assert b"rebuild@mergington.edu" in rebuilt.body
+
+
+@pytest.mark.parametrize("header,expected", [
+    (None, False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"other", "abc"', True),
+    ("*", True),
+    ('"other"', False),
+])
+def test_etag_matches(header, expected):
+    """Test If-None-Match parsing"""
+    assert etag_matches(header, '"abc"') is expected
@@ -0,0 +1,355 @@
+"""
+Tests for the storage engines behind the API
+"""
+import asyncio
+import copy
+import threading
+
+import pytest
+
+from src.app import activities
+from src.indexes import ActivityIndex, ScheduleIndex
+from src.store import (
+    ActivityFullError,
+    ActivityNotFoundError,
+    AlreadySignedUpError,
+    AlreadyWaitlistedError,
+    AsyncActivityStore,
+    InMemoryActivityStore,
+    NotWaitlistedError,
+    ParticipantNotFoundError,
+    SQLiteActivityStore,
+    create_store,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    """Create a store of each kind seeded with the default activities"""
+    seed = copy.deepcopy(activities)
+    if request.param == "memory":
+        store = InMemoryActivityStore(seed)
+    else:
+        store = SQLiteActivityStore(str(tmp_path / "activities.db"))
+        store.load(seed)
+    yield store
+    store.close()
+
+
+def test_get_all_matches_seed(store):
+    """Test that a freshly seeded store returns the seed data in order"""
+    assert store.get_all() == activities
+    assert list(store.get_all()) == list(activities)
+
+
+def test_signup_and_remove(store):
+    """Test that signup and removal update the participant list"""
+    assert store.signup("Chess Club", "new@mergington.edu") == 3
+    assert store.get_all()["Chess Club"]["participants"][-1] == "new@mergington.edu"
+    assert store.remove("Chess Club", "michael@mergington.edu") == 2
+    assert store.get_all()["Chess Club"]["participants"] == [
+        "daniel@mergington.edu", "new@mergington.edu"]
+
+
+def test_store_errors(store):
+    """Test that stores raise the same errors as the API reports"""
+    with pytest.raises(ActivityNotFoundError):
+        store.signup("Nonexistent", "test@mergington.edu")
+    with pytest.raises(AlreadySignedUpError):
+        store.signup("Chess Club", "michael@mergington.edu")
+    with pytest.raises(ActivityNotFoundError):
+        store.remove("Nonexistent", "test@mergington.edu")
+    with pytest.raises(ParticipantNotFoundError):
+        store.remove("Chess Club", "test@mergington.edu")
+
+
+def test_store_capacity(store):
+    """Test that a store never goes over max_participants"""
+    for i in range(10):
+        store.signup("Chess Club", f"student{i}@mergington.edu")
+    with pytest.raises(ActivityFullError):
+        store.signup("Chess Club", "overflow@mergington.edu")
+    # Duplicates are still reported as duplicates when the activity is full
+    with pytest.raises(AlreadySignedUpError):
+        store.signup("Chess Club", "student0@mergington.edu")
+
+
+def fill_chess_club(store):
+    for i in range(10):
+        store.signup("Chess Club", f"student{i}@mergington.edu")
+
+
+def test_waitlist_positions(store):
+    """Test that a full activity queues students in order"""
+    fill_chess_club(store)
+    assert store.join_waitlist("Chess Club", "first@mergington.edu") == 1
+    assert store.join_waitlist("Chess Club", "second@mergington.edu") == 2
+    assert store.join_waitlist("Chess Club", "third@mergington.edu") == 3
+    assert store.leave_waitlist("Chess Club", "second@mergington.edu") == 2
+    assert store.waitlist_position("Chess Club", "third@mergington.edu") == (2, 2)
+    assert store.waitlist_position("Chess Club") == (None, 2)
+    assert store.get_waitlists() == {
+        "Chess Club": ["first@mergington.edu", "third@mergington.edu"]}
+
+    with pytest.raises(AlreadyWaitlistedError):
+        store.join_waitlist("Chess Club", "first@mergington.edu")
+    with pytest.raises(AlreadySignedUpError):
+        store.join_waitlist("Chess Club", "student0@mergington.edu")
+    with pytest.raises(NotWaitlistedError):
+        store.waitlist_position("Chess Club", "second@mergington.edu")
+    with pytest.raises(NotWaitlistedError):
+        store.leave_waitlist("Chess Club", "second@mergington.edu")
+    with pytest.raises(ActivityNotFoundError):
+        store.join_waitlist("Nonexistent", "first@mergington.edu")
+    # With a free seat the student is signed up right away
+    assert store.join_waitlist("Art Club", "first@mergington.edu") == 0
+    assert "first@mergington.edu" in store.get_all()["Art Club"]["participants"]
+
+
+def test_snapshot_merges_waitlists(store):
+    """Test that a snapshot holds the version and each activity's waitlist"""
+    fill_chess_club(store)
+    store.join_waitlist("Chess Club", "first@mergington.edu")
+    version, snapshot = store.snapshot()
+    assert version == store.version()
+    assert snapshot["Chess Club"]["waitlist"] == ["first@mergington.edu"]
+    assert "waitlist" not in snapshot["Art Club"]
+    assert "waitlist" not in store.get_all()["Chess Club"]
+
+
+def test_removal_promotes_the_head_of_the_waitlist(store):
+    """Test that a freed seat goes to the first student waiting, in one step"""
+    fill_chess_club(store)
+    store.join_waitlist("Chess Club", "first@mergington.edu")
+    store.join_waitlist("Chess Club", "second@mergington.edu")
+    mutations = []
+    store.subscribe(mutations.append)
+
+    # The count includes the student promoted to the freed seat
+    assert store.remove("Chess Club", "michael@mergington.edu") == 12
+    participants = store.get_all()["Chess Club"]["participants"]
+    assert len(participants) == 12
+    assert participants[-1] == "first@mergington.edu"
+    assert store.waitlist_position("Chess Club", "second@mergington.edu") == (1, 1)
+    assert [(m.kind, m.email, m.total) for m in mutations] == [
+        ("remove", "michael@mergington.edu", 11),
+        ("promote", "first@mergington.edu", 12)]
+    assert mutations[1].version == mutations[0].version + 1 == store.version()
+
+    [result] = store.remove_many([("Chess Club", "daniel@mergington.edu")])
+    assert result.total == 12
+    assert store.get_all()["Chess Club"]["participants"][-1] == "second@mergington.edu"
+    assert store.get_waitlists() == {}
+
+
+def test_sqlite_store_persists_across_instances(tmp_path):
+    """Test that the SQLite store keeps signups after being reopened"""
+    url = f"sqlite:///{tmp_path / 'activities.db'}"
+    first = create_store(url, copy.deepcopy(activities))
+    first.signup("Art Club", "persist@mergington.edu")
+    first.close()
+
+    second = create_store(url, copy.deepcopy(activities))
+    assert "persist@mergington.edu" in second.get_all()["Art Club"]["participants"]
+    second.close()
+
+
+def test_sqlite_store_uses_wal(tmp_path):
+    """Test that the SQLite store enables write-ahead logging"""
+    store = SQLiteActivityStore(str(tmp_path / "activities.db"))
+    with store._connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    store.close()
+
+
+def test_sqlite_roster_export_does_not_hold_a_connection(tmp_path):
+    """Test that writes go through while a roster export is paused between rows"""
+    store = SQLiteActivityStore(str(tmp_path / "activities.db"), pool_size=1)
+    store.load(copy.deepcopy(activities))
+    rows = store.iter_roster(batch_size=2)
+    first = next(rows)
+    store.signup("Art Club", "export@mergington.edu")
+    rest = list(rows)
+    assert first == ("Chess Club", "michael@mergington.edu")
+    assert ("Art Club", "export@mergington.edu") in rest
+    store.close()
+
+
+def test_sqlite_change_feed_reaches_other_instances(tmp_path):
+    """Test that a store sees, in order, the changes made by another process"""
+    path = str(tmp_path / "activities.db")
+    writer = SQLiteActivityStore(path)
+    writer.load(copy.deepcopy(activities))
+    reader = SQLiteActivityStore(path)
+    seen = []
+    reader.subscribe(seen.append)
+
+    writer.signup("Chess Club", "feed@mergington.edu")
+    writer.remove("Chess Club", "michael@mergington.edu")
+    assert seen == []
+    reader.catch_up()
+    assert [(m.kind, m.email, m.total) for m in seen] == [
+        ("signup", "feed@mergington.edu", 3), ("remove", "michael@mergington.edu", 2)]
+    assert [m.version for m in seen] == [reader.version() - 1, reader.version()]
+
+    # Local writes also deliver the pending remote changes first
+    writer.signup("Art Club", "remote@mergington.edu")
+    reader.signup("Art Club", "local@mergington.edu")
+    assert [m.email for m in seen[2:]] == ["remote@mergington.edu", "local@mergington.edu"]
+    writer.close()
+    reader.close()
+
+
+def test_sqlite_index_applies_remote_changes_without_rebuild(tmp_path):
+    """Test that an index catches up from the change feed instead of rebuilding"""
+    path = str(tmp_path / "activities.db")
+    writer = SQLiteActivityStore(path)
+    writer.load({"Tiny": {"description": "", "schedule": "Mondays, 3:00 PM - 4:00 PM",
+                          "max_participants": 1, "participants": []}})
+    reader = SQLiteActivityStore(path)
+    index = ActivityIndex(reader)
+    index.ensure_current()
+    rebuilds = []
+    index.rebuild = lambda activities: rebuilds.append(activities)
+
+    writer.signup("Tiny", "only@mergington.edu")
+    assert index.query(10, has_free_seats=False) == (["Tiny"], False)
+    assert rebuilds == []
+    writer.close()
+    reader.close()
+
+
+def test_index_reads_again_after_changes_made_while_reading():
+    """Test that a rebuild never uses data read while the store changed"""
+    store = InMemoryActivityStore(copy.deepcopy(activities))
+    index = ScheduleIndex(store)
+    get_all = store.get_all
+    reads = []
+
+    def get_all_during_signup():
+        reads.append(store.version())
+        if len(reads) == 1:
+            store.signup("Chess Club", "new@mergington.edu")
+        return get_all()
+
+    store.get_all = get_all_during_signup
+    index.ensure_current()
+    assert len(reads) == 2
+    assert index.version == store.version()
+    assert index.busy["new@mergington.edu"] == [
+        (start, end, "Chess Club") for start, end in index.meetings["Chess Club"]]
+
+
+def test_sqlite_pruned_changes_become_a_reset(tmp_path):
+    """Test that a store too far behind the feed tells listeners to start over"""
+    path = str(tmp_path / "activities.db")
+    writer = SQLiteActivityStore(path)
+    writer.load(copy.deepcopy(activities))
+    reader = SQLiteActivityStore(path)
+    seen = []
+    reader.subscribe(seen.append)
+    writer.signup("Chess Club", "a@mergington.edu")
+    writer.signup("Chess Club", "b@mergington.edu")
+    with writer._connection() as conn:
+        conn.execute("DELETE FROM changes WHERE email = 'a@mergington.edu'")
+
+    reader.catch_up()
+    assert [(m.kind, m.email) for m in seen] == [("load", None), ("signup", "b@mergington.edu")]
+    writer.close()
+    reader.close()
+
+
+def test_sqlite_watch_delivers_changes_in_the_background(tmp_path):
+    """Test that watch() polls the change feed"""
+    path = str(tmp_path / "activities.db")
+    writer = SQLiteActivityStore(path)
+    writer.load(copy.deepcopy(activities))
+    reader = SQLiteActivityStore(path)
+    delivered = threading.Event()
+    reader.subscribe(lambda mutation: delivered.set())
+    reader.watch(interval=0.01)
+
+    writer.signup("Chess Club", "watched@mergington.edu")
+    assert delivered.wait(5)
+    writer.close()
+    reader.close()
+
+
+def test_create_store_rejects_unknown_url():
+    """Test that an unknown store URL is reported"""
+    with pytest.raises(ValueError):
+        create_store("redis://localhost", {})
+
+
+def test_version_changes_on_mutation(store):
+    """Test that every successful mutation changes the store version"""
+    initial = store.version()
+    store.signup("Chess Club", "version@mergington.edu")
+    after_signup = store.version()
+    assert after_signup != initial
+    with pytest.raises(AlreadySignedUpError):
+        store.signup("Chess Club", "version@mergington.edu")
+    assert store.version() == after_signup
+    store.remove("Chess Club", "version@mergington.edu")
+    assert store.version() != after_signup
+
+
+def test_get_many(store):
+    """Test fetching a subset of activities with and without participants"""
+    result = store.get_many(["Art Club", "Nonexistent", "Chess Club"])
+    assert list(result) == ["Art Club", "Chess Club"]
+    assert result["Chess Club"] == activities["Chess Club"]
+
+    counts = store.get_many(["Chess Club"], include_participants=False)
+    assert counts["Chess Club"]["participant_count"] == 2
+    assert "participants" not in counts["Chess Club"]
+
+
+def test_signup_many(store):
+    """Test batch signups, including the atomic mode"""
+    results = store.signup_many([("Chess Club", "a@mergington.edu"),
+                                 ("Chess Club", "michael@mergington.edu")], atomic=True)
+    assert [type(result.error).__name__ for result in results] == [
+        "BatchRejectedError", "AlreadySignedUpError"]
+    assert "a@mergington.edu" not in store.get_all()["Chess Club"]["participants"]
+
+    results = store.signup_many([("Chess Club", "a@mergington.edu"),
+                                 ("Nonexistent", "a@mergington.edu")])
+    assert results[0].total == 3
+    assert isinstance(results[1].error, ActivityNotFoundError)
+
+
+def test_remove_many(store):
+    """Test batch removals"""
+    results = store.remove_many([("Chess Club", "michael@mergington.edu"),
+                                 ("Chess Club", "michael@mergington.edu")])
+    assert results[0].total == 1
+    assert isinstance(results[1].error, ParticipantNotFoundError)
+
+
+def test_async_store_never_overbooks(store):
+    """Test concurrent async signups racing for the last seats"""
+    async_store = AsyncActivityStore(store)
+
+    async def signup(i):
+        try:
+            return await async_store.signup("Chess Club", f"racer{i}@mergington.edu")
+        except ActivityFullError:
+            return None
+
+    async def scenario():
+        return await asyncio.gather(*(signup(i) for i in range(200)))
+
+    results = asyncio.run(scenario())
+    assert sum(result is not None for result in results) == 10
+    assert len(store.get_all()["Chess Club"]["participants"]) == 12
+
+
+def test_async_store_runs_in_memory_calls_on_the_loop():
+    """Test that in-memory operations do not hop to a worker thread"""
+    store = InMemoryActivityStore(copy.deepcopy(activities))
+    threads = []
+    store.subscribe(lambda mutation: threads.append(threading.get_ident()))
+
+    asyncio.run(AsyncActivityStore(store).signup("Chess Club", "loop@mergington.edu"))
+    assert threads == [threading.get_ident()]
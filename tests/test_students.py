@@ -0,0 +1,52 @@
+"""
+Tests for the student endpoints backed by the reverse index
+"""
+from src.app import student_index
+
+
+def test_student_activities_follow_signups_and_removals(client):
+    """Test that the reverse index is kept up to date incrementally"""
+    email = "michael@mergington.edu"
+    assert client.get(f"/students/{email}/activities").json() == {
+        "email": email, "activities": ["Chess Club"], "waitlists": []}
+
+    client.post(f"/activities/Art Club/signup?email={email}")
+    client.post(f"/activities/Gym Class/signup?email={email}")
+    client.delete(f"/activities/Chess Club/remove?email={email}")
+    version = student_index.version
+    response = client.get(f"/students/{email}/activities")
+    assert response.json()["activities"] == ["Art Club", "Gym Class"]
+    # Applied from mutations, not rebuilt
+    assert student_index.version == version
+
+
+def test_unknown_student_has_no_activities(client):
+    """Test that an unknown email is not an error"""
+    response = client.get("/students/nobody@mergington.edu/activities")
+    assert response.status_code == 200
+    assert response.json()["activities"] == []
+
+
+def test_remove_student_from_all_activities(client):
+    """Test the bulk removal, including waitlists and promotions"""
+    email = "leaving@mergington.edu"
+    for i in range(9):
+        client.post(f"/activities/Chess Club/signup?email=student{i}@mergington.edu")
+    client.post(f"/activities/Chess Club/signup?email={email}")
+    client.post("/activities/Chess Club/waitlist?email=next@mergington.edu")
+    client.post(f"/activities/Art Club/signup?email={email}")
+    for i in range(12):
+        client.post(f"/activities/Science Olympiad/signup?email=olympian{i}@mergington.edu")
+    client.post(f"/activities/Science Olympiad/waitlist?email={email}")
+
+    response = client.delete(f"/students/{email}/activities")
+    assert response.status_code == 200
+    assert response.json() == {"email": email, "removed_from": ["Art Club", "Chess Club"],
+                               "left_waitlists": ["Science Olympiad"]}
+    assert client.get(f"/students/{email}/activities").json()["activities"] == []
+    assert client.get(f"/students/{email}/activities").json()["waitlists"] == []
+    # The freed Chess Club seat went to the student waiting for it
+    chess = client.get("/activities").json()["Chess Club"]["participants"]
+    assert "next@mergington.edu" in chess
+    assert client.get("/students/next@mergington.edu/activities").json()["activities"] == [
+        "Chess Club"]
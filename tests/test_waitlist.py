@@ -0,0 +1,64 @@
+"""
+Tests for the waitlist endpoints
+"""
+
+FULL = "/activities/Chess Club"
+
+
+def fill_chess_club(client):
+    for i in range(10):
+        assert client.post(f"{FULL}/signup?email=student{i}@mergington.edu").status_code == 200
+
+
+def test_join_waitlist_of_a_full_activity(client):
+    """Test that a full activity queues students and reports their position"""
+    fill_chess_club(client)
+    response = client.post(f"{FULL}/waitlist?email=first@mergington.edu")
+    assert response.status_code == 200
+    assert response.json()["status"] == "waitlisted"
+    assert response.json()["position"] == 1
+    client.post(f"{FULL}/waitlist?email=second@mergington.edu")
+
+    response = client.get(f"{FULL}/waitlist?email=second@mergington.edu")
+    assert response.json() == {"activity": "Chess Club", "waiting": 2,
+                               "email": "second@mergington.edu", "position": 2}
+    assert client.get(f"{FULL}/waitlist").json() == {"activity": "Chess Club", "waiting": 2}
+
+    duplicate = client.post(f"{FULL}/waitlist?email=first@mergington.edu")
+    assert duplicate.status_code == 400
+    assert duplicate.json()["detail"] == "Student already on the waitlist for this activity"
+
+
+def test_join_waitlist_with_a_free_seat_signs_up(client):
+    """Test that joining the waitlist of an activity with room signs the student up"""
+    response = client.post(f"{FULL}/waitlist?email=eager@mergington.edu")
+    assert response.json()["status"] == "signed_up"
+    participants = client.get("/activities").json()["Chess Club"]["participants"]
+    assert "eager@mergington.edu" in participants
+
+
+def test_removal_promotes_the_first_student_waiting(client):
+    """Test that a freed seat is given to the head of the waitlist"""
+    fill_chess_club(client)
+    client.post(f"{FULL}/waitlist?email=first@mergington.edu")
+    client.post(f"{FULL}/waitlist?email=second@mergington.edu")
+
+    response = client.delete(f"{FULL}/remove?email=michael@mergington.edu")
+    assert response.status_code == 200
+    participants = client.get("/activities").json()["Chess Club"]["participants"]
+    assert participants[-1] == "first@mergington.edu"
+    assert len(participants) == 12
+    assert response.json()["total_participants"] == 12
+    assert client.get(f"{FULL}/waitlist?email=second@mergington.edu").json()["position"] == 1
+
+
+def test_leave_waitlist(client):
+    """Test that a student can leave the waitlist, once"""
+    fill_chess_club(client)
+    client.post(f"{FULL}/waitlist?email=first@mergington.edu")
+    response = client.delete(f"{FULL}/waitlist?email=first@mergington.edu")
+    assert response.status_code == 200
+    assert response.json()["waiting"] == 0
+    assert client.delete(f"{FULL}/waitlist?email=first@mergington.edu").status_code == 404
+    assert client.get(f"{FULL}/waitlist?email=first@mergington.edu").status_code == 404
+    assert client.get("/activities/Nonexistent/waitlist").status_code == 404